@@ -0,0 +1,99 @@
+"""
+Controllo del tempo di import dei moduli usati dai worker e dagli script.
+
+Per ogni modulo: un processo nuovo con `python -X importtime`, il migliore di
+alcuni tentativi (cumulativo, dipendenze della libreria standard comprese).
+Nei processi di misura mkdir e open in scrittura sono disattivati: un import
+che tocca il disco fallisce il controllo.
+
+    python scripts/check_import_time.py
+    python scripts/check_import_time.py --budget-ms 30 --repeat 5
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT_DIR / "src"
+
+MODULES = (
+    "guild_downtime.game_engine",
+    "guild_downtime.dice",
+    "guild_downtime.state",
+    "guild_downtime.control",
+    "guild_downtime.montecarlo",
+    "guild_downtime.analytics",
+    "guild_downtime.scheduler",
+    "guild_downtime.launcher",
+)
+
+# Misurato per game_engine e launcher (migliore di 3): 13-24 ms su una macchina,
+# 27-43 ms su una più lenta, quasi tutto json, re e pathlib della libreria
+# standard. Il budget è circa il doppio del peggiore: sopra, l'import ha preso
+# davvero peso, non è rumore
+DEFAULT_BUDGET_MS = 80.0
+
+_GUARD = """
+import builtins, os, sys
+sys.path.insert(0, {src!r})
+
+def _deny(*args, **kwargs):
+    raise RuntimeError(f"accesso in scrittura al disco durante l'import: {{args}}")
+
+_open = builtins.open
+
+def _open_read_only(file, mode="r", *args, **kwargs):
+    if any(c in mode for c in "wax+"):
+        _deny(file, mode)
+    return _open(file, mode, *args, **kwargs)
+
+os.mkdir = os.makedirs = _deny
+builtins.open = _open_read_only
+import {module}
+"""
+
+
+def measure(module):
+    """Tempo cumulativo di import di `module` in microsecondi (errore se l'import fallisce)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _GUARD.format(src=str(SRC_DIR), module=module)],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1])
+    raise RuntimeError(f"{module}: riga di importtime non trovata")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        try:
+            # Un import a vuoto prima: i .pyc mancanti non contano nella misura
+            measure(module)
+            best = min(measure(module) for _ in range(args.repeat)) / 1000
+        except RuntimeError as exc:
+            print(f"ERRORE  {module}: {exc}")
+            failed = True
+            continue
+        ok = best <= args.budget_ms
+        failed |= not ok
+        print(f"{'OK    ' if ok else 'LENTO '}  {module:<32} {best:7.1f} ms")
+    print(f"\nBudget: {args.budget_ms:.0f} ms per modulo")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
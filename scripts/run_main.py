@@ -0,0 +1,23 @@
+"""
+Punto di ingresso: apre direttamente una gilda per nome.
+
+    python scripts/run_main.py --guild "Cacciatori di Taglie"
+    python scripts/run_main.py --list
+    python scripts/run_main.py                 (menu di selezione)
+"""
+
+import sys
+from pathlib import Path
+
+# Root del progetto: .../Pathfinder1e
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+# Aggiungi src/ al sys.path
+SRC_DIR = ROOT_DIR / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from guild_downtime.launcher import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Riassunti in streaming degli esiti di molte prove, a memoria costante.
+
+Ogni metrica è un istogramma a classi di larghezza fissa più i momenti
+(media, varianza, minimo, massimo). Quando le classi occupate superano
+`max_bins` la larghezza raddoppia e le classi vicine si fondono, quindi la
+memoria non dipende dal numero di prove. Due riassunti dello stesso tipo si
+uniscono sommando i conteggi: ogni worker ne tiene uno e il processo
+principale li fonde alla fine.
+
+I conteggi possono essere pesi (es. i rapporti di verosimiglianza
+dell'importance sampling di AdaptiveMonteCarlo).
+"""
+
+import math
+
+from guild_downtime.game_engine import EVENT_TYPES, RESOURCE_CYCLE
+
+# Metriche continue (le altre sono conteggi interi, con quantili esatti)
+CONTINUOUS = ("MO", "spent_gp")
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class StreamingHistogram:
+    __slots__ = (
+        "width",
+        "integer",
+        "max_bins",
+        "bins",
+        "weight",
+        "mean",
+        "m2",
+        "min",
+        "max",
+    )
+
+    def __init__(self, width=1.0, integer=False, max_bins=2048):
+        """
+        width: larghezza iniziale delle classi (raddoppia se servono più di max_bins classi).
+        integer: valori interi; con larghezza 1 i quantili sono esatti.
+        """
+        self.width = width
+        self.integer = integer
+        self.max_bins = max_bins
+        self.bins = {}
+        self.weight = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x, weight=1.0):
+        if weight <= 0:
+            return
+        b = math.floor(x / self.width)
+        self.bins[b] = self.bins.get(b, 0.0) + weight
+        # Media e varianza pesate in streaming (West)
+        self.weight += weight
+        delta = x - self.mean
+        self.mean += delta * weight / self.weight
+        self.m2 += weight * delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        if len(self.bins) > self.max_bins:
+            self._coarsen()
+
+    def _coarsen(self):
+        bins = {}
+        for b, w in self.bins.items():
+            bins[b // 2] = bins.get(b // 2, 0.0) + w
+        self.bins = bins
+        self.width *= 2
+
+    def merge(self, other):
+        if other.weight == 0:
+            return
+        ratio = max(self.width, other.width) / min(self.width, other.width)
+        if abs(ratio - 2 ** round(math.log2(ratio))) > 1e-9:
+            raise ValueError("Istogrammi con larghezze non compatibili.")
+        while self.width < other.width * (1 - 1e-9):
+            self._coarsen()
+        bins = other.bins
+        if other.width < self.width * (1 - 1e-9):
+            steps = round(math.log2(self.width / other.width))
+            bins = {}
+            for b, w in other.bins.items():
+                bins[b >> steps] = bins.get(b >> steps, 0.0) + w
+        for b, w in bins.items():
+            self.bins[b] = self.bins.get(b, 0.0) + w
+
+        total = self.weight + other.weight
+        delta = other.mean - self.mean
+        self.mean += delta * other.weight / total
+        self.m2 += other.m2 + delta * delta * self.weight * other.weight / total
+        self.weight = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        while len(self.bins) > self.max_bins:
+            self._coarsen()
+
+    @property
+    def variance(self):
+        return self.m2 / self.weight if self.weight else 0.0
+
+    def quantile(self, q):
+        """Quantile q, interpolato dentro la classe (esatto per interi con larghezza 1)."""
+        if not self.weight:
+            return None
+        target = q * self.weight
+        acc = 0.0
+        for b in sorted(self.bins):
+            w = self.bins[b]
+            if acc + w >= target - 1e-12:
+                if self.integer and self.width == 1:
+                    return b
+                frac = (target - acc) / w if w else 0.0
+                value = (b + min(1.0, max(0.0, frac))) * self.width
+                return min(self.max, max(self.min, value))
+            acc += w
+        return self.max
+
+    def summary(self, quantiles=DEFAULT_QUANTILES):
+        return {
+            "mean": self.mean,
+            "sd": math.sqrt(self.variance),
+            "min": self.min if self.weight else None,
+            "max": self.max if self.weight else None,
+            # Chiavi testuali ("p05", "p50"...): il riassunto passa da JSON nella cache
+            "quantiles": {
+                f"p{round(q * 100):02d}": self.quantile(q) for q in quantiles
+            },
+        }
+
+
+class EnsembleAggregator:
+    """
+    Riassunto di un insieme di prove di GameEngine.simulate(): risorse finali,
+    MO spese, giorni senza controllo ed eventi per tipo (conteggio per prova).
+    """
+
+    METRICS = tuple(RESOURCE_CYCLE) + ("spent_gp", "events", "days_locked")
+
+    def __init__(self, max_bins=2048):
+        self.max_bins = max_bins
+        self.trials = 0.0
+        self.metrics = {m: self._histogram(m) for m in self.METRICS}
+        self.event_types = {t: self._histogram(t) for t in EVENT_TYPES}
+
+    def _histogram(self, name):
+        return StreamingHistogram(integer=name not in CONTINUOUS, max_bins=self.max_bins)
+
+    def add(self, values, event_types, weight=1.0):
+        """values: {metrica: valore}; event_types: {nome evento: conteggio nella prova}."""
+        for m, hist in self.metrics.items():
+            hist.add(values[m], weight)
+        for t in event_types:
+            if t not in self.event_types:
+                # Tipo mai visto (altra tabella eventi): zero per le prove precedenti
+                hist = self.event_types[t] = self._histogram(t)
+                if self.trials:
+                    hist.add(0, self.trials)
+        for t, hist in self.event_types.items():
+            hist.add(event_types.get(t, 0), weight)
+        self.trials += weight
+
+    def add_trial(self, engine, summary, weight=1.0):
+        values = dict(engine.bank.resources)
+        values["spent_gp"] = summary["spent_gp"]
+        values["events"] = summary["events"]
+        values["days_locked"] = summary["days_locked"]
+        self.add(values, summary["event_types"], weight)
+
+    def merge(self, other):
+        for m, hist in other.metrics.items():
+            self.metrics[m].merge(hist)
+        for t, hist in other.event_types.items():
+            mine = self.event_types.get(t)
+            if mine is None:
+                mine = self.event_types[t] = self._histogram(t)
+                if self.trials:
+                    mine.add(0, self.trials)
+            mine.merge(hist)
+        for t, mine in self.event_types.items():
+            if t not in other.event_types and other.trials:
+                mine.add(0, other.trials)
+        self.trials += other.trials
+
+    def summary(self, quantiles=DEFAULT_QUANTILES):
+        return {
+            "trials": self.trials,
+            "metrics": {m: h.summary(quantiles) for m, h in self.metrics.items()},
+            "event_types": {
+                t: h.summary(quantiles) for t, h in self.event_types.items()
+            },
+        }
@@ -0,0 +1,920 @@
+"""
+Distribuzioni approssimate delle risorse dopo N giorni, senza campionamento.
+
+Tutto ciò che muove una giornata è una piccola distribuzione discreta: il tiro
+di rendita (d20 + bonus o prendi 10), le prove di abilità degli eventi (miglior
+abilità, 20 naturale sempre riuscito), i dadi degli eventi (d4, 2d4, d10x10 MO...).
+Qui diventano tabelle di probabilità, combinate giorno per giorno per
+convoluzione con la catena di Markov della probabilità d'evento (20%..95%) e
+dello stato di controllo.
+
+Per una risorsa diversa da MO si tiene la distribuzione congiunta (MO, risorsa),
+perché i costi di conseguimento in MO limitano quanto si guadagna davvero.
+Le MO sono tracciate in decimi, come il guadagno total/10.
+
+Il modello segue _simulate_day (tabella "mercenari", al massimo MAX_DAYS
+giorni) con queste approssimazioni dichiarate:
+- effetti temporanei (Risultati Impressionanti, Rivalità, Scandalo, Duello):
+  per ogni stato della catena si segue esattamente la probabilità che ciascun
+  effetto (bonus, giorni rimasti) sia attivo, ma il bonus del giorno tratta gli
+  effetti come indipendenti e non legati alle risorse guadagnate con l'evento
+  che li ha creati. Il bonus medio è esatto, la dispersione è approssimata;
+- reticolo: le MO stanno in celle da `width` decimi e la risorsa tracciata in
+  righe da `rows` unità. Si parte dalla risoluzione piena e si raddoppia quando
+  una distribuzione supera MAX_CELLS celle o MAX_ROWS righe; le code sotto
+  TAIL_MASS sono raccolte nelle celle estreme. Ogni passaggio conserva la media;
+- l'Ammutinamento spende 5 Influenza per il +5 se disponibili: si segue quando
+  si traccia l'Influenza, altrimenti (e per la catena degli effetti) si usa
+  `assume_influence`.
+"""
+
+import math
+from itertools import accumulate
+
+from guild_downtime.control import attempt_dc, regain_probability
+
+CHANCES = tuple(range(20, 100, 5))
+# Stato della catena degli effetti con il controllo perso
+LOST = None
+
+MAX_DAYS = 365
+# Massa delle code raccolta nelle celle estreme, rispetto al totale
+TAIL_MASS = 1e-10
+# Oltre queste dimensioni il reticolo raddoppia il passo: celle delle MO in
+# una riga, righe della risorsa tracciata
+MAX_CELLS = 1024
+MAX_ROWS = 128
+
+# ==========================================
+# TABELLE DI PROBABILITÀ
+# ==========================================
+
+
+def die_pmf(sides, scale=1):
+    return {scale * v: 1 / sides for v in range(1, sides + 1)}
+
+
+def sum_pmf(a, b):
+    """Distribuzione della somma di due variabili indipendenti {valore: prob}."""
+    out = {}
+    for x, p in a.items():
+        for y, q in b.items():
+            out[x + y] = out.get(x + y, 0) + p * q
+    return out
+
+
+def skill_check_probability(stats, skills, dc, extra_bonus=0):
+    """P(successo) di DiceRoller.skill_check: miglior abilità, 20 naturale riuscito."""
+    if isinstance(skills, str):
+        skills = [skills]
+    mod = max(stats.get(s, 0) for s in skills) + extra_bonus
+    ok = sum(1 for roll in range(1, 21) if roll == 20 or roll + mod >= dc)
+    return ok / 20
+
+
+def income_pmf(bonus, resource, sim_mode):
+    """Guadagno del giorno (MO in decimi) come in _simulate_day."""
+    if bonus == 0 or sim_mode != "2":
+        rolls = {10: 1.0}
+    else:
+        rolls = {r: 1 / 20 for r in range(1, 21)}
+    pmf = {}
+    for roll, p in rolls.items():
+        total = roll + bonus
+        earned = total if resource == "MO" else total // 10
+        pmf[earned] = pmf.get(earned, 0) + p
+    return pmf
+
+
+def event_outcomes(resource, stats):
+    """
+    Esiti degli eventi diversi dall'Ammutinamento per (MO, resource), come lista
+    di (probabilità, {delta MO in decimi: p}, {delta risorsa: p}).
+    Le probabilità sono condizionate all'evento e sommano a 0.95.
+    """
+    none = {0: 1.0}
+
+    def neg(pmf):
+        return {-v: p for v, p in pmf.items()}
+
+    def on(mapping):
+        return mapping.get(resource, none)
+
+    outcomes = []
+    # Risultati Impressionanti: +d4 Inf, +d2 Man
+    outcomes.append(
+        (0.15, none, on({"Influenza": die_pmf(4), "Manodopera": die_pmf(2)}))
+    )
+    # Guadagno Inaspettato: +d10x10 MO, +1 Magia, +d6 Merci
+    outcomes.append(
+        (0.10, die_pmf(10, 100), on({"Magia": {1: 1.0}, "Merci": die_pmf(6)}))
+    )
+    # Rissa: se fallita -d4 Inf, -d2 Man
+    p = skill_check_probability(stats, ["Intimidire", "Professione (soldato)"], 20)
+    outcomes.append((0.25 * p, none, none))
+    outcomes.append(
+        (
+            0.25 * (1 - p),
+            none,
+            on({"Influenza": neg(die_pmf(4)), "Manodopera": neg(die_pmf(2))}),
+        )
+    )
+    # Rivalità: d100 > 50 -> -d4 Inf
+    outcomes.append((0.10, none, none))
+    outcomes.append((0.10, none, on({"Influenza": neg(die_pmf(4))})))
+    # Scandalo: -d2 Inf
+    outcomes.append((0.10, none, on({"Influenza": neg(die_pmf(2))})))
+    # Duello: se perso -d2 Man
+    p = skill_check_probability(stats, "Professione (soldato)", 25)
+    outcomes.append((0.05 * p, none, none))
+    outcomes.append((0.05 * (1 - p), none, on({"Manodopera": neg(die_pmf(2))})))
+    # Scisma: evitato -1 Man; avvenuto -d2 Man, -d2 Inf
+    p = skill_check_probability(
+        stats, ["Diplomazia", "Intimidire", "Professione (soldato)"], 20
+    )
+    outcomes.append((0.10 * p, none, on({"Manodopera": {-1: 1.0}})))
+    outcomes.append(
+        (
+            0.10 * (1 - p),
+            none,
+            on({"Manodopera": neg(die_pmf(2)), "Influenza": neg(die_pmf(2))}),
+        )
+    )
+    # Esiti con gli stessi effetti sulla coppia (MO, risorsa) si sommano:
+    # per la maggior parte delle risorse restano due o tre casi
+    merged = []
+    for prob, mo_kernel, r_kernel in outcomes:
+        if prob <= 0:
+            continue
+        for i, (p0, mo0, r0) in enumerate(merged):
+            if mo0 == mo_kernel and r0 == r_kernel:
+                merged[i] = (p0 + prob, mo0, r0)
+                break
+        else:
+            merged.append((prob, mo_kernel, r_kernel))
+    return merged
+
+
+def effect_outcomes(stats):
+    """
+    Eventi che creano un effetto temporaneo, come lista di
+    (probabilità condizionata all'evento, bonus, {durata in giorni: p}).
+    """
+    duel = skill_check_probability(stats, "Professione (soldato)", 25)
+    return [
+        (0.15, 10, die_pmf(6)),  # Risultati Impressionanti
+        (0.20, -5, die_pmf(10)),  # Rivalità
+        (0.10, -5, sum_pmf(die_pmf(4), die_pmf(4))),  # Scandalo
+        (0.05 * duel, 2, {7: 1.0}),  # Vittoria Duello
+    ]
+
+
+def mutiny_success_probability(stats, influence_spent):
+    return skill_check_probability(
+        stats,
+        ["Combattimento", "Intimidire", "Professione (soldato)"],
+        25,
+        extra_bonus=5 if influence_spent else 0,
+    )
+
+
+# ==========================================
+# DISTRIBUZIONI
+# ==========================================
+
+
+class Dist:
+    """Distribuzione (non normalizzata) su interi >= 0, densa a partire da `lo`."""
+
+    __slots__ = ("lo", "p")
+
+    def __init__(self, lo=0, p=None):
+        self.lo = lo
+        self.p = p if p is not None else []
+
+    @classmethod
+    def point(cls, value):
+        return cls(value, [1.0])
+
+    def total(self):
+        return sum(self.p)
+
+    def add_into(self, other, factor=1.0):
+        """self += factor * other."""
+        if not other.p or factor == 0:
+            return
+        if not self.p:
+            self.lo = other.lo
+            self.p = [x * factor for x in other.p]
+            return
+        lo = min(self.lo, other.lo)
+        hi = max(self.lo + len(self.p), other.lo + len(other.p))
+        if lo < self.lo or hi > self.lo + len(self.p):
+            p = [0.0] * (hi - lo)
+            p[self.lo - lo : self.lo - lo + len(self.p)] = self.p
+            self.lo, self.p = lo, p
+        a = other.lo - self.lo
+        b = a + len(other.p)
+        self.p[a:b] = [x + y * factor for x, y in zip(self.p[a:b], other.p)]
+
+    def shifted(self, delta):
+        """
+        Somma di una costante, anche frazionaria: la massa si divide tra le due
+        celle vicine conservando la media. I valori < 0 vanno a 0.
+        """
+        whole, frac = _split(delta)
+        if not frac:
+            return Dist(self.lo + whole, self.p).clamped()
+        out = Dist(self.lo + whole, [x * (1 - frac) for x in self.p])
+        out.add_into(Dist(self.lo + whole + 1, self.p), frac)
+        return out.clamped()
+
+    def convolve(self, kernel):
+        """Somma con una variabile indipendente {delta: prob}; i valori < 0 vanno a 0."""
+        if not self.p:
+            return self
+        uniform = _uniform_progression(kernel)
+        if uniform is not None:
+            return self._convolve_uniform(*uniform).clamped()
+        out = Dist()
+        for delta, prob in kernel.items():
+            if prob:
+                out.add_into(Dist(self.lo + delta, self.p), prob)
+        return out.clamped()
+
+    def _convolve_uniform(self, first, step, count, prob):
+        """
+        Convoluzione con un dado (valori first, first+step, ... equiprobabili):
+        somme a finestra su somme prefisse per classe di resto, O(n) invece di
+        O(n * facce).
+        """
+        width = (count - 1) * step
+        src = self.p + [0.0] * width
+        acc = [0.0] * len(src)
+        for r in range(step):
+            acc[r::step] = list(accumulate(src[r::step]))
+        span = count * step
+        out = acc[:span] + [a - b for a, b in zip(acc[span:], acc)]
+        return Dist(self.lo + first, [x * prob for x in out])
+
+    def capped(self, cap):
+        """Raccoglie in `cap` la massa dei valori > cap."""
+        if cap < self.lo or self.lo + len(self.p) - 1 <= cap:
+            if cap < self.lo and self.p:
+                return Dist(cap, [sum(self.p)])
+            return self
+        cut = cap - self.lo
+        return Dist(self.lo, self.p[:cut] + [sum(self.p[cut:])])
+
+    def clamped(self):
+        if self.lo >= 0 or not self.p:
+            return self
+        cut = -self.lo
+        head = sum(self.p[: cut + 1])
+        return Dist(0, [head] + self.p[cut + 1 :])
+
+    def trimmed(self, limit):
+        """Raccoglie nelle celle estreme le code con massa <= limit."""
+        p = self.p
+        if len(p) < 3:
+            return self
+        i, head = 0, 0.0
+        while i < len(p) - 1 and head + p[i] <= limit:
+            head += p[i]
+            i += 1
+        j, tail = len(p) - 1, 0.0
+        while j > i and tail + p[j] <= limit:
+            tail += p[j]
+            j -= 1
+        if i == 0 and j == len(p) - 1:
+            return self
+        kept = p[i : j + 1]
+        kept[0] += head
+        kept[-1] += tail
+        return Dist(self.lo + i, kept)
+
+    def rebinned(self):
+        """
+        Celle larghe il doppio: la cella i va in i/2, le dispari a metà tra le
+        due celle vicine, così la media non cambia.
+        """
+        if not self.p:
+            return self
+        lo = self.lo // 2
+        p = [0.0] * ((self.lo + len(self.p)) // 2 - lo + 1)
+        for i, x in enumerate(self.p, self.lo):
+            half, odd = divmod(i, 2)
+            if odd:
+                p[half - lo] += x / 2
+                p[half + 1 - lo] += x / 2
+            else:
+                p[half - lo] += x
+        return Dist(lo, p)
+
+    def pay(self, units, unit_cost, offset=0.0):
+        """
+        Spesa di e unità da `unit_cost` celle, con e > 0 distribuito come `units`
+        {e: prob}, limitata dai fondi (ResourceBank.modify): restituisce
+        {unità pagate: distribuzione dei fondi rimasti, già pesata}.
+        offset: fondi oltre il reticolo (in celle), cioè la cella i vale i + offset.
+        """
+        n = len(self.p)
+        top = max(units)
+        # starts[k]: prima cella con i fondi per k unità
+        starts = [0]
+        for k in range(1, top + 1):
+            first = _threshold(k * unit_cost - offset) - self.lo
+            starts.append(min(n, max(0, first)))
+        starts.append(n)
+        out = {}
+        # Si pagano k unità se i fondi bastano per k (non k+1) ed e >= k,
+        # oppure se bastano per di più ed e = k
+        at_least = sum(units.values())
+        for k in range(top + 1):
+            a, b = starts[k], starts[k + 1]
+            if a >= n:
+                break
+            exact = units.get(k, 0)
+            p = [x * at_least for x in self.p[a:b]]
+            if exact:
+                p += [x * exact for x in self.p[b:]]
+            if p:
+                out[k] = Dist(self.lo + a, p).shifted(-k * unit_cost)
+            at_least -= exact
+        return out
+
+    def items(self):
+        return ((self.lo + i, x) for i, x in enumerate(self.p) if x)
+
+
+def _split(x):
+    """(parte intera, parte frazionaria) di x, con tolleranza sugli arrotondamenti."""
+    whole = math.floor(x + 1e-9)
+    frac = x - whole
+    return whole, frac if frac > 1e-9 else 0.0
+
+
+def _threshold(x):
+    """Prima cella intera >= x."""
+    return math.ceil(x - 1e-9)
+
+
+def _on_grid(kernel, width):
+    """Kernel {delta: prob} in celle larghe `width`: i delta frazionari si dividono tra due celle."""
+    if width == 1:
+        return kernel
+    out = {}
+    for delta, prob in kernel.items():
+        whole, frac = _split(delta / width)
+        out[whole] = out.get(whole, 0) + prob * (1 - frac)
+        if frac:
+            out[whole + 1] = out.get(whole + 1, 0) + prob * frac
+    return out
+
+
+def _uniform_progression(kernel):
+    """(primo, passo, numero, prob) se il kernel è un dado su una progressione aritmetica."""
+    if len(kernel) < 4:
+        return None
+    values = sorted(kernel)
+    step = values[1] - values[0]
+    prob = kernel[values[0]]
+    for i, v in enumerate(values):
+        if v != values[0] + i * step or abs(kernel[v] - prob) > 1e-15:
+            return None
+    return values[0], step, len(values), prob
+
+
+class Joint:
+    """Distribuzione congiunta: riga della risorsa tracciata -> Dist delle MO."""
+
+    __slots__ = ("rows",)
+
+    def __init__(self, rows=None):
+        self.rows = rows if rows is not None else {}
+
+    def add_row(self, r, dist, factor=1.0):
+        row = self.rows.get(r)
+        if row is None:
+            row = self.rows[r] = Dist()
+        row.add_into(dist, factor)
+
+    def add_value(self, value, width, dist, factor=1.0):
+        """add_row dal valore della risorsa (>= 0), con righe larghe `width`."""
+        whole, frac = _split(max(0, value) / width)
+        if not frac:
+            self.add_row(whole, dist, factor)
+            return
+        self.add_row(whole, dist, factor * (1 - frac))
+        self.add_row(whole + 1, dist, factor * frac)
+
+    def add_into(self, other, factor=1.0):
+        for r, dist in other.rows.items():
+            self.add_row(r, dist, factor)
+
+    def total(self):
+        return sum(d.total() for d in self.rows.values())
+
+    def capped(self, cap):
+        return Joint({r: d.capped(cap) for r, d in self.rows.items()})
+
+    def cells(self):
+        """Celle della riga più lunga."""
+        return max((len(d.p) for d in self.rows.values()), default=0)
+
+    def span(self):
+        return max(self.rows) - min(self.rows) + 1 if self.rows else 0
+
+    def trimmed(self, eps=TAIL_MASS):
+        """
+        Raccoglie nelle righe e nelle celle estreme le code con massa <= eps *
+        totale: il limite è sulla congiunta, quindi le righe poco probabili
+        restano corte.
+        """
+        if not self.rows:
+            return self
+        order = sorted(self.rows)
+        masses = [self.rows[r].total() for r in order]
+        limit = eps * sum(masses)
+        i, head = 0, 0.0
+        while i < len(order) - 1 and head + masses[i] <= limit:
+            head += masses[i]
+            i += 1
+        j, tail = len(order) - 1, 0.0
+        while j > i and tail + masses[j] <= limit:
+            tail += masses[j]
+            j -= 1
+        out = Joint({r: self.rows[r].trimmed(limit) for r in order[i : j + 1]})
+        for r in order[:i]:
+            out.add_row(order[i], self.rows[r])
+        for r in order[j + 1 :]:
+            out.add_row(order[j], self.rows[r])
+        return out
+
+    def rebinned_cells(self):
+        return Joint({r: d.rebinned() for r, d in self.rows.items()})
+
+    def rebinned_rows(self):
+        """Righe larghe il doppio, come Dist.rebinned."""
+        out = Joint()
+        for r, dist in self.rows.items():
+            half, odd = divmod(r, 2)
+            if odd:
+                out.add_row(half, dist, 0.5)
+                out.add_row(half + 1, dist, 0.5)
+            else:
+                out.add_row(half, dist)
+        return out
+
+    def __bool__(self):
+        return bool(self.rows)
+
+
+# ==========================================
+# EFFETTI TEMPORANEI
+# ==========================================
+
+
+class EffectChain:
+    """
+    Effetti temporanei lungo la catena della probabilità d'evento. Per ogni
+    stato (probabilità d'evento o LOST) si tiene la sua probabilità e, per ogni
+    effetto (bonus, giorni rimasti), la probabilità di essere nello stato con
+    quell'effetto attivo: sono misure lineari, aggiornate senza approssimazioni.
+    """
+
+    __slots__ = ("mass", "effects", "outcomes", "p_kept", "p_lost")
+
+    def __init__(self, state, active_effects, outcomes, p_mutiny_ok):
+        """
+        state: stato di partenza; active_effects: (nome, bonus, giorni rimasti);
+        outcomes: effect_outcomes(); p_mutiny_ok: P(Ammutinamento sedato).
+        """
+        effects = {}
+        for _, bonus, days_left in active_effects:
+            key = (bonus, days_left)
+            effects[key] = effects.get(key, 0) + 1.0
+        self.mass = {state: 1.0}
+        self.effects = {state: effects}
+        self.outcomes = outcomes
+        # Un evento lascia il controllo salvo un Ammutinamento fallito
+        self.p_lost = 0.05 * (1 - p_mutiny_ok)
+        self.p_kept = 1 - self.p_lost
+
+    def bonus_pmf(self, state):
+        """Bonus degli effetti di oggi nello stato `state`, in un giorno senza eventi."""
+        mass = self.mass.get(state, 0)
+        if not mass:
+            return {0: 1.0}
+        return _bonus_pmf(self.effects[state], mass)
+
+    def event_bonus_pmf(self):
+        """Bonus degli effetti di oggi dopo un evento che non fa perdere il controllo."""
+        mass = 0.0
+        effects = {}
+        for state, m in self.mass.items():
+            if state is LOST:
+                continue
+            pe = state / 100
+            mass += pe * m
+            for key, x in self.effects[state].items():
+                effects[key] = effects.get(key, 0) + pe * x
+        if not mass:
+            return {0: 1.0}
+        # L'effetto creato oggi conta già oggi se dura almeno 2 giorni
+        new = {0: 1.0}
+        for prob, bonus, durations in self.outcomes:
+            p = prob * sum(q for d, q in durations.items() if d >= 2) / self.p_kept
+            new[0] -= p
+            new[bonus] = new.get(bonus, 0) + p
+        return sum_pmf(_bonus_pmf(effects, mass), new)
+
+    def advance(self, p_regain):
+        """Passa al giorno dopo; p_regain: P(ripresa del controllo) di oggi."""
+        mass = {}
+        effects = {}
+
+        def flow(target, m, source, factor, tick):
+            mass[target] = mass.get(target, 0) + m * factor
+            out = effects.setdefault(target, {})
+            for (bonus, left), x in source.items():
+                if tick:
+                    # process_daily_effects: scala un giorno, sparisce a 0
+                    left -= 1
+                    if left <= 0:
+                        continue
+                key = (bonus, left)
+                out[key] = out.get(key, 0) + x * factor
+
+        for state, m in self.mass.items():
+            source = self.effects[state]
+            if state is LOST:
+                # Effetti congelati finché il controllo non torna
+                flow(20, m, source, p_regain, False)
+                flow(LOST, m, source, 1 - p_regain, False)
+                continue
+            pe = state / 100
+            flow(min(95, state + 5), m, source, 1 - pe, True)
+            flow(20, m, source, pe * self.p_kept, True)
+            flow(LOST, m, source, pe * self.p_lost, False)
+            out = effects[20]
+            for prob, bonus, durations in self.outcomes:
+                for d, q in durations.items():
+                    if d >= 2:
+                        key = (bonus, d - 1)
+                        out[key] = out.get(key, 0) + m * pe * prob * q
+        self.mass = {s: m for s, m in mass.items() if m > 0}
+        self.effects = {s: effects[s] for s in self.mass}
+
+
+def _bonus_pmf(effects, mass):
+    """
+    Bonus del giorno: ogni effetto che conta oggi (almeno 2 giorni rimasti) è
+    presente con probabilità misura / mass, indipendentemente dagli altri.
+    """
+    pmf = {0: 1.0}
+    for (bonus, left), x in effects.items():
+        if left < 2 or x <= 0:
+            continue
+        count, frac = _split(x / mass)
+        step = {bonus * count: 1 - frac}
+        if frac:
+            step[bonus * (count + 1)] = frac
+        pmf = {v: p for v, p in sum_pmf(pmf, step).items() if p > 1e-12}
+    return pmf
+
+
+# ==========================================
+# MODELLO
+# ==========================================
+
+
+class AnalyticModel:
+    def __init__(
+        self,
+        source,
+        strategy="u",
+        target_res=None,
+        sim_mode="1",
+        is_leaving=False,
+        assume_influence=None,
+    ):
+        """
+        source: GameEngine o StateSnapshot di partenza.
+        Gli altri parametri hanno lo stesso significato di GameEngine.simulate().
+        assume_influence: per l'Ammutinamento quando non si traccia l'Influenza
+        (default: Influenza iniziale >= 5).
+        """
+        if hasattr(source, "snapshot"):
+            source = source.snapshot()
+        event_table = getattr(source, "event_table", "mercenari")
+        if event_table != "mercenari":
+            raise ValueError(
+                f"Il modello analitico conosce solo la tabella eventi 'mercenari' "
+                f"(non '{event_table}')"
+            )
+        self.resources = dict(source.resources)
+        self.stats = dict(source.character_stats)
+        self.day_counter = source.day_counter
+        self.event_chance = source.event_chance
+        self.control_lost = source.guild_control_lost
+        self.days_absent = source.days_absent
+        self.active_effects = tuple(source.active_effects)
+        self.bonuses = {}
+        for _, _, bonuses, qty in source.units:
+            for r, b in bonuses.items():
+                self.bonuses[r] = self.bonuses.get(r, 0) + b * qty
+        self.strategy = strategy
+        self.target_res = target_res
+        self.sim_mode = sim_mode
+        self.is_leaving = is_leaving
+        if assume_influence is None:
+            assume_influence = self.resources["Influenza"] >= 5
+        self.assume_influence = assume_influence
+
+    def _day_resource(self, day_index):
+        from guild_downtime.game_engine import RESOURCE_CYCLE
+
+        if self.strategy == "u":
+            return RESOURCE_CYCLE[(self.day_counter + day_index) % 5]
+        return self.target_res
+
+    def _income_pmf(self, day_res, bonus_pmf):
+        """Guadagno del giorno con il bonus degli effetti distribuito come `bonus_pmf`."""
+        units = self.bonuses.get(day_res, 0)
+        pmf = {}
+        for bonus, q in bonus_pmf.items():
+            for v, p in income_pmf(units + bonus, day_res, self.sim_mode).items():
+                pmf[v] = pmf.get(v, 0) + q * p
+        return pmf
+
+    def _effect_bonuses(self):
+        """Bonus che un singolo effetto può dare (0 = nessun effetto)."""
+        bonuses = {0}
+        bonuses.update(b for _, b, _ in effect_outcomes(self.stats))
+        bonuses.update(b for _, b, _ in self.active_effects)
+        return bonuses
+
+    def _max_effect_bonus(self):
+        """Limite superiore del bonus degli effetti in un giorno."""
+        # Al più un effetto nuovo al giorno: di ogni tipo ne restano attivi
+        # al massimo (durata massima - 1)
+        top = sum(
+            b * (max(durations) - 1)
+            for _, b, durations in effect_outcomes(self.stats)
+            if b > 0
+        )
+        return top + sum(b for _, b, _ in self.active_effects if b > 0)
+
+    def _mo_step(self, days, resource="MO"):
+        """
+        Passo del reticolo delle MO (in decimi): MCD di tutte le variazioni
+        possibili. Con la strategia focalizzata su una risorsa non-MO le MO si
+        muovono solo a multipli di 50 o 100 decimi, e le distribuzioni si
+        accorciano di altrettanto. Se si traccia un'altra risorsa le MO contano
+        solo per i costi: le rendite in MO non restringono il passo (cadono tra
+        due celle, vedi Dist.shifted).
+        """
+        from guild_downtime.game_engine import EARN_COSTS
+
+        g = 100  # Guadagno Inaspettato: d10 x 10 MO
+        for day_res in {self._day_resource(t) for t in range(min(days, 5))}:
+            if day_res != "MO":
+                g = math.gcd(g, EARN_COSTS[day_res] * 10)
+            elif resource == "MO":
+                # Le somme di più effetti sono combinazioni intere di questi valori
+                units = self.bonuses.get(day_res, 0)
+                for bonus in self._effect_bonuses() | {-units}:
+                    for v in income_pmf(units + bonus, day_res, self.sim_mode):
+                        g = math.gcd(g, v)
+        return g
+
+    def _spend_caps(self, days):
+        """
+        caps[t]: spesa massima possibile (in decimi) dal giorno t alla fine.
+        Oltre questa soglia i fondi non limitano più nulla, quindi tutta la
+        massa sopra può stare in un solo valore.
+        """
+        from guild_downtime.game_engine import EARN_COSTS
+
+        top = {self._max_effect_bonus(): 1.0}
+        caps = [0] * (days + 1)
+        for t in range(days - 1, -1, -1):
+            day_res = self._day_resource(t)
+            spend = 0
+            if day_res != "MO":
+                most = max(self._income_pmf(day_res, top))
+                spend = max(0, most) * EARN_COSTS[day_res] * 10
+            caps[t] = caps[t + 1] + spend
+        return caps
+
+    def _income_step(self, joint, resource, day_res, bonus_pmf, grid, out, factor=1.0):
+        """Rendita del giorno sulla massa `joint`, sommata (per `factor`) in `out`."""
+        from guild_downtime.game_engine import EARN_COSTS
+
+        width, base, rows = grid
+        if day_res == "MO":
+            kernel = _on_grid(self._income_pmf(day_res, bonus_pmf), width)
+            for r, dist in joint.rows.items():
+                out.add_row(r, dist.convolve(kernel), factor)
+            return
+
+        # Costo di conseguimento in celle del reticolo, limitato dai fondi
+        pmf = self._income_pmf(day_res, bonus_pmf)
+        gains = {e: q for e, q in pmf.items() if e > 0}
+        unit = EARN_COSTS[day_res] * 10 / width
+        offset = base / width
+        tracked = day_res == resource
+        # Malus più forti della rendita: si perde senza costi
+        losses = {e: q for e, q in pmf.items() if e < 0} if tracked else {}
+        still = sum(q for e, q in pmf.items() if e <= 0) - sum(losses.values())
+        for r, dist in joint.rows.items():
+            value = r * rows
+            if still:
+                out.add_row(r, dist, still * factor)
+            for earned, q in losses.items():
+                out.add_value(value + earned, rows, dist, q * factor)
+            if not gains:
+                continue
+            for k, rest in dist.pay(gains, unit, offset).items():
+                if tracked:
+                    out.add_value(value + k, rows, rest, factor)
+                else:
+                    out.add_row(r, rest, factor)
+
+    def _event_step(self, joint, resource, outcomes, p_mutiny, rows):
+        """Evento sulla massa `joint`: restituisce (controllo tenuto, controllo perso)."""
+        ok = Joint()
+        lost = Joint()
+        for r, dist in joint.rows.items():
+            value = r * rows
+            for prob, mo_kernel, r_kernel in outcomes:
+                moved = dist.convolve(mo_kernel) if len(mo_kernel) > 1 else dist
+                for dr, q in r_kernel.items():
+                    ok.add_value(value + dr, rows, moved, prob * q)
+
+            # Ammutinamento (5%): +5 alla prova spendendo 5 Influenza, se disponibili
+            if resource == "Influenza":
+                spent = value >= 5
+                check = value - 5 if spent else value
+                sedated = check
+            else:
+                spent = self.assume_influence
+                check = value
+                # Sedato: -1 Manodopera
+                sedated = value - 1 if resource == "Manodopera" else value
+            p_ok = p_mutiny[spent]
+            ok.add_value(sedated, rows, dist, 0.05 * p_ok)
+            lost.add_value(check, rows, dist, 0.05 * (1 - p_ok))
+        return ok, lost
+
+    def distribution(self, resource, days):
+        """
+        Distribuzione approssimata di `resource` dopo `days` giorni (vedi il modulo).
+        Restituisce (pmf {valore: probabilità}, P(controllo perso alla fine)).
+        """
+        pmf, p_lost, _ = self._run(resource, days)
+        return pmf, p_lost
+
+    def _run(self, resource, days):
+        """(pmf, P(controllo perso), risoluzione finale della risorsa)."""
+        if days > MAX_DAYS:
+            raise ValueError(
+                f"Il modello analitico arriva a {MAX_DAYS} giorni (richiesti {days}): "
+                f"per orizzonti più lunghi usare la simulazione Monte Carlo"
+            )
+        g = self._mo_step(days, resource)
+        # Celle delle MO larghe `width` decimi, righe della risorsa larghe `rows`
+        width, rows = g, 1
+        event_kernels = event_outcomes(resource, self.stats)
+        outcomes = [(p, _on_grid(mo, width), r) for p, mo, r in event_kernels]
+        # Con la risorsa tracciata diversa da MO basta sapere se i fondi bastano
+        caps = self._spend_caps(days) if resource != "MO" else None
+        p_mutiny = {
+            True: mutiny_success_probability(self.stats, True),
+            False: mutiny_success_probability(self.stats, False),
+        }
+        bonus = self.stats.get("Autorità", 4)
+        growing = self.days_absent > 0 or self.is_leaving
+
+        # MO = base + width * i: si tracciano gli interi i; finché width = g le
+        # soglie di spesa sono multipli del passo e il resto `base` non conta
+        mo, base = divmod(int(round(self.resources["MO"] * 10)), g)
+        r0 = 0 if resource == "MO" else self.resources[resource]
+        start = Joint({r0: Dist.point(mo)})
+        states = {c: Joint() for c in CHANCES}
+        lost = Joint()
+        if self.control_lost:
+            lost = start
+        else:
+            states[self.event_chance] = start
+        chain = EffectChain(
+            LOST if self.control_lost else self.event_chance,
+            self.active_effects,
+            effect_outcomes(self.stats),
+            p_mutiny[self.assume_influence],
+        )
+
+        for t in range(days):
+            day_res = self._day_resource(t)
+            grid = (width, base, rows)
+            if caps is not None:
+                cap = _threshold(caps[t] / width)
+                states = {c: j.capped(cap) for c, j in states.items()}
+                lost = lost.capped(cap)
+            new_states = {c: Joint() for c in CHANCES}
+            new_lost = Joint()
+            event_mass = Joint()
+
+            for c, joint in states.items():
+                if not joint:
+                    continue
+                pe = c / 100
+                event_mass.add_into(joint, pe)
+                self._income_step(
+                    joint,
+                    resource,
+                    day_res,
+                    chain.bonus_pmf(c),
+                    grid,
+                    new_states[min(95, c + 5)],
+                    1 - pe,
+                )
+
+            if event_mass:
+                ok, mutiny_lost = self._event_step(
+                    event_mass, resource, outcomes, p_mutiny, rows
+                )
+                self._income_step(
+                    ok, resource, day_res, chain.event_bonus_pmf(), grid, new_states[20]
+                )
+                new_lost.add_into(mutiny_lost)
+
+            p = regain_probability(bonus, attempt_dc(self.days_absent, growing, t + 1))
+            if lost:
+                new_states[20].add_into(lost, p)
+                new_lost.add_into(lost, 1 - p)
+            chain.advance(p)
+
+            states = {c: j.trimmed() for c, j in new_states.items()}
+            lost = new_lost.trimmed()
+            joints = [*states.values(), lost]
+            # Reticolo più rado quando le distribuzioni crescono troppo
+            while max(j.cells() for j in joints) > MAX_CELLS:
+                width *= 2
+                joints = [j.rebinned_cells() for j in joints]
+                outcomes = [
+                    (prob, _on_grid(mo, width), r) for prob, mo, r in event_kernels
+                ]
+            while max(j.span() for j in joints) > MAX_ROWS:
+                rows *= 2
+                joints = [j.rebinned_rows() for j in joints]
+            states, lost = dict(zip(CHANCES, joints)), joints[-1]
+
+        final = Joint()
+        for joint in states.values():
+            final.add_into(joint)
+        p_lost = lost.total()
+        final.add_into(lost)
+
+        pmf = {}
+        for r, dist in final.rows.items():
+            if resource == "MO":
+                for i, x in dist.items():
+                    v = (base + width * i) / 10
+                    pmf[v] = pmf.get(v, 0) + x
+            else:
+                x = dist.total()
+                if x:
+                    pmf[r * rows] = pmf.get(r * rows, 0) + x
+        resolution = width / 10 if resource == "MO" else rows
+        return pmf, p_lost, resolution
+
+    def quantile(self, resource, days, q):
+        pmf, _ = self.distribution(resource, days)
+        return pmf_quantile(pmf, q)
+
+    def summary(self, resource, days, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        """
+        Media, quantili e P(controllo perso); "resolution" è il passo finale del
+        reticolo della risorsa (0.1 MO o 1 unità = risoluzione piena).
+        """
+        pmf, p_lost, resolution = self._run(resource, days)
+        return {
+            "mean": sum(v * p for v, p in pmf.items()),
+            "quantiles": {q: pmf_quantile(pmf, q) for q in quantiles},
+            "p_control_lost": p_lost,
+            "resolution": resolution,
+        }
+
+
+def pmf_quantile(pmf, q):
+    """Più piccolo valore v con P(X <= v) >= q."""
+    acc = 0.0
+    last = None
+    for v in sorted(pmf):
+        acc += pmf[v]
+        last = v
+        if acc >= q - 1e-12:
+            return v
+    return last
@@ -0,0 +1,441 @@
+"""
+Archivio su disco, solo in aggiunta, dello storico di una gilda.
+
+Il salvataggio tiene solo le ultime voci (HISTORY_WINDOW); tutto lo storico
+della campagna sta in una cartella accanto al salvataggio:
+
+    <guild>.history/
+        entries.jsonl   una voce per riga: {"day": ..., "text": ...}
+        index.bin       un record a dimensione fissa per voce:
+                        giorno (uint32), tipo (uint8), evento (uint8), offset (uint64)
+        segments.bin    numeri di record in cui il giorno torna indietro
+                        (annullamenti, rami): ogni segmento è ordinato per giorno
+        event-<n>.bin   per ogni tipo di evento, i numeri di record delle sue voci
+
+Le letture passano da mmap: una richiesta per intervallo di giorni è una
+ricerca binaria per segmento più la lettura dei soli risultati, e "tutti gli
+Ammutinamenti" legge solo la lista dei record di quell'evento.
+"""
+
+import json
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+# Tipo di voce: prefisso del testo di add_log. I codici sono scritti su disco:
+# nuovi tipi vanno aggiunti in fondo
+KINDS = (
+    "ALTRO",
+    "EVENTO",
+    "CHECK",
+    "RISULTATO",
+    "ATTIVITÀ",
+    "SIMULAZIONE",
+    "CITTÀ",
+    "EFFETTO SCADUTO",
+    "ASSENZA",
+    "MANUALE",
+)
+_KIND_CODES = {k: i for i, k in enumerate(KINDS)}
+# EVENT_TYPES di game_engine e {evento: codice} (0 = nessuno, poi da 1), letti
+# al primo uso: l'archivio non importa l'engine solo per i nomi degli eventi
+_EVENT_TYPES = None
+_EVENT_CODES = None
+
+_RECORD = struct.Struct("<IBBQ")
+_U64 = struct.Struct("<Q")
+
+
+def _event_codes():
+    global _EVENT_TYPES, _EVENT_CODES
+    if _EVENT_CODES is None:
+        from guild_downtime.game_engine import EVENT_TYPES
+
+        _EVENT_TYPES = EVENT_TYPES
+        _EVENT_CODES = {e: i for i, e in enumerate(EVENT_TYPES, 1)}
+    return _EVENT_CODES
+
+
+def classify(text):
+    """(tipo, evento) di una voce di storico, dal suo testo."""
+    if text.startswith("---"):
+        return "SIMULAZIONE", None
+    head, sep, rest = text.partition(":")
+    if not sep:
+        head = text.split(" ", 1)[0]
+    kind = head.strip() if head.strip() in _KIND_CODES else "ALTRO"
+    event = None
+    if kind == "EVENTO":
+        # "EVENTO (97 -> Ammutinamento)"
+        name = text.partition("->")[2].rstrip(") ").strip()
+        event = name if name in _event_codes() else None
+    return kind, event
+
+
+class HistoryArchive:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._files = None
+        self._records = None
+        self._last_day = None
+        # Evento a cui appartengono le righe CHECK/RISULTATO che seguono un EVENTO
+        self._current_event = 0
+
+    @classmethod
+    def for_save(cls, save_file):
+        save_file = Path(save_file)
+        return cls(save_file.with_name(save_file.stem + ".history"))
+
+    def exists(self):
+        return (self.directory / "index.bin").exists()
+
+    # ------------------------------------------
+    # SCRITTURA
+    # ------------------------------------------
+
+    def _open_for_append(self):
+        if self._files is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        index_path = self.directory / "index.bin"
+        entries_path = self.directory / "entries.jsonl"
+        size = index_path.stat().st_size if index_path.exists() else 0
+        self._records = size // _RECORD.size
+        if size % _RECORD.size:
+            # Record a metà (interruzione durante la scrittura): si tronca
+            with index_path.open("r+b") as f:
+                f.truncate(self._records * _RECORD.size)
+        if self._records:
+            with index_path.open("rb") as f:
+                f.seek((self._records - 1) * _RECORD.size)
+                self._last_day = _RECORD.unpack(f.read(_RECORD.size))[0]
+        self._files = {
+            "entries": entries_path.open("ab"),
+            "index": index_path.open("ab"),
+            "segments": (self.directory / "segments.bin").open("ab"),
+        }
+
+    def append(self, day, text):
+        self._open_for_append()
+        kind, event = classify(text)
+        if kind == "EVENTO":
+            self._current_event = _event_codes().get(event, 0)
+        elif kind not in ("CHECK", "RISULTATO"):
+            self._current_event = 0
+        event_code = self._current_event
+
+        entries = self._files["entries"]
+        offset = entries.tell()
+        line = json.dumps({"day": day, "text": text}, ensure_ascii=False)
+        entries.write(line.encode("utf-8") + b"\n")
+        self._files["index"].write(
+            _RECORD.pack(day, _KIND_CODES[kind], event_code, offset)
+        )
+        if self._last_day is not None and day < self._last_day:
+            self._files["segments"].write(_U64.pack(self._records))
+        if event_code:
+            postings = self._files.get(event_code)
+            if postings is None:
+                postings = self._files[event_code] = (
+                    self.directory / f"event-{event_code}.bin"
+                ).open("ab")
+            postings.write(_U64.pack(self._records))
+        self._records += 1
+        self._last_day = day
+
+    def truncate(self, records):
+        """
+        Riporta l'archivio ai primi `records` record (annullamenti, simulazioni
+        interrotte): le voci successive spariscono da voci, indice, segmenti ed
+        eventi. Un valore oltre la lunghezza attuale non cambia nulla.
+        """
+        self.close()
+        index_path = self.directory / "index.bin"
+        if not index_path.exists():
+            return
+        size = index_path.stat().st_size // _RECORD.size
+        if records >= size:
+            return
+        last_day, event_code = None, 0
+        with index_path.open("r+b") as f:
+            f.seek(records * _RECORD.size)
+            offset = _RECORD.unpack(f.read(_RECORD.size))[3]
+            if records:
+                f.seek((records - 1) * _RECORD.size)
+                last_day, kind, event_code, _ = _RECORD.unpack(f.read(_RECORD.size))
+                if KINDS[kind] not in ("EVENTO", "CHECK", "RISULTATO"):
+                    event_code = 0
+            f.truncate(records * _RECORD.size)
+        with (self.directory / "entries.jsonl").open("r+b") as f:
+            f.truncate(offset)
+        # Segmenti e liste per evento sono numeri di record crescenti
+        for path in [self.directory / "segments.bin", *self.directory.glob("event-*.bin")]:
+            if not path.exists():
+                continue
+            with path.open("r+b") as f:
+                data = f.read()
+                kept = bisect_left(array("Q", data[: len(data) // 8 * 8]), records)
+                f.truncate(kept * _U64.size)
+        self._records = records
+        self._last_day = last_day
+        self._current_event = event_code
+
+    def flush(self):
+        if self._files is not None:
+            for f in self._files.values():
+                f.flush()
+
+    def close(self):
+        if self._files is not None:
+            for f in self._files.values():
+                f.close()
+            self._files = None
+
+    # ------------------------------------------
+    # LETTURA
+    # ------------------------------------------
+
+    def _map(self, name):
+        path = self.directory / name
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return None
+        if size == 0:
+            return None
+        with path.open("rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        if self._files is not None:
+            # Scritture ancora nei buffer: il file indice è indietro
+            return self._records
+        path = self.directory / "index.bin"
+        if not path.exists():
+            return 0
+        return path.stat().st_size // _RECORD.size
+
+    def match(self, day_from=None, day_to=None, kind=None, event=None, text=None):
+        """
+        Numeri di record delle voci filtrate, in ordine di scrittura.
+        day_from/day_to: intervallo di giorni (estremi inclusi).
+        kind: una voce di KINDS; event: una voce di EVENT_TYPES (le righe EVENTO,
+        CHECK e RISULTATO di quell'evento); text: sottostringa (senza maiuscole).
+        Solo `text` legge le voci: gli altri filtri usano l'indice.
+        """
+        self.flush()
+        index = self._map("index.bin")
+        if index is None:
+            return array("Q")
+        entries = self._map("entries.jsonl") if text else None
+        try:
+            n = len(index) // _RECORD.size
+            lo = 0 if day_from is None else day_from
+            hi = 2**32 - 1 if day_to is None else day_to
+            kind_code = None if kind is None else _KIND_CODES[kind]
+            needle = text.lower() if text else None
+
+            out = array("Q")
+            for r in self._candidates(index, n, lo, hi, event):
+                day, k, _, offset = _RECORD.unpack_from(index, r * _RECORD.size)
+                if not lo <= day <= hi:
+                    continue
+                if kind_code is not None and k != kind_code:
+                    continue
+                if needle and needle not in _read_text(entries, offset).lower():
+                    continue
+                out.append(r)
+            return out
+        finally:
+            index.close()
+            if entries is not None:
+                entries.close()
+
+    def read(self, records):
+        """Voci dei record indicati, come dizionari {"record", "day", "kind", "event", "text"}."""
+        self.flush()
+        index = self._map("index.bin")
+        if index is None:
+            return []
+        entries = self._map("entries.jsonl")
+        _event_codes()
+        try:
+            out = []
+            for r in records:
+                day, k, e, offset = _RECORD.unpack_from(index, r * _RECORD.size)
+                out.append(
+                    {
+                        "record": r,
+                        "day": day,
+                        "kind": KINDS[k],
+                        "event": _EVENT_TYPES[e - 1] if e else None,
+                        "text": _read_text(entries, offset),
+                    }
+                )
+            return out
+        finally:
+            index.close()
+            entries.close()
+
+    def query(self, day_from=None, day_to=None, kind=None, event=None, text=None):
+        """Voci filtrate (vedi match), lette a blocchi."""
+        records = self.match(day_from, day_to, kind, event, text)
+        for start in range(0, len(records), 1024):
+            yield from self.read(records[start : start + 1024])
+
+    def _candidates(self, index, n, lo, hi, event):
+        """Numeri di record da esaminare, in ordine crescente."""
+        bounds = self._segments(n)
+        if event is not None:
+            postings = self._map(f"event-{_event_codes()[event]}.bin")
+            if postings is None:
+                return
+            try:
+                records = array("Q", postings[: len(postings) // 8 * 8])
+            finally:
+                postings.close()
+            # Dentro ogni segmento i giorni crescono: si restringe per ricerca binaria
+            for start, stop in bounds:
+                first = _lower_bound(index, start, stop, lo)
+                last = _lower_bound(index, first, stop, hi + 1)
+                a = bisect_left(records, first)
+                b = bisect_left(records, last)
+                yield from records[a:b]
+            return
+        for start, stop in bounds:
+            first = _lower_bound(index, start, stop, lo)
+            last = _lower_bound(index, first, stop, hi + 1)
+            yield from range(first, last)
+
+    def _segments(self, n):
+        starts = [0]
+        seg = self._map("segments.bin")
+        if seg is not None:
+            try:
+                starts += [s for s in array("Q", seg[: len(seg) // 8 * 8]) if s < n]
+            finally:
+                seg.close()
+        starts.append(n)
+        return [(a, b) for a, b in zip(starts, starts[1:]) if a < b]
+
+    def tail(self, count):
+        """Ultime `count` voci (dizionari, vedi read)."""
+        n = len(self)
+        return self.read(range(max(0, n - count), n))
+
+    def export(self, path, **filters):
+        """Scrive le voci filtrate (vedi match) in JSONL; restituisce quante."""
+        n = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for entry in self.query(**filters):
+                f.write(json.dumps(entry, ensure_ascii=False))
+                f.write("\n")
+                n += 1
+        return n
+
+
+def _read_text(entries, offset):
+    end = entries.find(b"\n", offset)
+    return json.loads(entries[offset:end])["text"]
+
+
+class InMemoryHistory:
+    """Stessa interfaccia di lettura di HistoryArchive per uno storico in memoria (bank senza file)."""
+
+    def __init__(self, lines):
+        self.entries = []
+        event = None
+        for r, line in enumerate(lines):
+            day, text = parse_history_line(line)
+            kind, evt = classify(text)
+            if kind == "EVENTO":
+                event = evt
+            elif kind not in ("CHECK", "RISULTATO"):
+                event = None
+            self.entries.append(
+                {"record": r, "day": day, "kind": kind, "event": event, "text": text}
+            )
+
+    def __len__(self):
+        return len(self.entries)
+
+    def match(self, day_from=None, day_to=None, kind=None, event=None, text=None):
+        needle = text.lower() if text else None
+        return [
+            e["record"]
+            for e in self.entries
+            if (day_from is None or e["day"] >= day_from)
+            and (day_to is None or e["day"] <= day_to)
+            and (kind is None or e["kind"] == kind)
+            and (event is None or e["event"] == event)
+            and (needle is None or needle in e["text"].lower())
+        ]
+
+    def read(self, records):
+        return [self.entries[r] for r in records]
+
+
+class HistoryPager:
+    """
+    Pagine di voci, filtrate o no. Senza filtri le pagine sono intervalli di
+    record e si legge solo la pagina mostrata; con i filtri si calcola una volta
+    l'elenco dei record (dall'indice) e poi, di nuovo, solo la pagina.
+    """
+
+    def __init__(self, source, page_size=20):
+        self.source = source
+        self.page_size = page_size
+        self.filters = {}
+        self.refresh()
+
+    def refresh(self):
+        filters = {k: v for k, v in self.filters.items() if v is not None}
+        self.records = self.source.match(**filters) if filters else None
+        self.total = len(self.source) if self.records is None else len(self.records)
+
+    @property
+    def pages(self):
+        return max(1, -(-self.total // self.page_size))
+
+    def page(self, number):
+        start = number * self.page_size
+        stop = min(start + self.page_size, self.total)
+        if start >= stop:
+            return []
+        if self.records is None:
+            return self.source.read(range(start, stop))
+        return self.source.read(self.records[start:stop])
+
+
+def _lower_bound(index, start, stop, day):
+    """Primo record in [start, stop) con giorno >= day (segmento ordinato per giorno)."""
+    size = _RECORD.size
+    while start < stop:
+        mid = (start + stop) // 2
+        if struct.unpack_from("<I", index, mid * size)[0] < day:
+            start = mid + 1
+        else:
+            stop = mid
+    return start
+
+
+def parse_history_line(line):
+    """(giorno, testo) di una riga "Giorno N: testo" dello storico del salvataggio."""
+    head, sep, text = line.partition(": ")
+    if sep and head.startswith("Giorno "):
+        try:
+            return int(head[7:]), text
+        except ValueError:
+            pass
+    return 0, line
+
+
+def backfill(archive, history):
+    """Riempie un archivio nuovo con lo storico già presente nel salvataggio."""
+    for line in history:
+        archive.append(*parse_history_line(line))
+    archive.flush()
+    return os.path.getsize(archive.directory / "index.bin") // _RECORD.size
@@ -0,0 +1,200 @@
+"""
+Cache su disco dei risultati di simulazione, indirizzata per contenuto.
+
+La chiave è l'hash SHA-256 di una forma JSON canonica di: stato di partenza
+(senza storico), parametri della simulazione e impronta delle regole
+(ENGINE_VERSION + sorgente intero dei moduli che le contengono: engine, dadi,
+controllo, compilatore delle configurazioni). Cambiare le regole invalida
+quindi da sé le voci vecchie, che escono poi per LRU.
+
+Ogni voce è un file JSON scritto in modo atomico (file temporaneo + rename):
+più processi possono leggere e scrivere insieme senza vedere file a metà.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import time
+from pathlib import Path
+
+# Da incrementare a mano quando cambia la semantica dei risultati
+ENGINE_VERSION = 3
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_fingerprint = None
+
+
+def rules_fingerprint():
+    """
+    Impronta delle regole in vigore (calcolata una volta per processo): il
+    sorgente intero dei moduli, non di alcune funzioni, perché un giorno passa
+    anche da ResourceBank, Guild, gli effetti, il ciclo di simulazione e i dadi.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        from guild_downtime import config, control, dice, game_engine
+
+        h = hashlib.sha256()
+        h.update(str(ENGINE_VERSION).encode())
+        for module in (game_engine, dice, control, config):
+            h.update(inspect.getsource(module).encode())
+        _fingerprint = h.hexdigest()
+    return _fingerprint
+
+
+def _canonical(obj):
+    return json.dumps(
+        obj, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def cache_key(snapshot, **params):
+    """Chiave di una simulazione: stato di partenza + parametri + regole."""
+    state = snapshot.to_dict()
+    state.pop("history")
+    state.pop("label")
+    state.pop("history_records")
+    payload = {"state": state, "params": params, "rules": rules_fingerprint()}
+    return hashlib.sha256(_canonical(payload)).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        if directory is None:
+            from guild_downtime.game_engine import BASE_DIR
+
+            directory = BASE_DIR / "data" / "cache" / "results"
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        # Tocca il file: l'mtime fa da "ultimo uso" per l'LRU
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+        # La scansione per l'evizione costa O(voci): non a ogni scrittura
+        self._puts += 1
+        if self._puts % 50 == 1:
+            self.evict()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def evict(self):
+        """Rimuove le voci usate meno di recente finché la cache supera max_bytes."""
+        lock = self.directory / ".evict.lock"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Un altro processo sta già facendo pulizia (o è morto lasciando il lock)
+            try:
+                if time.time() - lock.stat().st_mtime > 60:
+                    lock.unlink()
+            except FileNotFoundError:
+                pass
+            return
+        try:
+            entries = []
+            total = 0
+            for path in self.directory.glob("*/*.json"):
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        finally:
+            os.close(fd)
+            lock.unlink()
+
+    def clear(self):
+        for path in self.directory.glob("*/*.json"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def simulate_cached(
+    snapshot,
+    days,
+    strategy="u",
+    target_res=None,
+    sim_mode="1",
+    is_leaving=False,
+    seed=0,
+    cache=None,
+):
+    """
+    Una simulazione seminata a partire da `snapshot`, servita dalla cache se già
+    calcolata. Restituisce {"summary": ..., "final": stato finale senza storico}.
+    """
+    from guild_downtime import dice
+    from guild_downtime.game_engine import GameEngine
+
+    def compute():
+        dice.seed(seed)
+        engine = GameEngine.from_snapshot(snapshot)
+        summary = engine.simulate(days, strategy, target_res, sim_mode, is_leaving)
+        final = engine.snapshot().to_dict()
+        final.pop("history")
+        final.pop("history_records")
+        # Stessa forma (liste, non tuple) di una lettura dalla cache
+        return json.loads(_canonical({"summary": summary, "final": final}))
+
+    if cache is None:
+        return compute()
+    key = cache_key(
+        snapshot,
+        kind="simulate",
+        days=days,
+        strategy=strategy,
+        target_res=target_res,
+        sim_mode=sim_mode,
+        is_leaving=is_leaving,
+        seed=seed,
+    )
+    return cache.get_or_compute(key, compute)
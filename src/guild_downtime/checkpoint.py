@@ -0,0 +1,80 @@
+"""
+Checkpoint periodici delle simulazioni lunghe.
+
+Un checkpoint contiene lo stato completo (snapshot di ResourceBank + Guild),
+lo stato del generatore casuale (con i dadi pre-generati, vedi dice.py) e
+l'avanzamento del ciclo di simulazione: riprendendo da lì si ottengono esattamente gli stessi risultati di una
+corsa mai interrotta.
+"""
+
+import json
+import os
+import random
+import time
+from pathlib import Path
+
+from guild_downtime import dice
+
+
+class SimulationCheckpoint:
+    def __init__(self, path, every_days=1000, every_seconds=30.0):
+        """
+        path: file JSON del checkpoint.
+        every_days / every_seconds: scrive quando scatta la prima delle due soglie
+        (None per disattivarne una).
+        """
+        self.path = Path(path)
+        self.every_days = every_days
+        self.every_seconds = every_seconds
+        self._last_done = 0
+        self._last_time = time.monotonic()
+
+    def due(self, done):
+        if self.every_days and done - self._last_done >= self.every_days:
+            return True
+        if (
+            self.every_seconds
+            and time.monotonic() - self._last_time >= self.every_seconds
+        ):
+            return True
+        return False
+
+    def save(self, engine, progress):
+        version, internal, gauss_next = random.getstate()
+        data = {
+            "progress": progress,
+            "state": engine.snapshot("checkpoint").to_dict(),
+            "rng_state": [version, list(internal), gauss_next],
+            # Dadi già generati e non ancora usati (dice.py)
+            "dice_state": dice.getstate(),
+        }
+        # Scrittura atomica: un'interruzione durante il salvataggio
+        # lascia intatto il checkpoint precedente
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+        self._last_done = progress["done"]
+        self._last_time = time.monotonic()
+
+    def load(self):
+        if not self.path.exists():
+            return None
+        with self.path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        version, internal, gauss_next = data["rng_state"]
+        data["rng_state"] = (version, tuple(internal), gauss_next)
+        self._last_done = data["progress"]["done"]
+        self._last_time = time.monotonic()
+        return data
+
+    def exists(self):
+        return self.path.exists()
+
+    def clear(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
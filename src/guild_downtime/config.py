@@ -0,0 +1,259 @@
+"""
+Tipi di gilda da configs/<nome>.yaml, validati e compilati nelle strutture
+dell'engine.
+
+    name: Compagnia Mercenaria        # nome del tipo
+    guild_name: Compagnia Mercenaria del Grifone   # nome di default di una nuova gilda
+    event_table: mercenari            # chiave di EVENT_TABLES
+    resources: {MO: 0.0, Influenza: 0}            # risorse iniziali (le altre a 0)
+    character_stats:
+      Diplomazia: 6
+    units:
+      - name: Arcieri Scelti          # bonus da GAME_DATABASE se non indicati
+        qty: 1
+      - name: Armeria
+        type: Stanza
+        bonuses: {Manodopera: 2}
+
+Il risultato compilato (GuildType) è salvato con pickle in data/cache/configs/:
+ai lanci successivi, e in ogni processo worker, basta confrontare mtime e
+dimensione del file (o, se cambiano, il suo hash) per riusarlo senza
+rileggere né rivalidare lo YAML.
+
+Il parsing è di PyYAML (requirements.txt); uno YAML malformato è un
+ValueError come gli altri errori di validazione.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+# Da incrementare quando cambia il formato compilato
+COMPILER_VERSION = 1
+
+REQUIRED_KEYS = ("name", "units")
+OPTIONAL_KEYS = ("guild_name", "event_table", "resources", "character_stats")
+UNIT_KEYS = ("name", "type", "qty", "bonuses")
+UNIT_TYPES = ("Squadra", "Stanza")
+
+_compiled = {}
+
+
+class GuildType:
+    """Tipo di gilda compilato: solo dati semplici, picklabile."""
+
+    __slots__ = (
+        "key",
+        "name",
+        "guild_name",
+        "event_table",
+        "resources",
+        "character_stats",
+        "units",
+    )
+
+    def __init__(
+        self, key, name, guild_name, event_table, resources, character_stats, units
+    ):
+        self.key = key
+        self.name = name
+        self.guild_name = guild_name
+        self.event_table = event_table
+        self.resources = resources
+        self.character_stats = character_stats
+        # (name, unit_type, bonuses, qty), come in StateSnapshot.units
+        self.units = units
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+
+def _config_dir():
+    from guild_downtime.game_engine import BASE_DIR
+
+    return BASE_DIR / "configs"
+
+
+def _cache_dir():
+    from guild_downtime.game_engine import BASE_DIR
+
+    return BASE_DIR / "data" / "cache" / "configs"
+
+
+def list_guild_types():
+    return sorted(p.stem for p in _config_dir().glob("*.yaml"))
+
+
+def load_guild_type(key="default"):
+    """GuildType di configs/<key>.yaml, dalla memoria, dalla cache su disco o compilato."""
+    path = _config_dir() / f"{key}.yaml"
+    st = path.stat()
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    cached = _compiled.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    cache_path = _cache_dir() / f"{key}.pickle"
+    entry = _read_cache(cache_path)
+    if entry is not None and entry["stamp"] == stamp:
+        gtype = entry["compiled"]
+    else:
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        if entry is not None and entry["sha256"] == digest:
+            # File toccato ma identico: basta aggiornare il timbro
+            gtype = entry["compiled"]
+        else:
+            gtype = compile_guild_type(key, parse_yaml(raw.decode("utf-8"), path), path)
+        _write_cache(cache_path, {"stamp": stamp, "sha256": digest, "compiled": gtype})
+
+    _compiled[key] = (stamp, gtype)
+    return gtype
+
+
+def _rules_stamp():
+    """I bonus presi da GAME_DATABASE finiscono nel compilato: se cambiano, si ricompila."""
+    from guild_downtime.game_engine import EARN_COSTS, game_database
+
+    payload = json.dumps([COMPILER_VERSION, game_database(), EARN_COSTS], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _read_cache(path):
+    try:
+        with path.open("rb") as f:
+            entry = pickle.load(f)
+    except (
+        FileNotFoundError,
+        pickle.UnpicklingError,
+        EOFError,
+        AttributeError,
+        ImportError,  # anche ModuleNotFoundError: classi spostate o rinominate
+        ValueError,  # protocollo pickle non supportato da questo Python
+    ):
+        return None
+    if not isinstance(entry, dict) or entry.get("rules") != _rules_stamp():
+        return None
+    return entry
+
+
+def _write_cache(path, entry):
+    entry["rules"] = _rules_stamp()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+# ==========================================
+# VALIDAZIONE E COMPILAZIONE
+# ==========================================
+
+
+def compile_guild_type(key, data, source="<config>"):
+    """Valida il dizionario letto da YAML e lo trasforma in un GuildType."""
+    from guild_downtime.game_engine import (
+        EARN_COSTS,
+        EVENT_TABLES,
+        ResourceBank,
+        game_database,
+        unit_type_for,
+    )
+
+    def fail(msg):
+        raise ValueError(f"{source}: {msg}")
+
+    if not isinstance(data, dict):
+        fail("il file deve contenere una mappa chiave: valore")
+    for k in REQUIRED_KEYS:
+        if k not in data:
+            fail(f"chiave obbligatoria mancante: {k}")
+    for k in data:
+        if k not in REQUIRED_KEYS + OPTIONAL_KEYS:
+            fail(f"chiave sconosciuta: {k}")
+    if not isinstance(data["name"], str) or not data["name"]:
+        fail("name deve essere un testo non vuoto")
+
+    event_table = data.get("event_table", "mercenari")
+    if event_table not in EVENT_TABLES:
+        fail(
+            f"event_table sconosciuta: {event_table} "
+            f"(disponibili: {', '.join(sorted(EVENT_TABLES))})"
+        )
+
+    defaults = ResourceBank(save_file=None)
+    resources = dict(defaults.resources)
+    for r, v in (data.get("resources") or {}).items():
+        if r not in EARN_COSTS:
+            fail(f"risorsa sconosciuta: {r}")
+        if not isinstance(v, (int, float)) or isinstance(v, bool) or v < 0:
+            fail(f"resources.{r} deve essere un numero >= 0")
+        resources[r] = float(v) if r == "MO" else int(v)
+
+    stats = dict(defaults.character_stats)
+    for s, v in (data.get("character_stats") or {}).items():
+        if not isinstance(v, int) or isinstance(v, bool):
+            fail(f"character_stats.{s} deve essere un intero")
+        stats[s] = v
+
+    if not isinstance(data["units"], list):
+        fail("units deve essere una lista")
+    units = []
+    for i, u in enumerate(data["units"]):
+        where = f"units[{i}]"
+        if not isinstance(u, dict) or "name" not in u:
+            fail(f"{where}: serve almeno name")
+        for k in u:
+            if k not in UNIT_KEYS:
+                fail(f"{where}: chiave sconosciuta {k}")
+        name = u["name"]
+        bonuses = u.get("bonuses")
+        if bonuses is None:
+            if name not in game_database():
+                fail(f"{where}: {name} non è in GAME_DATABASE, indicare bonuses")
+            bonuses = game_database()[name]
+        if not isinstance(bonuses, dict):
+            fail(f"{where}: bonuses deve essere una mappa risorsa: bonus")
+        for r, b in bonuses.items():
+            if r not in EARN_COSTS:
+                fail(f"{where}: risorsa sconosciuta nei bonus: {r}")
+            if not isinstance(b, int) or isinstance(b, bool):
+                fail(f"{where}: il bonus di {r} deve essere un intero")
+        unit_type = u.get("type") or unit_type_for(name)
+        if unit_type not in UNIT_TYPES:
+            fail(f"{where}: type deve essere uno tra {', '.join(UNIT_TYPES)}")
+        qty = u.get("qty", 1)
+        if not isinstance(qty, int) or isinstance(qty, bool) or qty < 1:
+            fail(f"{where}: qty deve essere un intero >= 1")
+        units.append((name, unit_type, dict(bonuses), qty))
+
+    return GuildType(
+        key,
+        data["name"],
+        data.get("guild_name") or data["name"],
+        event_table,
+        resources,
+        stats,
+        tuple(units),
+    )
+
+
+# ==========================================
+# YAML
+# ==========================================
+
+
+def parse_yaml(text, source="<config>"):
+    import yaml
+
+    try:
+        return yaml.safe_load(text)
+    except yaml.YAMLError as exc:
+        raise ValueError(f"{source}: YAML non valido: {exc}") from None
@@ -0,0 +1,103 @@
+"""
+Forma chiusa del periodo di controllo perso.
+
+Ogni giorno senza controllo si tira d20 + Autorità contro CD max(0, assenza - 10),
+e l'assenza cresce di 1 al giorno se il GM è via (o sta partendo). La CD è quindi
+deterministica giorno per giorno: il giorno della ripresa ha una distribuzione
+esatta, che si può campionare con un solo numero casuale invece di un tiro al giorno.
+"""
+
+import math
+import random
+
+# Sotto questa probabilità di ripresa la situazione è segnalata come senza uscita
+IMPOSSIBLE_THRESHOLD = 0.01
+
+
+def regain_probability(bonus, dc):
+    """P(d20 + bonus >= dc). Il tiro di controllo non ha successo automatico sul 20."""
+    need = dc - bonus
+    if need <= 1:
+        return 1.0
+    if need > 20:
+        return 0.0
+    return (21 - need) / 20
+
+
+def attempt_dc(days_absent, growing, attempt):
+    """CD del tentativo numero `attempt` (da 1), con l'assenza incrementata prima del tiro."""
+    absent = days_absent + attempt if growing else days_absent
+    return max(0, absent - 10)
+
+
+def recovery_distribution(bonus, days_absent, growing, max_days):
+    """
+    Distribuzione del giorno di ripresa entro `max_days` tentativi.
+    Restituisce (pmf, p_mai) con pmf[k] = P(ripresa al tentativo k + 1).
+    La lista si ferma appena la ripresa diventa certa o impossibile.
+    """
+    pmf = []
+    survive = 1.0
+    for attempt in range(1, max_days + 1):
+        p = regain_probability(bonus, attempt_dc(days_absent, growing, attempt))
+        pmf.append(survive * p)
+        survive *= 1.0 - p
+        if survive == 0.0:
+            break
+        if p == 0.0 and growing:
+            # La CD cresce: da qui in poi non si riprende più
+            break
+        if not growing and attempt == 1:
+            # CD costante: coda geometrica in forma chiusa
+            q = 1.0 - p
+            n = max_days - 1
+            pmf.extend(survive * q**i * p for i in range(min(n, _geometric_len(q))))
+            survive *= q ** n
+            break
+    return pmf, survive
+
+
+def _geometric_len(q):
+    """Numero di termini geometrici oltre i quali la coda è trascurabile."""
+    if q <= 0.0:
+        return 0
+    if q >= 1.0:
+        return 0
+    return int(math.log(1e-12) / math.log(q)) + 1
+
+
+def sample_recovery(bonus, days_absent, growing, max_days, rng=random):
+    """
+    Campiona con un solo numero casuale il tentativo (da 1) in cui si riprende
+    il controllo, o None se non avviene entro `max_days` tentativi.
+    """
+    u = rng.random()
+    p_first = regain_probability(bonus, attempt_dc(days_absent, growing, 1))
+    if not growing:
+        # Geometrica con p costante: inversione diretta della CDF
+        if p_first >= 1.0:
+            return 1
+        if p_first <= 0.0:
+            return None
+        k = int(math.log1p(-u) / math.log1p(-p_first)) + 1
+        return k if k <= max_days else None
+
+    survive = 1.0
+    for attempt in range(1, max_days + 1):
+        p = regain_probability(bonus, attempt_dc(days_absent, growing, attempt))
+        if p == 0.0:
+            return None
+        survive *= 1.0 - p
+        if u >= survive:
+            return attempt
+    return None
+
+
+def recovery_outlook(bonus, days_absent, growing, horizon=365):
+    """
+    Probabilità di riprendere il controllo entro `horizon` giorni, e se la
+    situazione è praticamente senza uscita (sotto IMPOSSIBLE_THRESHOLD).
+    """
+    _, p_never = recovery_distribution(bonus, days_absent, growing, horizon)
+    p_recover = 1.0 - p_never
+    return p_recover, p_recover < IMPOSSIBLE_THRESHOLD
@@ -0,0 +1,129 @@
+"""
+Dadi pre-generati in blocco.
+
+Invece di una chiamata random.randint per dado, DicePool tiene per ogni tipo
+di dado (d4, d6, d10, d20, d100...) un buffer di risultati già tirati: un
+blocco di byte casuali del generatore (randbytes) diventa una sequenza di dadi
+con una sola bytes.translate, che scarta i byte oltre l'ultimo multiplo del
+numero di facce (niente distorsione) e mappa gli altri su 1..facce. Un tiro è
+poi una next() sul buffer.
+
+Il pool del modulo attinge al generatore globale `random`: la sequenza dei
+dadi dipende solo dal seme. Per riseminare le simulazioni si usa seed() di
+questo modulo (semina `random` e svuota i buffer), non random.seed().
+
+Ogni tiro dichiara il suo scopo (es. "GENERAZIONE", vedi trace.PURPOSES).
+Con `trace` impostato (vedi guild_downtime.trace) tiri e valori derivati da
+altro caso (derive) passano dalla traccia, che li registra con lo scopo o, nel
+replay, li legge al posto dei buffer; senza traccia lo scopo non costa nulla.
+"""
+
+import random
+
+# Iteratore esaurito condiviso: il primo tiro di un tipo di dado riempie il buffer
+_EMPTY = iter(b"")
+
+_TABLES = {}
+
+
+def _tables(sides):
+    """(tabella di traduzione, byte da scartare) per un dado a `sides` facce."""
+    tables = _TABLES.get(sides)
+    if tables is None:
+        if not 1 <= sides <= 255:
+            raise ValueError(f"Dado d{sides} non supportato (facce da 1 a 255).")
+        limit = 256 - 256 % sides
+        table = bytes((b % sides) + 1 if b < limit else 0 for b in range(256))
+        tables = _TABLES[sides] = (table, bytes(range(limit, 256)))
+    return tables
+
+
+class DicePool:
+    __slots__ = ("source", "block", "trace", "_streams")
+
+    def __init__(self, source=random, block=1024):
+        """
+        source: generatore con randbytes() (il modulo random o un random.Random).
+        block: byte casuali per riempimento (i dadi ottenuti sono un po' meno,
+        per gli scarti).
+        """
+        self.source = source
+        self.block = block
+        # Registratore (o lettore, nel replay) della traccia dei dadi
+        self.trace = None
+        self._streams = {}
+
+    def roll(self, sides, purpose="ALTRO"):
+        if self.trace is not None:
+            return self.trace.roll(self, sides, purpose)
+        value = next(self._streams.get(sides, _EMPTY), 0)
+        if value:
+            return value
+        return self._refill(sides)
+
+    def draw(self, sides):
+        """Un dado dai buffer, senza passare dalla traccia."""
+        value = next(self._streams.get(sides, _EMPTY), 0)
+        if value:
+            return value
+        return self._refill(sides)
+
+    def _refill(self, sides):
+        table, reject = _tables(sides)
+        data = b""
+        while not data:
+            data = self.source.randbytes(self.block).translate(table, reject)
+        stream = self._streams[sides] = iter(data)
+        return next(stream)
+
+    def derive(self, purpose, compute):
+        """
+        Valore intero (o None) ottenuto da altro caso che non è un dado, es. il
+        giorno di ripresa del controllo: compute() senza traccia, registrato con
+        la traccia, letto dalla traccia nel replay (senza chiamare compute).
+        """
+        if self.trace is None:
+            return compute()
+        return self.trace.derive(purpose, compute)
+
+    def attach(self, trace):
+        """
+        Collega una traccia e restituisce quella di prima, da ridare a
+        detach(). I buffer non cambiano: il registratore ne estrae i dadi con
+        draw(), il lettore del replay non li tocca.
+        """
+        saved = self.trace
+        self.trace = trace
+        return saved
+
+    def detach(self, saved):
+        self.trace = saved
+
+    def seed(self, seed):
+        self.source.seed(seed)
+        self._streams.clear()
+
+    def getstate(self):
+        """Dadi non ancora usati, per tipo (forma JSON, per i checkpoint)."""
+        state = {}
+        for sides, stream in self._streams.items():
+            rest = bytes(stream)
+            self._streams[sides] = iter(rest)
+            state[str(sides)] = rest.hex()
+        return state
+
+    def setstate(self, state):
+        self._streams = {
+            int(sides): iter(bytes.fromhex(rest)) for sides, rest in state.items()
+        }
+
+
+_POOL = DicePool()
+
+roll = _POOL.roll
+seed = _POOL.seed
+getstate = _POOL.getstate
+setstate = _POOL.setstate
+derive = _POOL.derive
+attach = _POOL.attach
+detach = _POOL.detach
@@ -1,4 +1,3 @@
-import difflib
 import json
 import math
 import os
@@ -6,19 +5,72 @@ import random
 import time
 from pathlib import Path
 
+from guild_downtime.dice import derive, roll as roll_dice
+
 # ============================================================
 # Paths (repo-friendly)
 # - This file is expected at: src/guild_downtime/game_engine.py
 # - Saves are stored in: <repo_root>/data/saves/<guild_slug>.json
 # ============================================================
 
+# Solo percorsi: le cartelle si creano alla prima scrittura, non all'import
 BASE_DIR = Path(__file__).resolve().parents[2]
 SAVE_DIR = BASE_DIR / "data" / "saves"
-SAVE_DIR.mkdir(parents=True, exist_ok=True)
 
 # Default save file if none is specified (legacy / single-guild usage)
 DEFAULT_SAVE_FILE = SAVE_DIR / "Cacciatori_di_Taglie.json"
 
+# Voci di storico tenute in memoria; lo storico completo è nell'archivio su
+# disco accanto al salvataggio (vedi archive.py), non nel salvataggio
+HISTORY_WINDOW = 50
+
+# Versione dello schema dei salvataggi (vedi migrate.py) e ordine delle chiavi:
+# versione e nome in testa, leggibili senza interpretare tutto il file
+SCHEMA_VERSION = 3
+SAVE_FIELDS = (
+    "schema_version",
+    "guild_name",
+    "event_table",
+    "day_counter",
+    "event_chance",
+    "guild_control_lost",
+    "resources",
+    "character_stats",
+    "guild_units",
+    "active_effects",
+)
+
+# Byte letti da read_save_header: versione e nome stanno nelle prime righe
+SAVE_HEADER_BYTES = 512
+
+
+def is_save_name(name):
+    """Un file della cartella salvataggi è un salvataggio (non checkpoint o temporaneo)?"""
+    return name.endswith(".json") and not name.endswith((".checkpoint.json", ".tmp"))
+
+
+def read_save_header(path):
+    """
+    {"schema_version", "guild_name"} dall'inizio del salvataggio, senza
+    leggerlo tutto. None se il nome non è in testa (salvataggi senza versione).
+    """
+    with open(path, "rb") as f:
+        head = f.read(SAVE_HEADER_BYTES).decode("utf-8", errors="ignore")
+    header = {}
+    decoder = json.JSONDecoder()
+    for key in ("schema_version", "guild_name"):
+        start = head.find(f'"{key}":')
+        if start < 0:
+            continue
+        value_start = start + len(key) + 3
+        while head[value_start : value_start + 1].isspace():
+            value_start += 1
+        try:
+            header[key] = decoder.raw_decode(head, value_start)[0]
+        except ValueError:
+            pass
+    return header if "guild_name" in header else None
+
 # ==========================================
 # DATABASE REGOLE (Fonte: Golarion Insider)
 # ==========================================
@@ -32,98 +84,117 @@ EARN_COSTS = {
     "MO": 0,  # Generare monete è gratis
 }
 
-GAME_DATABASE = {
-    # --- SQUADRE ---
-    "Accolito": {"MO": 4, "Influenza": 4, "Magia": 4},
-    "Apprendista": {"MO": 4, "Influenza": 4, "Magia": 4},
-    "Arcieri": {"MO": 6, "Influenza": 6, "Manodopera": 6},
-    "Arcieri a Cavallo": {"MO": 8, "Influenza": 8, "Manodopera": 8},
-    "Arcieri Scelti": {"MO": 7, "Influenza": 7, "Manodopera": 7},
-    "Artigiani": {"MO": 4, "Manodopera": 4, "Merci": 4},
-    "Burocrati": {"MO": 4, "Influenza": 4},
-    "Cavalleria": {"MO": 7, "Influenza": 7, "Manodopera": 7},
-    "Guardie": {"MO": 2, "Influenza": 2, "Manodopera": 2},
-    "Guardie Scelte": {"MO": 4, "Influenza": 4, "Manodopera": 4},
-    "Guidatori": {"MO": 2, "Manodopera": 2, "Merci": 2},
-    "Lacchè": {"Influenza": 2, "Manodopera": 2},
-    "Lavoranti": {"MO": 2, "Manodopera": 2},
-    "Malioso": {"MO": 7, "Influenza": 7, "Magia": 7},
-    "Marinai": {"MO": 2, "Manodopera": 2, "Merci": 2},
-    "Rapinatori": {"MO": 4, "Influenza": 4, "Merci": 4},
-    "Sacerdote": {"MO": 7, "Influenza": 7, "Magia": 7},
-    "Saggio": {"MO": 5, "Influenza": 5},
-    "Soldati": {"MO": 5, "Influenza": 5, "Manodopera": 5},
-    "Soldati Scelti": {"MO": 6, "Influenza": 6, "Manodopera": 6},
-    "Tagliaborse": {"MO": 3, "Manodopera": 3, "Merci": 3},
-    "Trasgressori": {"MO": 2, "Influenza": 2, "Merci": 2},
-    # --- STANZE ---
-    "Alloggi": {"MO": 12},
-    "Altare": {"Influenza": 3},
-    "Arena da Combattimento": {"MO": 15, "Influenza": 15},
-    "Auditorium": {"MO": 15, "Influenza": 15},
-    "Aula": {"MO": 8, "Influenza": 8, "Magia": 8, "Manodopera": 8, "Merci": 8},
-    "Bagno": {"MO": 3, "Influenza": 3},
-    "Banchina": {"MO": 12, "Influenza": 12, "Manodopera": 12, "Merci": 12},
-    "Bar": {"MO": 10, "Influenza": 10},
-    "Biblioteca": {"MO": 8, "Influenza": 8},
-    "Biblioteca Magica": {"MO": 12, "Influenza": 12, "Magia": 12},
-    "Birrificio": {"MO": 10, "Influenza": 10},
-    "Camera da Letto": {"MO": 3, "Influenza": 3},
-    "Campo Sportivo": {"MO": 10, "Influenza": 10},
-    "Casello": {"MO": 4, "Merci": 4},
-    "Cortile": {"MO": 5, "Influenza": 5, "Magia": 5, "Manodopera": 5, "Merci": 5},
-    "Cripta": {"MO": 5, "Influenza": 5, "Magia": 5},
-    "Cucina": {"MO": 4, "Merci": 4},
-    "Deposito": {"MO": 2},
-    "Dojo": {"MO": 8, "Influenza": 8, "Manodopera": 8},
-    "Dormitori": {"MO": 8, "Manodopera": 8},
-    "Falsa Facciata": {"MO": 2, "Merci": 2},
-    "Forgia": {"MO": 10, "Merci": 10},
-    "Fossa": {"MO": 1, "Manodopera": 1},
-    "Giardino": {"MO": 8, "Merci": 8},
-    "Guardiola": {"MO": 4, "Merci": 4},
-    "Habitat": {"MO": 12, "Influenza": 12},
-    "Infermeria": {"MO": 8, "Influenza": 8},
-    "Labirinto": {"MO": 5, "Influenza": 5},
-    "Laboratorio Alchemico": {"MO": 10, "Magia": 10, "Merci": 10},
-    "Laboratorio Artigiano": {"MO": 10, "Influenza": 10, "Merci": 10},
-    "Laboratorio di Conceria": {"MO": 10, "Merci": 10},
-    "Lavanderia": {"MO": 3, "Merci": 3},
-    "Officina Meccanica": {"MO": 10, "Manodopera": 10, "Merci": 10},
-    "Postazione di Lavoro": {"MO": 8, "Influenza": 8, "Merci": 8},
-    "Posto di Guardia": {"MO": 4, "Merci": 4},
-    "Recinto per Animali": {"MO": 8, "Manodopera": 8, "Merci": 8},
-    "Reliquiario": {"MO": 5, "Influenza": 5},
-    "Sala Cerimoniale": {
-        "MO": 10,
-        "Influenza": 10,
-        "Magia": 10,
-        "Manodopera": 10,
-        "Merci": 10,
-    },
-    "Sala Comune": {"MO": 7, "Influenza": 7},
-    "Sala da Ballo": {"MO": 10, "Influenza": 10},
-    "Sala da Gioco": {"MO": 10},
-    "Sala dei Trofei": {"MO": 5, "Influenza": 5},
-    "Sala del Trono": {"Influenza": 15},
-    "Sala della Mola": {"MO": 8, "Merci": 8},
-    "Sala delle Evocazioni": {"Magia": 3},
-    "Salotto": {"Influenza": 4},
-    "Sauna": {"MO": 3, "Influenza": 3},
-    "Scriptorium": {"MO": 5, "Influenza": 5, "Magia": 5, "Manodopera": 5, "Merci": 5},
-    "Serra": {"MO": 12, "Influenza": 12, "Merci": 12},
-    "Specola": {"MO": 5, "Influenza": 5, "Magia": 5},
-    "Stallaggio": {"MO": 8, "Manodopera": 8, "Merci": 8},
-    "Stamperia": {"MO": 8, "Influenza": 8, "Manodopera": 8, "Merci": 8},
-    "Stanza da Cucito": {"MO": 10, "Influenza": 10, "Merci": 10},
-    "Stanza della Cova": {"MO": 5, "Merci": 5},
-    "Stanza dello Scrutamento": {"MO": 2, "Influenza": 2},
-    "Statua": {"MO": 1, "Influenza": 1},
-    "Terreno Agricolo": {"MO": 10, "Merci": 10},
-    "Terreno Sepolcrale": {"MO": 4, "Influenza": 4},
-    "Trasgressori": {"MO": 2, "Influenza": 2, "Merci": 2},
-    "Vetrina": {"MO": 5, "Influenza": 5, "Manodopera": 5, "Merci": 5},
-}
+# Tabella delle unità (nome -> bonus), costruita al primo uso: game_database(),
+# o GAME_DATABASE come attributo del modulo
+_game_database = None
+
+
+def game_database():
+    """{nome unità: {risorsa: bonus}} di squadre e stanze."""
+    global _game_database
+    if _game_database is None:
+        _game_database = {
+            # --- SQUADRE ---
+            "Accolito": {"MO": 4, "Influenza": 4, "Magia": 4},
+            "Apprendista": {"MO": 4, "Influenza": 4, "Magia": 4},
+            "Arcieri": {"MO": 6, "Influenza": 6, "Manodopera": 6},
+            "Arcieri a Cavallo": {"MO": 8, "Influenza": 8, "Manodopera": 8},
+            "Arcieri Scelti": {"MO": 7, "Influenza": 7, "Manodopera": 7},
+            "Artigiani": {"MO": 4, "Manodopera": 4, "Merci": 4},
+            "Burocrati": {"MO": 4, "Influenza": 4},
+            "Cavalleria": {"MO": 7, "Influenza": 7, "Manodopera": 7},
+            "Guardie": {"MO": 2, "Influenza": 2, "Manodopera": 2},
+            "Guardie Scelte": {"MO": 4, "Influenza": 4, "Manodopera": 4},
+            "Guidatori": {"MO": 2, "Manodopera": 2, "Merci": 2},
+            "Lacchè": {"Influenza": 2, "Manodopera": 2},
+            "Lavoranti": {"MO": 2, "Manodopera": 2},
+            "Malioso": {"MO": 7, "Influenza": 7, "Magia": 7},
+            "Marinai": {"MO": 2, "Manodopera": 2, "Merci": 2},
+            "Rapinatori": {"MO": 4, "Influenza": 4, "Merci": 4},
+            "Sacerdote": {"MO": 7, "Influenza": 7, "Magia": 7},
+            "Saggio": {"MO": 5, "Influenza": 5},
+            "Soldati": {"MO": 5, "Influenza": 5, "Manodopera": 5},
+            "Soldati Scelti": {"MO": 6, "Influenza": 6, "Manodopera": 6},
+            "Tagliaborse": {"MO": 3, "Manodopera": 3, "Merci": 3},
+            "Trasgressori": {"MO": 2, "Influenza": 2, "Merci": 2},
+            # --- STANZE ---
+            "Alloggi": {"MO": 12},
+            "Altare": {"Influenza": 3},
+            "Arena da Combattimento": {"MO": 15, "Influenza": 15},
+            "Auditorium": {"MO": 15, "Influenza": 15},
+            "Aula": {"MO": 8, "Influenza": 8, "Magia": 8, "Manodopera": 8, "Merci": 8},
+            "Bagno": {"MO": 3, "Influenza": 3},
+            "Banchina": {"MO": 12, "Influenza": 12, "Manodopera": 12, "Merci": 12},
+            "Bar": {"MO": 10, "Influenza": 10},
+            "Biblioteca": {"MO": 8, "Influenza": 8},
+            "Biblioteca Magica": {"MO": 12, "Influenza": 12, "Magia": 12},
+            "Birrificio": {"MO": 10, "Influenza": 10},
+            "Camera da Letto": {"MO": 3, "Influenza": 3},
+            "Campo Sportivo": {"MO": 10, "Influenza": 10},
+            "Casello": {"MO": 4, "Merci": 4},
+            "Cortile": {"MO": 5, "Influenza": 5, "Magia": 5, "Manodopera": 5, "Merci": 5},
+            "Cripta": {"MO": 5, "Influenza": 5, "Magia": 5},
+            "Cucina": {"MO": 4, "Merci": 4},
+            "Deposito": {"MO": 2},
+            "Dojo": {"MO": 8, "Influenza": 8, "Manodopera": 8},
+            "Dormitori": {"MO": 8, "Manodopera": 8},
+            "Falsa Facciata": {"MO": 2, "Merci": 2},
+            "Forgia": {"MO": 10, "Merci": 10},
+            "Fossa": {"MO": 1, "Manodopera": 1},
+            "Giardino": {"MO": 8, "Merci": 8},
+            "Guardiola": {"MO": 4, "Merci": 4},
+            "Habitat": {"MO": 12, "Influenza": 12},
+            "Infermeria": {"MO": 8, "Influenza": 8},
+            "Labirinto": {"MO": 5, "Influenza": 5},
+            "Laboratorio Alchemico": {"MO": 10, "Magia": 10, "Merci": 10},
+            "Laboratorio Artigiano": {"MO": 10, "Influenza": 10, "Merci": 10},
+            "Laboratorio di Conceria": {"MO": 10, "Merci": 10},
+            "Lavanderia": {"MO": 3, "Merci": 3},
+            "Officina Meccanica": {"MO": 10, "Manodopera": 10, "Merci": 10},
+            "Postazione di Lavoro": {"MO": 8, "Influenza": 8, "Merci": 8},
+            "Posto di Guardia": {"MO": 4, "Merci": 4},
+            "Recinto per Animali": {"MO": 8, "Manodopera": 8, "Merci": 8},
+            "Reliquiario": {"MO": 5, "Influenza": 5},
+            "Sala Cerimoniale": {
+                "MO": 10,
+                "Influenza": 10,
+                "Magia": 10,
+                "Manodopera": 10,
+                "Merci": 10,
+            },
+            "Sala Comune": {"MO": 7, "Influenza": 7},
+            "Sala da Ballo": {"MO": 10, "Influenza": 10},
+            "Sala da Gioco": {"MO": 10},
+            "Sala dei Trofei": {"MO": 5, "Influenza": 5},
+            "Sala del Trono": {"Influenza": 15},
+            "Sala della Mola": {"MO": 8, "Merci": 8},
+            "Sala delle Evocazioni": {"Magia": 3},
+            "Salotto": {"Influenza": 4},
+            "Sauna": {"MO": 3, "Influenza": 3},
+            "Scriptorium": {"MO": 5, "Influenza": 5, "Magia": 5, "Manodopera": 5, "Merci": 5},
+            "Serra": {"MO": 12, "Influenza": 12, "Merci": 12},
+            "Specola": {"MO": 5, "Influenza": 5, "Magia": 5},
+            "Stallaggio": {"MO": 8, "Manodopera": 8, "Merci": 8},
+            "Stamperia": {"MO": 8, "Influenza": 8, "Manodopera": 8, "Merci": 8},
+            "Stanza da Cucito": {"MO": 10, "Influenza": 10, "Merci": 10},
+            "Stanza della Cova": {"MO": 5, "Merci": 5},
+            "Stanza dello Scrutamento": {"MO": 2, "Influenza": 2},
+            "Statua": {"MO": 1, "Influenza": 1},
+            "Terreno Agricolo": {"MO": 10, "Merci": 10},
+            "Terreno Sepolcrale": {"MO": 4, "Influenza": 4},
+            "Trasgressori": {"MO": 2, "Influenza": 2, "Merci": 2},
+            "Vetrina": {"MO": 5, "Influenza": 5, "Manodopera": 5, "Merci": 5},
+        }
+    return _game_database
+
+
+def __getattr__(name):
+    if name == "GAME_DATABASE":
+        return game_database()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Ordine di rotazione della strategia uniforme
+RESOURCE_CYCLE = ["MO", "Merci", "Influenza", "Magia", "Manodopera"]
 
 DEFAULT_GUILD_CONFIG = {
     "name": "Compagnia Mercenaria del Grifone",
@@ -153,15 +224,27 @@ DEFAULT_GUILD_CONFIG = {
     ],
 }
 
+
+def unit_type_for(name):
+    """Squadra o Stanza per un nome di GAME_DATABASE."""
+    if any(x in name for x in ["Soldati", "Arcieri", "Sacerdote", "Lacchè"]):
+        return "Squadra"
+    return "Stanza"
+
+
 # ==========================================
 # SUPPORT CLASSES
 # ==========================================
 
 
 class DiceRoller:
+    # Un dado senza bonus né log, dal pool pre-generato (vedi dice.py)
+    roll = staticmethod(roll_dice)
+
     @staticmethod
-    def roll_die(sides, bonus=0, reason="Tiro generico", silent=False):
-        roll = random.randint(1, sides)
+    def roll_die(sides, bonus=0, reason="Tiro generico", silent=False, purpose="ALTRO"):
+        # purpose: scopo del dado nella traccia (vedi trace.PURPOSES)
+        roll = roll_dice(sides, purpose)
         total = roll + bonus
         sign = "+" if bonus >= 0 else ""
         log_str = f"d{sides}: [{roll}] {sign}{bonus} = {total}"
@@ -201,7 +284,7 @@ class DiceRoller:
             extra_txt = f" (Bonus Extra +{extra_bonus})" if extra_bonus else ""
             print(f"   💡 Skill: {best_skill} ({mod_str}){extra_txt}")
 
-        roll = random.randint(1, 20)
+        roll = roll_dice(20, "PROVA")
         total = roll + final_mod
 
         is_success = False
@@ -253,10 +336,12 @@ class DowntimeUnit:
 
 
 class Guild:
-    def __init__(self, name):
+    def __init__(self, name, event_table="mercenari"):
         self.name = name
         self.units = []
         self.active_effects = []
+        # Chiave di EVENT_TABLES usata da process_event
+        self.event_table = event_table
 
     def add_unit(self, unit):
         for existing in self.units:
@@ -318,11 +403,13 @@ class ResourceBank:
         }
         self.day_counter = 1
         self.event_chance = 20
-        self.history = []
         self.guild_control_lost = False
 
         # Individual save file for this bank / guild
         self.save_file = Path(save_file) if save_file is not None else DEFAULT_SAVE_FILE
+        self._archive = None
+        # Finestra recente dello storico: None finché non serve (vedi history)
+        self._history = None
 
     def modify(self, resource, amount, reason=""):
         """
@@ -359,21 +446,83 @@ class ResourceBank:
 
         return actual_amount, cost_gp
 
+    @property
+    def archive(self):
+        """Archivio completo dello storico (None per le bank solo in memoria)."""
+        return self.ensure_archive()
+
+    def archive_records(self):
+        """
+        Voci nell'archivio dello storico, senza aprirlo né crearlo (None se
+        l'archivio non c'è ancora o la bank è solo in memoria).
+        """
+        if self._archive is not None:
+            return len(self._archive)
+        if self.save_file is None:
+            return None
+        from guild_downtime.archive import HistoryArchive
+
+        archive = HistoryArchive.for_save(self.save_file)
+        return len(archive) if archive.exists() else None
+
+    def ensure_archive(self):
+        """
+        Apre l'archivio dello storico e lo restituisce (None senza salvataggio).
+        Alla prima apertura di un salvataggio senza archivio vi copia lo storico attuale.
+        """
+        if self.save_file is None:
+            return None
+        if self._archive is None:
+            from guild_downtime.archive import HistoryArchive, backfill
+
+            archive = HistoryArchive.for_save(self.save_file)
+            if not archive.exists() and self._history:
+                backfill(archive, self._history)
+            self._archive = archive
+        return self._archive
+
+    @property
+    def history(self):
+        """
+        Voci recenti ("Giorno N: testo"), al massimo HISTORY_WINDOW. Con un
+        salvataggio lo storico sta solo nell'archivio: la finestra si legge al
+        primo accesso, non all'apertura della gilda.
+        """
+        if self._history is None:
+            archive = self.archive
+            entries = archive.tail(HISTORY_WINDOW) if archive is not None else ()
+            self._history = [f"Giorno {e['day']}: {e['text']}" for e in entries]
+        return self._history
+
+    @history.setter
+    def history(self, lines):
+        self._history = lines
+
     def add_log(self, text):
+        archive = self.archive
+        if archive is not None:
+            archive.append(self.day_counter, text)
         prefix = f"Giorno {self.day_counter}:"
         self.history.append(f"{prefix} {text}")
-        if len(self.history) > 200:
-            self.history.pop(0)
+        if len(self.history) > HISTORY_WINDOW:
+            del self.history[:-HISTORY_WINDOW]
 
     def save_state(self, guild: Guild):
+        # Bank senza file (es. rami/prove in memoria): niente da salvare
+        if self.save_file is None:
+            return
+        if self._archive is not None:
+            self._archive.flush()
+        self.save_file.parent.mkdir(parents=True, exist_ok=True)
         data = {
-            "resources": self.resources,
-            "character_stats": self.character_stats,
+            "schema_version": SCHEMA_VERSION,
+            "guild_name": guild.name,
+            "event_table": guild.event_table,
             "day_counter": self.day_counter,
             "event_chance": self.event_chance,
-            "history": self.history,
             "guild_control_lost": self.guild_control_lost,
-            "guild_name": guild.name,
+            "resources": self.resources,
+            "character_stats": self.character_stats,
             "guild_units": [u.to_dict() for u in guild.units],
             "active_effects": guild.active_effects,
         }
@@ -408,9 +557,9 @@ def handle_mercenary_event(d100, engine, silent=False):
         name_evt = "Risultati Impressionanti"
         if not silent:
             print(f"📜 {name_evt}")
-        inf, _, _ = DiceRoller.roll_die(4, 0, silent=True)
-        man, _, _ = DiceRoller.roll_die(2, 0, silent=True)
-        days, _, _ = DiceRoller.roll_die(6, 0, silent=True)
+        inf = DiceRoller.roll(4, "EFFETTO EVENTO")
+        man = DiceRoller.roll(2, "EFFETTO EVENTO")
+        days = DiceRoller.roll(6, "EFFETTO EVENTO")
 
         bank.resources["Influenza"] += inf
         bank.resources["Manodopera"] += man
@@ -424,9 +573,9 @@ def handle_mercenary_event(d100, engine, silent=False):
         name_evt = "Guadagno Inaspettato"
         if not silent:
             print(f"📜 {name_evt}")
-        d10, _, _ = DiceRoller.roll_die(10, 0, silent=True)
+        d10 = DiceRoller.roll(10, "EFFETTO EVENTO")
         mo = d10 * 10
-        merci, _, _ = DiceRoller.roll_die(6, 0, silent=True)
+        merci = DiceRoller.roll(6, "EFFETTO EVENTO")
 
         bank.resources["MO"] += mo
         bank.resources["Magia"] += 1
@@ -451,8 +600,8 @@ def handle_mercenary_event(d100, engine, silent=False):
         if success:
             result_str = "Sedata. Nessuna perdita."
         else:
-            li, _, _ = DiceRoller.roll_die(4, 0, silent=True)
-            lm, _, _ = DiceRoller.roll_die(2, 0, silent=True)
+            li = DiceRoller.roll(4, "EFFETTO EVENTO")
+            lm = DiceRoller.roll(2, "EFFETTO EVENTO")
             bank.modify("Influenza", -li)
             bank.modify("Manodopera", -lm)
             result_str = f"FALLITO. Persi {li} Inf, {lm} Man."
@@ -462,12 +611,18 @@ def handle_mercenary_event(d100, engine, silent=False):
         name_evt = "Rivalità"
         if not silent:
             print(f"📜 {name_evt}")
-        d_dur, _, str_d = DiceRoller.roll_die(10, 0, silent=True)
+        d_dur, _, str_d = DiceRoller.roll_die(
+            10, 0, silent=True, purpose="EFFETTO EVENTO"
+        )
         guild.add_effect("Rivalità (-5)", -5, d_dur)
-        d_ch, _, str_ch = DiceRoller.roll_die(100, 0, silent=True)
+        d_ch, _, str_ch = DiceRoller.roll_die(
+            100, 0, silent=True, purpose="EFFETTO EVENTO"
+        )
         extra_res = ""
         if d_ch > 50:
-            loss, _, str_loss = DiceRoller.roll_die(4, 0, silent=True)
+            loss, _, str_loss = DiceRoller.roll_die(
+                4, 0, silent=True, purpose="EFFETTO EVENTO"
+            )
             bank.modify("Influenza", -loss)
             extra_res = f" | Danno Extra: -{loss} Inf (d100[{d_ch}]>50, d4[{loss}])"
         else:
@@ -480,11 +635,11 @@ def handle_mercenary_event(d100, engine, silent=False):
         name_evt = "Scandalo"
         if not silent:
             print(f"📜 {name_evt}")
-        d1, _, _ = DiceRoller.roll_die(4, 0, silent=True)
-        d2, _, _ = DiceRoller.roll_die(4, 0, silent=True)
+        d1 = DiceRoller.roll(4, "EFFETTO EVENTO")
+        d2 = DiceRoller.roll(4, "EFFETTO EVENTO")
         days = d1 + d2
         guild.add_effect("Scandalo (-5)", -5, days)
-        li, _, _ = DiceRoller.roll_die(2, 0, silent=True)
+        li = DiceRoller.roll(2, "EFFETTO EVENTO")
         bank.modify("Influenza", -li)
         check_str = f"Durata 2d4[{d1}+{d2}]={days}"
         result_str = f"Penalità -5 ({days}gg). Persi {li} Inf."
@@ -502,7 +657,7 @@ def handle_mercenary_event(d100, engine, silent=False):
             guild.add_effect("Vittoria Duello (+2)", 2, 7)
             result_str = "VITTORIA. Buff +2 (7gg)."
         else:
-            lm, _, _ = DiceRoller.roll_die(2, 0, silent=True)
+            lm = DiceRoller.roll(2, "EFFETTO EVENTO")
             bank.modify("Manodopera", -lm)
             result_str = f"SCONFITTA. Persi {lm} Man."
 
@@ -523,8 +678,8 @@ def handle_mercenary_event(d100, engine, silent=False):
             bank.modify("Manodopera", -1)
             result_str = "EVITATO. -1 Man (Epurazione)."
         else:
-            li, _, _ = DiceRoller.roll_die(2, 0, silent=True)
-            lm, _, _ = DiceRoller.roll_die(2, 0, silent=True)
+            li = DiceRoller.roll(2, "EFFETTO EVENTO")
+            lm = DiceRoller.roll(2, "EFFETTO EVENTO")
             bank.modify("Manodopera", -lm)
             bank.modify("Influenza", -li)
             result_str = f"AVVENUTO. Persi {li} Inf, {lm} Man."
@@ -566,6 +721,24 @@ def handle_mercenary_event(d100, engine, silent=False):
     bank.add_log(f"EVENTO ({d100} -> {name_evt})")
     bank.add_log(f"CHECK: {check_str}")
     bank.add_log(f"RISULTATO: {result_str}")
+    return name_evt
+
+
+# Tabelle eventi referenziabili dai tipi di gilda (configs/*.yaml, chiave event_table)
+EVENT_TABLES = {"mercenari": handle_mercenary_event}
+
+# Nomi restituiti da handle_mercenary_event. I codici evento dell'archivio
+# dello storico seguono quest'ordine: nuovi tipi vanno aggiunti in fondo
+EVENT_TYPES = (
+    "Risultati Impressionanti",
+    "Guadagno Inaspettato",
+    "Rissa",
+    "Rivalità",
+    "Scandalo",
+    "Duello",
+    "Scisma",
+    "Ammutinamento",
+)
 
 
 # ==========================================
@@ -574,56 +747,167 @@ def handle_mercenary_event(d100, engine, silent=False):
 
 
 class GameEngine:
-    def __init__(self, save_file=None, guild_name=None):
+    def __init__(self, save_file=None, guild_name=None, guild_type=None):
         """
         save_file: path of the JSON used for this guild.
         guild_name: name to use when creating a new guild (ignored if a save exists).
+        guild_type: configs/<guild_type>.yaml for a new guild (default: "default").
         """
         self.bank = ResourceBank(save_file=save_file)
         saved = self.bank.load_state()
 
         if saved:
-            # Load existing guild
-            name = saved.get("guild_name", DEFAULT_GUILD_CONFIG["name"])
-            self.guild = Guild(name)
+            if saved.get("schema_version") != SCHEMA_VERSION:
+                # Salvataggio di una versione precedente: migrato in memoria
+                # (riscritto alla versione corrente al prossimo salvataggio)
+                from guild_downtime.migrate import upgrade
+
+                saved, _ = upgrade(saved)
+            self.guild = Guild(saved["guild_name"], saved["event_table"])
             self.bank.resources = saved["resources"]
-            self.bank.character_stats = saved.get(
-                "character_stats", self.bank.character_stats
-            )
+            self.bank.character_stats = saved["character_stats"]
             self.bank.day_counter = saved["day_counter"]
             self.bank.event_chance = saved["event_chance"]
-            self.bank.history = saved["history"]
-            self.bank.guild_control_lost = saved.get("guild_control_lost", False)
-            self.guild.active_effects = saved.get("active_effects", [])
-
-            # Merge stats (add new default keys if missing)
-            saved_stats = saved.get("character_stats", {})
-            for k, v in self.bank.character_stats.items():
-                if k not in saved_stats:
-                    saved_stats[k] = v
-            self.bank.character_stats = saved_stats
-
-            for u in saved["guild_units"]:
-                qty = u.get("qty", 1)
-                self.guild.add_unit(
-                    DowntimeUnit(u["name"], u["type"], u["bonuses"], qty)
-                )
+            self.bank.guild_control_lost = saved["guild_control_lost"]
+            self.guild.active_effects = saved["active_effects"]
+            # Unità già uniche nello schema corrente: niente add_unit
+            self.guild.units = [
+                DowntimeUnit(u["name"], u["type"], u["bonuses"], u["qty"])
+                for u in saved["guild_units"]
+            ]
+            # Lo storico resta nell'archivio fino al primo accesso. I salvataggi
+            # precedenti alla versione 3 lo contengono ancora: si archivia
+            # (se l'archivio non c'è) e si tiene solo la finestra recente
+            history = saved.get("history")
+            if history:
+                self.bank.history = history
+                self.bank.ensure_archive()
+                del history[:-HISTORY_WINDOW]
         else:
-            # Create new guild from default config
-            name = guild_name or DEFAULT_GUILD_CONFIG["name"]
-            self.guild = Guild(name)
-            for t in DEFAULT_GUILD_CONFIG["teams"]:
-                qty = t.get("qty", 1)
-                self.guild.add_unit(
-                    DowntimeUnit(t["name"], t["type"], t["bonuses"], qty)
-                )
-            for r in DEFAULT_GUILD_CONFIG["rooms"]:
-                qty = r.get("qty", 1)
-                self.guild.add_unit(
-                    DowntimeUnit(r["name"], r["type"], r["bonuses"], qty)
-                )
+            # Create new guild from its guild type (configs/<guild_type>.yaml)
+            from guild_downtime.config import load_guild_type
+
+            gtype = load_guild_type(guild_type or "default")
+            self.guild = Guild(guild_name or gtype.guild_name, gtype.event_table)
+            self.bank.resources = dict(gtype.resources)
+            self.bank.character_stats = dict(gtype.character_stats)
+            for name, unit_type, bonuses, qty in gtype.units:
+                self.guild.add_unit(DowntimeUnit(name, unit_type, dict(bonuses), qty))
+
+        self._init_runtime()
+
+    def _init_runtime(self, days_absent=0):
+        """Stato non salvato: assenza corrente, ultimo evento, annullamento, campionamento."""
+        self.days_absent = days_absent
+        self.last_event = None
+        self._timeline = None
+        # Importance sampling della fascia Ammutinamento (vedi guild_downtime.montecarlo):
+        # probabilità forzata della fascia 96-100 fino al primo Ammutinamento,
+        # e peso di verosimiglianza accumulato
+        self.mutiny_bias = None
+        self.likelihood = 1.0
+
+    @classmethod
+    def from_snapshot(cls, snapshot, save_file=None):
+        """
+        Crea un engine direttamente da uno snapshot, senza leggere file.
+        Con save_file=None lo stato vive solo in memoria (prove, Monte Carlo).
+        """
+        engine = cls.__new__(cls)
+        engine.bank = ResourceBank(save_file=save_file)
+        if save_file is None:
+            engine.bank.save_file = None
+        engine.guild = Guild(snapshot.guild_name, snapshot.event_table)
+        snapshot.restore_into(engine.bank, engine.guild)
+        engine._init_runtime(snapshot.days_absent)
+        return engine
+
+    # ------------------------------------------
+    # Snapshot, annullamento e rami
+    # ------------------------------------------
+
+    @property
+    def timeline(self):
+        if self._timeline is None:
+            from guild_downtime.state import StateTimeline
 
-        self.days_absent = 0
+            self._timeline = StateTimeline()
+        return self._timeline
+
+    def snapshot(self, label=""):
+        from guild_downtime.state import StateSnapshot
+
+        return StateSnapshot.capture(self.bank, self.guild, self.days_absent, label)
+
+    def restore(self, snapshot):
+        snapshot.restore_into(self.bank, self.guild)
+        self.days_absent = snapshot.days_absent
+
+    def rewind(self, snapshot):
+        """
+        Come restore(), ma riporta anche l'archivio dello storico alla lunghezza
+        che aveva allo snapshot: le voci scritte dopo spariscono.
+        """
+        self.restore(snapshot)
+        if snapshot.history_records is None:
+            return
+        archive = self.bank.archive
+        if archive is not None:
+            archive.truncate(snapshot.history_records)
+
+    def record_action(self, label):
+        """Memorizza lo stato prima di un'azione, per poterla annullare."""
+        self.timeline.push(self.snapshot(label))
+
+    def record_if_changed(self, snapshot):
+        """
+        Memorizza `snapshot`, preso prima di un'azione, solo se l'azione ha
+        cambiato lo stato (un'azione annullata non lascia voci da annullare).
+        """
+        after = self.snapshot()
+        if (
+            snapshot.diff(after)
+            or snapshot.units != after.units
+            or snapshot.history != after.history
+        ):
+            self.timeline.push(snapshot)
+            return True
+        return False
+
+    def undo(self, n=1):
+        """
+        Annulla le ultime n azioni registrate. Restituisce lo snapshot ripristinato.
+        Anche l'archivio dello storico torna alla lunghezza che aveva allo snapshot.
+        """
+        snap = self.timeline.pop(n)
+        if snap is not None:
+            self.rewind(snap)
+            self.bank.save_state(self.guild)
+        return snap
+
+    def fork_branch(self, name):
+        self.timeline.fork(name, self.snapshot(name))
+
+    def diff_branch(self, name, other=None):
+        """Differenze tra il ramo `name` e il ramo `other` (o lo stato attuale)."""
+        base = self.timeline.get(name)
+        if base is None:
+            return None
+        target = self.timeline.get(other) if other else self.snapshot()
+        if target is None:
+            return None
+        return base.diff(target)
+
+    def promote_branch(self, name):
+        """Il ramo diventa lo stato attuale (salvato). L'azione è annullabile."""
+        snap = self.timeline.get(name)
+        if snap is None:
+            return False
+        self.record_action(f"Promozione ramo {name}")
+        # Come undo: anche l'archivio torna alla lunghezza del ramo
+        self.rewind(snap)
+        self.bank.save_state(self.guild)
+        return True
 
     def clear(self):
         os.system("cls" if os.name == "nt" else "clear")
@@ -677,10 +961,17 @@ class GameEngine:
         bonus = self.bank.character_stats.get("Autorità", 4)
 
         if not silent:
+            from guild_downtime.control import regain_probability
+
+            p = regain_probability(bonus, dc)
             print("\n🔒 TENTATIVO DI RIPRENDERE IL CONTROLLO")
-            print(f"   Tiro: d20 + Autorità ({bonus}) vs CD {dc}")
+            print(f"   Tiro: d20 + Autorità ({bonus}) vs CD {dc} (probabilità {p:.0%})")
+            if p == 0:
+                print("   💀 Con questa assenza la ripresa è impossibile.")
 
-        total, natural, _ = DiceRoller.roll_die(20, bonus, "Tiro Controllo", silent)
+        total, natural, _ = DiceRoller.roll_die(
+            20, bonus, "Tiro Controllo", silent, "CONTROLLO"
+        )
         success = total >= dc
         result_str = "SUCCESSO" if success else "FALLIMENTO"
 
@@ -700,17 +991,25 @@ class GameEngine:
         return success
 
     def process_event(self, silent=False):
+        self.last_event = None
         if self.bank.guild_control_lost:
             return False
-        roll, _, _ = DiceRoller.roll_die(100, 0, "Check Probabilità Evento", silent)
+        if silent:
+            # Un tiro al giorno nelle simulazioni: niente stringa di log
+            roll = roll_dice(100, "PROBABILITÀ EVENTO")
+        else:
+            roll, _, _ = DiceRoller.roll_die(
+                100, 0, "Check Probabilità Evento", purpose="PROBABILITÀ EVENTO"
+            )
         threshold = self.bank.event_chance
         if not silent:
             print(f"   (Soglia attuale: {threshold}%)")
 
         if roll <= threshold:
             self.bank.event_chance = 20
-            ev_roll, _, _ = DiceRoller.roll_die(100, 0, "Tabella Mercenari", silent)
-            handle_mercenary_event(ev_roll, self, silent)
+            ev_roll = self._roll_event_table(silent)
+            handle_event = EVENT_TABLES[self.guild.event_table]
+            self.last_event = handle_event(ev_roll, self, silent)
             return True
         else:
             self.bank.event_chance = min(95, self.bank.event_chance + 5)
@@ -718,9 +1017,46 @@ class GameEngine:
                 print("   ✅ Nessun evento.")
             return False
 
+    def _roll_event_table(self, silent=False):
+        if self.mutiny_bias is None:
+            ev_roll, _, _ = DiceRoller.roll_die(
+                100, 0, "Tabella Mercenari", silent, "TABELLA EVENTI"
+            )
+            return ev_roll
+        # Fascia 96-100 (5%) campionata con probabilità mutiny_bias, peso corretto
+        q = self.mutiny_bias
+        if derive("AMMUTINAMENTO", lambda: random.random() < q):
+            self.likelihood *= 0.05 / q
+            # Dopo il primo colpo si torna alla tabella vera: i pesi restano contenuti
+            self.mutiny_bias = None
+            return 95 + roll_dice(5, "TABELLA EVENTI")
+        self.likelihood *= 0.95 / (1.0 - q)
+        return roll_dice(95, "TABELLA EVENTI")
+
+    def checkpoint_for_save(self):
+        """Checkpoint di simulazione associato al file di salvataggio (None se in memoria)."""
+        if self.bank.save_file is None:
+            return None
+        from guild_downtime.checkpoint import SimulationCheckpoint
+
+        path = self.bank.save_file.with_name(
+            self.bank.save_file.stem + ".checkpoint.json"
+        )
+        return SimulationCheckpoint(path)
+
     def run_simulation(self):
         self.header()
         print("\n--- SIMULAZIONE MULTI-GIORNO ---")
+
+        checkpoint = self.checkpoint_for_save()
+        if checkpoint is not None and checkpoint.exists():
+            print("\nTrovata una simulazione interrotta. Vuoi riprenderla? (s/n)")
+            if input("> ").lower() == "s":
+                print("\nRipresa simulazione...")
+                self._finish_simulation(self.resume_simulation(checkpoint))
+                return
+            checkpoint.clear()
+
         try:
             days = int(input("Quanti giorni vuoi simulare? "))
             if days <= 0:
@@ -728,8 +1064,6 @@ class GameEngine:
         except (ValueError, EOFError):
             return
 
-        start_res = self.bank.resources.copy()
-
         is_leaving = False
         if self.days_absent == 0:
             print(f"\nPartirai lasciando la città durante questi {days} giorni? (s/n)")
@@ -749,13 +1083,12 @@ class GameEngine:
         strat = input("> ").lower()
 
         target_res = None
-        res_cycle = ["MO", "Merci", "Influenza", "Magia", "Manodopera"]
 
         if strat == "f":
-            for i, r in enumerate(res_cycle, 1):
+            for i, r in enumerate(RESOURCE_CYCLE, 1):
                 print(f"[{i}] {r}")
             try:
-                target_res = res_cycle[int(input("> ")) - 1]
+                target_res = RESOURCE_CYCLE[int(input("> ")) - 1]
             except (ValueError, IndexError, EOFError):
                 return
 
@@ -764,82 +1097,329 @@ class GameEngine:
         print("[2] Tira d20")
         sim_mode = input("> ")
 
+        trace_path = None
+        if self.bank.save_file is not None:
+            print("\nRegistrare la traccia dei dadi per il replay? (s/n)")
+            if input("> ").lower() == "s":
+                save_file = self.bank.save_file
+                trace_path = save_file.with_name(
+                    f"{save_file.stem}-giorno{self.bank.day_counter}.trace"
+                )
+
         print(f"\nAvvio simulazione {days} giorni...")
-        self.bank.add_log(f"--- INIZIO SIMULAZIONE {days} GIORNI ---")
+        before = self.snapshot("simulazione")
+        try:
+            if trace_path is None:
+                summary = self.simulate(
+                    days, strat, target_res, sim_mode, is_leaving, checkpoint=checkpoint
+                )
+            else:
+                # Con la traccia niente checkpoint: la corsa va registrata per intero
+                from guild_downtime.trace import record_simulation
 
-        events_happened = 0
-        total_spent_gp = 0
+                summary = record_simulation(
+                    self, trace_path, days, strat, target_res, sim_mode, is_leaving
+                )
+                print(f"   Traccia dei dadi: {trace_path.name}")
+        except KeyboardInterrupt:
+            self._interrupted_simulation(before, checkpoint if trace_path is None else None)
+            if trace_path is not None:
+                print("   La traccia non è stata salvata.")
+            input("\nPremi INVIO...")
+            return
+        self._finish_simulation(summary)
 
-        for _ in range(days):
-            if self.days_absent > 0 or is_leaving:
-                self.days_absent += 1
+    def _interrupted_simulation(self, before, checkpoint):
+        """
+        Dopo un'interruzione lo stato in memoria e l'archivio sono a metà di un
+        giorno qualsiasi: si torna all'ultimo checkpoint (da cui la corsa si può
+        riprendere senza voci doppie nello storico) o, se non ce n'è, allo
+        stato di prima della simulazione. Lo stato ripristinato viene salvato.
+        """
+        from guild_downtime.state import StateSnapshot
 
-            if self.bank.guild_control_lost:
-                if self.attempt_regain_control(silent=True):
-                    self.bank.day_counter += 1
-                    continue
-                else:
-                    self.bank.day_counter += 1
-                    continue
+        data = checkpoint.load() if checkpoint is not None else None
+        if data is not None:
+            self.rewind(StateSnapshot.from_dict(data["state"]))
+            done = data["progress"]["done"]
+            print(
+                f"\n⏸️  Simulazione interrotta. Stato riportato al checkpoint "
+                f"(giorno {done}): potrai riprenderla da lì."
+            )
+        else:
+            self.rewind(before)
+            print("\n⏸️  Simulazione interrotta. Stato riportato a prima della simulazione.")
+        self.bank.save_state(self.guild)
 
-            if self.process_event(silent=True):
-                events_happened += 1
-                if self.bank.guild_control_lost:
-                    self.bank.day_counter += 1
-                    continue
+    def _finish_simulation(self, summary):
+        self.bank.save_state(self.guild)
 
-            self.guild.process_daily_effects()
+        print("\n--- FINE SIMULAZIONE ---")
+        print(f"Eventi accaduti: {summary['events']}")
+        print(f"SPESE OPERATIVE (Costi conseguimento): {summary['spent_gp']} mo")
+        print("\nBILANCIO NETTO (Finale - Iniziale):")
+        for k, v in summary["net_gains"].items():
+            fmt = f"{v:.2f}" if k == "MO" else f"{v}"
+            print(f"  - {k}: {fmt}")
 
-            if strat == "u":
-                daily_res = res_cycle[self.bank.day_counter % 5]
-            else:
-                daily_res = target_res
+        if self.bank.guild_control_lost:
+            print(
+                "\n⚠️ ATTENZIONE: La simulazione è terminata con la Gilda fuori controllo!"
+            )
+            p_recover, hopeless = summary["control_outlook"]
+            print(f"   Probabilità di riprenderlo entro un anno: {p_recover:.1%}")
+            if hopeless:
+                print("   💀 Ripresa praticamente impossibile se l'assenza continua.")
+        input("\nPremi INVIO...")
 
-            bonus, _ = self.guild.calculate_total_bonus(daily_res)
+    def simulate(
+        self,
+        days,
+        strategy="u",
+        target_res=None,
+        sim_mode="1",
+        is_leaving=False,
+        checkpoint=None,
+        writers=(),
+    ):
+        """
+        Simulazione multi-giorno non interattiva (niente input, niente salvataggio).
 
-            if bonus == 0:
-                roll = 10
-            else:
-                roll = random.randint(1, 20) if sim_mode == "2" else 10
+        strategy: "u" rotazione uniforme, altrimenti risorsa fissa `target_res`.
+        sim_mode: "1" prendi 10, "2" tira d20.
+        checkpoint: SimulationCheckpoint opzionale per scritture periodiche.
+        writers: consumatori dei record giornalieri (vedi guild_downtime.records).
+        Restituisce un riepilogo: eventi, spese GP, bilancio netto, controllo perso.
+        """
+        records = self.iter_simulation(
+            days, strategy, target_res, sim_mode, is_leaving, checkpoint
+        )
+        return self._drain_records(records, writers)
+
+    def iter_simulation(
+        self,
+        days,
+        strategy="u",
+        target_res=None,
+        sim_mode="1",
+        is_leaving=False,
+        checkpoint=None,
+    ):
+        """
+        Come simulate(), ma produce un record per giorno man mano che viene simulato.
+        Il riepilogo finale è il valore di ritorno del generatore.
+        """
+        progress = {
+            "days": days,
+            "strategy": strategy,
+            "target_res": target_res,
+            "sim_mode": sim_mode,
+            "is_leaving": is_leaving,
+            "done": 0,
+            "events": 0,
+            "event_types": {},
+            "spent_gp": 0,
+            "control_losses": 0,
+            "days_locked": 0,
+            "start_res": self.bank.resources.copy(),
+        }
+        self.bank.add_log(f"--- INIZIO SIMULAZIONE {days} GIORNI ---")
+        return self._simulation_loop(progress, checkpoint)
 
-            total_roll = roll + bonus
-            earned = math.floor(total_roll / 10)
-            if daily_res == "MO":
-                earned = total_roll / 10
+    def resume_simulation(self, checkpoint, writers=()):
+        """Riprende una simulazione dal checkpoint, con lo stesso stato casuale."""
+        from guild_downtime import dice
+        from guild_downtime.state import StateSnapshot
 
-            actual_earned, cost_gp = self.bank.modify(daily_res, earned)
-            total_spent_gp += cost_gp
+        data = checkpoint.load()
+        if data is None:
+            return None
+        # Le voci scritte dopo il checkpoint verranno riscritte dalla ripresa
+        self.rewind(StateSnapshot.from_dict(data["state"]))
+        random.setstate(data["rng_state"])
+        dice.setstate(data.get("dice_state", {}))
+        return self._drain_records(
+            self._simulation_loop(data["progress"], checkpoint), writers
+        )
 
-            if actual_earned > 0:
-                cost_str = f" (Costo {cost_gp} mo)" if cost_gp > 0 else ""
-                self.bank.add_log(f"ATTIVITÀ: {daily_res} +{actual_earned}{cost_str}")
-            elif earned > 0 and actual_earned == 0:
-                self.bank.add_log(
-                    f"ATTIVITÀ: {daily_res} FALLITA (Fondi Insufficienti)"
+    @staticmethod
+    def _drain_records(records, writers):
+        while True:
+            try:
+                record = next(records)
+            except StopIteration as stop:
+                return stop.value
+            for w in writers:
+                w.write(record)
+
+    def _simulation_loop(self, progress, checkpoint):
+        days = progress["days"]
+        # Checkpoint salvati prima del conteggio per tipo
+        event_types = progress.setdefault("event_types", {})
+        while progress["done"] < days:
+            if self.bank.guild_control_lost:
+                record = self._simulate_locked_span(
+                    days - progress["done"], progress["is_leaving"]
+                )
+            else:
+                record = self._simulate_day(
+                    progress["strategy"],
+                    progress["target_res"],
+                    progress["sim_mode"],
+                    progress["is_leaving"],
                 )
+            progress["done"] += record["span"]
+            if record["event"] is not None:
+                progress["events"] += 1
+                event_types[record["event"]] = event_types.get(record["event"], 0) + 1
+            progress["spent_gp"] += record["cost_gp"]
+            if record["resource"] is None:
+                if record["event"] is None:
+                    progress["days_locked"] += record["span"]
+                elif not record["control"]:
+                    progress["control_losses"] += 1
+            yield record
+            # Dopo lo yield: il record del giorno è già stato consumato
+            if checkpoint is not None and checkpoint.due(progress["done"]):
+                checkpoint.save(self, progress)
+
+        start_res = progress["start_res"]
+        net_gains = {k: v - start_res[k] for k, v in self.bank.resources.items()}
 
-            self.bank.day_counter += 1
+        self.bank.add_log(
+            f"--- FINE SIMULAZIONE (Netto: {net_gains}, Spese: {progress['spent_gp']}) ---"
+        )
+        if checkpoint is not None:
+            checkpoint.clear()
+
+        summary = {
+            "days": days,
+            "events": progress["events"],
+            "event_types": event_types,
+            "spent_gp": progress["spent_gp"],
+            "net_gains": net_gains,
+            "control_lost": self.bank.guild_control_lost,
+            "control_losses": progress["control_losses"],
+            "days_locked": progress["days_locked"],
+            "control_outlook": None,
+        }
+        if self.bank.guild_control_lost:
+            summary["control_outlook"] = self.control_outlook(progress["is_leaving"])
+        return summary
 
-        net_gains = {k: v - start_res[k] for k, v in self.bank.resources.items()}
+    def control_outlook(self, is_leaving=False, horizon=365):
+        """(P ripresa entro `horizon` giorni, praticamente impossibile?) se l'assenza continua."""
+        from guild_downtime.control import recovery_outlook
 
+        bonus = self.bank.character_stats.get("Autorità", 4)
+        growing = self.days_absent > 0 or is_leaving
+        return recovery_outlook(bonus, self.days_absent, growing, horizon)
+
+    def _simulate_locked_span(self, max_days, is_leaving):
+        """
+        Tutto il periodo senza controllo in un passo: il giorno della ripresa è
+        campionato dalla sua distribuzione esatta (vedi guild_downtime.control)
+        invece di tirare d20 + Autorità un giorno alla volta.
+        """
+        from guild_downtime.control import attempt_dc, sample_recovery
+
+        start_day = self.bank.day_counter
+        bonus = self.bank.character_stats.get("Autorità", 4)
+        growing = self.days_absent > 0 or is_leaving
+        # Con la traccia dei dadi il giorno campionato è registrato come valore derivato
+        attempt = derive(
+            "RIPRESA",
+            lambda: sample_recovery(bonus, self.days_absent, growing, max_days),
+        )
+        span = attempt if attempt is not None else max_days
+        last_dc = attempt_dc(self.days_absent, growing, span)
+
+        if growing:
+            self.days_absent += span
+        self.bank.day_counter += span
+
+        if attempt is not None:
+            self.bank.guild_control_lost = False
+            self.bank.event_chance = 20
+            result_str = f"SUCCESSO al tentativo {attempt}"
+        else:
+            result_str = f"FALLIMENTO per {span} giorni"
         self.bank.add_log(
-            f"--- FINE SIMULAZIONE (Netto: {net_gains}, Spese: {total_spent_gp}) ---"
+            f"CHECK: TIRI CONTROLLO d20+{bonus} vs CD fino a {last_dc} -> {result_str}"
         )
-        self.bank.save_state(self.guild)
 
-        print("\n--- FINE SIMULAZIONE ---")
-        print(f"Eventi accaduti: {events_happened}")
-        print(f"SPESE OPERATIVE (Costi conseguimento): {total_spent_gp} mo")
-        print("\nBILANCIO NETTO (Finale - Iniziale):")
-        for k, v in net_gains.items():
-            fmt = f"{v:.2f}" if k == "MO" else f"{v}"
-            print(f"  - {k}: {fmt}")
+        return {
+            "day": start_day,
+            "span": span,
+            "resource": None,
+            "roll": None,
+            "earned": 0,
+            "cost_gp": 0,
+            "event": None,
+            "effects": "",
+            "control": attempt is not None,
+        }
 
-        if self.bank.guild_control_lost:
-            print(
-                "\n⚠️ ATTENZIONE: La simulazione è terminata con la Gilda fuori controllo!"
-            )
-        input("\nPremi INVIO...")
+    def _simulate_day(self, strategy, target_res, sim_mode, is_leaving):
+        """
+        Un giorno di simulazione con la gilda sotto controllo.
+        Restituisce il record del giorno.
+        """
+        record = {
+            "day": self.bank.day_counter,
+            "span": 1,
+            "resource": None,
+            "roll": None,
+            "earned": 0,
+            "cost_gp": 0,
+            "event": None,
+            "effects": "",
+            "control": True,
+        }
+        if self.days_absent > 0 or is_leaving:
+            self.days_absent += 1
+
+        if self.process_event(silent=True):
+            record["event"] = self.last_event
+            if self.bank.guild_control_lost:
+                record["control"] = False
+                self.bank.day_counter += 1
+                return record
+
+        self.guild.process_daily_effects()
+        record["effects"] = "|".join(e["name"] for e in self.guild.active_effects)
+
+        if strategy == "u":
+            daily_res = RESOURCE_CYCLE[self.bank.day_counter % 5]
+        else:
+            daily_res = target_res
+
+        bonus, _ = self.guild.calculate_total_bonus(daily_res)
+
+        if bonus == 0:
+            roll = 10
+        else:
+            roll = roll_dice(20, "GENERAZIONE") if sim_mode == "2" else 10
+
+        total_roll = roll + bonus
+        earned = math.floor(total_roll / 10)
+        if daily_res == "MO":
+            earned = total_roll / 10
+
+        actual_earned, cost_gp = self.bank.modify(daily_res, earned)
+
+        if actual_earned > 0:
+            cost_str = f" (Costo {cost_gp} mo)" if cost_gp > 0 else ""
+            self.bank.add_log(f"ATTIVITÀ: {daily_res} +{actual_earned}{cost_str}")
+        elif earned > 0 and actual_earned == 0:
+            self.bank.add_log(f"ATTIVITÀ: {daily_res} FALLITA (Fondi Insufficienti)")
+
+        record["resource"] = daily_res
+        record["roll"] = roll
+        record["earned"] = actual_earned
+        record["cost_gp"] = cost_gp
+        self.bank.day_counter += 1
+        return record
 
     def generate_capital_single(self):
         if self.bank.guild_control_lost:
@@ -872,7 +1452,9 @@ class GameEngine:
         choice = input("> ").lower()
 
         if choice == "t":
-            total, roll, _ = DiceRoller.roll_die(20, bonus, f"Generazione {res_type}")
+            total, roll, _ = DiceRoller.roll_die(
+                20, bonus, f"Generazione {res_type}", purpose="GENERAZIONE"
+            )
             log_chk = f"d20[{roll}]+{bonus}"
         else:
             total = 10 + bonus
@@ -908,21 +1490,17 @@ class GameEngine:
         self.header()
         print("\n--- AGGIUNGI UNITÀ ---")
         query = input("Nome unità: ").strip()
+        import difflib
+
         matches = difflib.get_close_matches(
-            query, list(GAME_DATABASE.keys()), n=1, cutoff=0.6
+            query, list(game_database()), n=1, cutoff=0.6
         )
 
         if matches:
             found = matches[0]
-            data = GAME_DATABASE[found]
+            data = game_database()[found]
             print(f"✅ Trovato: {found} | Bonus: {data}")
-            u_type = (
-                "Squadra"
-                if any(
-                    x in found for x in ["Soldati", "Arcieri", "Sacerdote", "Lacchè"]
-                )
-                else "Stanza"
-            )
+            u_type = unit_type_for(found)
             try:
                 qty = int(input("Quantità (1): ") or 1)
             except (ValueError, EOFError):
@@ -981,6 +1559,124 @@ class GameEngine:
             except (ValueError, EOFError):
                 return
 
+    def undo_menu(self):
+        self.header()
+        print("\n--- ANNULLA AZIONI ---")
+        stack = list(self.timeline.undo_stack)
+        if not stack:
+            print("Nessuna azione da annullare.")
+            input("...")
+            return
+        for i, snap in enumerate(reversed(stack), 1):
+            print(f"[{i}] {snap.label} (Giorno {snap.day_counter})")
+        try:
+            n = int(input("\nQuante azioni annullare? (1): ") or 1)
+        except (ValueError, EOFError):
+            return
+        if n <= 0:
+            return
+        snap = self.undo(n)
+        print(f"↩️  Stato ripristinato a prima di: {snap.label}")
+        input("...")
+
+    def branches_menu(self):
+        self.header()
+        print("\n--- RAMI ---")
+        names = list(self.timeline.branches)
+        for name in names:
+            print(f"   * {name} (Giorno {self.timeline.branches[name].day_counter})")
+        if not names:
+            print("Nessun ramo.")
+        print("\n[F] Crea ramo dallo stato attuale")
+        print("[D] Confronta ramo con lo stato attuale")
+        print("[P] Promuovi ramo (diventa lo stato attuale)")
+        print("[C] Elimina ramo")
+        c = input("> ").lower()
+        if c not in ("f", "d", "p", "c"):
+            return
+        name = input("Nome ramo: ").strip()
+        if not name:
+            return
+
+        if c == "f":
+            self.fork_branch(name)
+            print(f"🌿 Ramo '{name}' creato.")
+        elif c == "d":
+            changes = self.diff_branch(name)
+            if changes is None:
+                print("❌ Ramo non trovato.")
+            elif not changes:
+                print("Nessuna differenza.")
+            else:
+                print(f"\n{'Campo':<28} {name:>12} {'attuale':>12}")
+                for field, (a, b) in changes.items():
+                    print(f"{field:<28} {str(a):>12} {str(b):>12}")
+        elif c == "p":
+            if self.promote_branch(name):
+                print(f"✅ Ramo '{name}' promosso.")
+            else:
+                print("❌ Ramo non trovato.")
+        elif c == "c":
+            print("🗑️  Eliminato." if self.timeline.delete(name) else "❌ Ramo non trovato.")
+        input("...")
+
+    def history_menu(self):
+        """Storico a pagine, dal più recente, con filtri per tipo, evento, giorni e testo."""
+        from guild_downtime.archive import KINDS, HistoryPager, InMemoryHistory
+
+        source = self.bank.archive
+        if source is None:
+            source = InMemoryHistory(self.bank.history)
+        pager = HistoryPager(source)
+        page = pager.pages - 1
+        while True:
+            self.header()
+            active = ", ".join(f"{k}={v}" for k, v in pager.filters.items() if v)
+            print(
+                f"\n--- STORICO --- Pagina {page + 1}/{pager.pages} ({pager.total} voci)"
+                + (f" | Filtri: {active}" if active else "")
+            )
+            for entry in pager.page(page):
+                print(f"Giorno {entry['day']}: {entry['text']}")
+
+            print("\n[INVIO] Pagina precedente | [S] Successiva | [U] Ultima | [N] Vai a pagina")
+            print("[T] Tipo | [E] Evento | [G] Giorni | [C] Cerca | [R] Azzera filtri | [0] Esci")
+            c = input("> ").strip().lower()
+            try:
+                if c == "0":
+                    return
+                elif c == "":
+                    page = max(0, page - 1)
+                elif c == "s":
+                    page = min(pager.pages - 1, page + 1)
+                elif c == "u":
+                    page = pager.pages - 1
+                elif c == "n":
+                    page = min(pager.pages, max(1, int(input("Pagina: ")))) - 1
+                elif c in ("t", "e"):
+                    options = KINDS if c == "t" else EVENT_TYPES
+                    for i, name in enumerate(options, 1):
+                        print(f"[{i}] {name}")
+                    idx = int(input("Scelta (0 = tutti): ") or 0)
+                    value = options[idx - 1] if idx > 0 else None
+                    pager.filters["kind" if c == "t" else "event"] = value
+                elif c == "g":
+                    span = input("Giorni (es. 10-40, 10-, -40; vuoto = tutti): ").strip()
+                    low, _, high = span.partition("-") if "-" in span else (span, "", span)
+                    pager.filters["day_from"] = int(low) if low.strip() else None
+                    pager.filters["day_to"] = int(high) if high.strip() else None
+                elif c == "c":
+                    pager.filters["text"] = input("Testo da cercare: ").strip() or None
+                elif c == "r":
+                    pager.filters = {}
+                else:
+                    continue
+            except (ValueError, IndexError, EOFError):
+                continue
+            if c in ("t", "e", "g", "c", "r"):
+                pager.refresh()
+                page = pager.pages - 1
+
     def menu(self):
         while True:
             self.header()
@@ -992,8 +1688,21 @@ class GameEngine:
             print("6. ✏️  Gestione Risorse")
             print("7. 📜 Storico")
             print("8. 🚪 Esci")
+            print("9. ↩️  Annulla Azione")
+            print("10. 🌿 Rami")
 
             c = input("\nScelta: ")
+            labels = {
+                "1": "Giorno singolo",
+                "2": "Simulazione",
+                "3": "Aggiungi unità",
+                "4": "Modifica quantità",
+                "5": "Modifica statistiche",
+                "6": "Gestione risorse",
+            }
+            # Lo stato prima dell'azione si registra solo se l'azione lo cambia
+            before = self.snapshot(labels[c]) if c in labels else None
+
             if c == "1":
                 self.ask_location()
 
@@ -1024,10 +1733,16 @@ class GameEngine:
             elif c == "6":
                 self.manual_mod()
             elif c == "7":
-                print("\n".join(self.bank.history[-30:]))
-                input("...")
+                self.history_menu()
             elif c == "8":
                 break
+            elif c == "9":
+                self.undo_menu()
+            elif c == "10":
+                self.branches_menu()
+
+            if before is not None:
+                self.record_if_changed(before)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+"""
+Avvio: scelta della gilda e apertura del menu.
+
+    python scripts/run_main.py --guild "Cacciatori di Taglie"
+    python scripts/run_main.py --list
+    python scripts/run_bounty_guild.py          (menu di selezione)
+
+L'elenco delle gilde legge solo l'intestazione dei salvataggi (versione e nome,
+vedi read_save_header), e nessuna cartella viene creata finché non si salva.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+from guild_downtime.game_engine import (
+    SAVE_DIR,
+    GameEngine,
+    is_save_name,
+    read_save_header,
+)
+
+
+
+def default_guild_name(guild_type=None):
+    """Nome di default di una nuova gilda: guild_name di configs/<guild_type>.yaml."""
+    from guild_downtime.config import load_guild_type
+
+    return load_guild_type(guild_type or "default").guild_name
+
+
+def slugify(name: str, save_dir=SAVE_DIR) -> str:
+    """Crea uno slug semplice per il nome file della gilda."""
+    s = name.strip().lower().replace(" ", "_")
+    allowed = "abcdefghijklmnopqrstuvwxyz0123456789_"
+    slug = "".join(ch for ch in s if ch in allowed)
+    if not slug:
+        slug = "gilda"
+    base = slug
+    i = 2
+    path = save_dir / f"{slug}.json"
+    # Evita di sovrascrivere salvataggi esistenti
+    while path.exists():
+        slug = f"{base}_{i}"
+        path = save_dir / f"{slug}.json"
+        i += 1
+    return slug
+
+
+def guild_name_of(path):
+    """Nome della gilda: dall'intestazione, o dal file intero per i salvataggi senza versione."""
+    try:
+        header = read_save_header(path)
+        if header is not None:
+            return header["guild_name"]
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("guild_name", path.stem)
+    except (OSError, ValueError, AttributeError):
+        return path.stem
+
+
+def list_saved_guilds(save_dir=SAVE_DIR):
+    """Restituisce lista di (nome_gilda, path_file)."""
+    save_dir = Path(save_dir)
+    if not save_dir.is_dir():
+        return []
+    return [
+        (guild_name_of(path), path)
+        for path in sorted(save_dir.glob("*.json"))
+        if is_save_name(path.name)
+    ]
+
+
+def find_guild(query, save_dir=SAVE_DIR):
+    """Salvataggio di una gilda per nome, nome del file o percorso (None se non c'è)."""
+    path = Path(query)
+    if path.suffix == ".json" and path.exists():
+        return path
+    save_dir = Path(save_dir)
+    for candidate in (save_dir / query, save_dir / f"{query}.json"):
+        if candidate.is_file() and is_save_name(candidate.name):
+            return candidate
+    wanted = query.strip().lower()
+    for name, path in list_saved_guilds(save_dir):
+        if name.lower() == wanted:
+            return path
+    return None
+
+
+def choose_guild(save_dir=SAVE_DIR, guild_type=None):
+    """Menu iniziale: scegli gilda salvata o creane una nuova (di tipo guild_type)."""
+    save_dir = Path(save_dir)
+    while True:
+        guilds = list_saved_guilds(save_dir)
+
+        print("=== SELEZIONE GILDA DI DOWNTIME ===\n")
+        if guilds:
+            print("Gilde salvate:")
+            for i, (name, path) in enumerate(guilds, 1):
+                print(f"[{i}] {name} ({path.name})")
+        else:
+            print("Nessun salvataggio trovato in data/saves/.")
+
+        new_idx = len(guilds) + 1
+        print(f"\n[{new_idx}] Crea nuova gilda")
+        print("[0] Esci")
+
+        choice = input("\nScelta: ").strip()
+        if not choice.isdigit():
+            continue
+        choice = int(choice)
+
+        if choice == 0:
+            return None, None
+
+        if 1 <= choice <= len(guilds):
+            name, path = guilds[choice - 1]
+            return path, None
+
+        if choice == new_idx:
+            new_name = input("Nome della nuova gilda (invio per default): ").strip()
+            if not new_name:
+                new_name = default_guild_name(guild_type)
+            slug = slugify(new_name, save_dir)
+            path = save_dir / f"{slug}.json"
+            print(f"\nCreerò la gilda '{new_name}' nel file: {path.name}")
+            return path, new_name
+
+
+def run_interactive(save_dir=SAVE_DIR, guild_type=None):
+    save_file, new_name = choose_guild(save_dir, guild_type)
+    if save_file is None:
+        print("Uscita.")
+        return
+
+    # Se il file esiste -> carica; se non esiste -> crea gilda nuova con quel nome
+    engine = GameEngine(save_file=save_file, guild_name=new_name, guild_type=guild_type)
+    engine.menu()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="run_main.py", description="Gestore del downtime della gilda."
+    )
+    parser.add_argument(
+        "-g",
+        "--guild",
+        help="gilda da aprire: nome, nome del file o percorso (creata se non esiste)",
+    )
+    parser.add_argument(
+        "-t", "--type", default=None, help="tipo di gilda per una gilda nuova (configs/)"
+    )
+    parser.add_argument("--saves", default=str(SAVE_DIR), help="cartella dei salvataggi")
+    parser.add_argument("--list", action="store_true", help="elenca le gilde salvate")
+    args = parser.parse_args(argv)
+    save_dir = Path(args.saves)
+
+    if args.list:
+        for name, path in list_saved_guilds(save_dir):
+            print(f"{name}\t{path.name}")
+        return 0
+
+    if args.guild is None:
+        run_interactive(save_dir, args.type)
+        return 0
+
+    save_file = find_guild(args.guild, save_dir)
+    new_name = None
+    if save_file is None:
+        new_name = args.guild
+        save_file = save_dir / f"{slugify(new_name, save_dir)}.json"
+        print(f"Nuova gilda '{new_name}' nel file: {save_file.name}")
+    GameEngine(save_file=save_file, guild_name=new_name, guild_type=args.type).menu()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Versioni dello schema dei salvataggi e migrazione in blocco.
+
+Ogni salvataggio scritto da save_state porta "schema_version"; GameEngine
+carica i file alla versione corrente senza correzioni, e fa passare da
+upgrade() (in memoria) solo quelli più vecchi. Per non pagare la migrazione a
+ogni caricamento, un'intera cartella di salvataggi si aggiorna una volta sola:
+
+    python -m guild_downtime.migrate data/saves --dry-run
+    python -m guild_downtime.migrate data/saves --processes 8
+
+I file sono letti, migrati e riscritti (in modo atomico) uno per volta dai
+processi del pool, e i risultati arrivano man mano che i file finiscono.
+"""
+
+import json
+import os
+import sys
+
+from guild_downtime.game_engine import (
+    DEFAULT_GUILD_CONFIG,
+    RESOURCE_CYCLE,
+    SAVE_FIELDS,
+    SCHEMA_VERSION,
+    ResourceBank,
+    is_save_name,
+)
+
+
+def _v1_to_v2(data, changes):
+    """Salvataggi senza versione: chiavi mancanti e unità duplicate."""
+    defaults = ResourceBank(save_file=None)
+
+    for key, value in (
+        ("guild_name", DEFAULT_GUILD_CONFIG["name"]),
+        ("event_table", "mercenari"),
+        ("guild_control_lost", False),
+        ("active_effects", []),
+    ):
+        if key not in data:
+            data[key] = value
+            changes.append(f"aggiunto {key}")
+
+    resources = data["resources"]
+    for res in RESOURCE_CYCLE:
+        if res not in resources:
+            resources[res] = defaults.resources[res]
+            changes.append(f"aggiunta risorsa {res}")
+
+    stats = data.setdefault("character_stats", {})
+    for stat, value in defaults.character_stats.items():
+        if stat not in stats:
+            stats[stat] = value
+            changes.append(f"aggiunta statistica {stat}")
+
+    # Come Guild.add_unit: un duplicato aumenta di 1 la quantità dell'unità già vista
+    units = {}
+    for u in data["guild_units"]:
+        if u["name"] in units:
+            units[u["name"]]["qty"] += 1
+            changes.append(f"unità duplicata {u['name']} accorpata")
+            continue
+        unit = dict(u)
+        if "qty" not in unit:
+            unit["qty"] = 1
+            changes.append(f"quantità di {u['name']} impostata a 1")
+        units[u["name"]] = unit
+    data["guild_units"] = list(units.values())
+
+
+def _v2_to_v3(data, changes):
+    """
+    Lo storico esce dal salvataggio e sta solo nell'archivio. Spostarlo
+    richiede il disco: lo fa chi legge il file (GameEngine, migrate_file),
+    che trova ancora le voci sotto "history".
+    """
+
+
+# Da versione N a N+1
+MIGRATIONS = {1: _v1_to_v2, 2: _v2_to_v3}
+
+
+def schema_version(data):
+    return data.get("schema_version", 1)
+
+
+def upgrade(data):
+    """
+    Porta i dati di un salvataggio (dizionario, modificato sul posto) alla
+    versione corrente. Restituisce (dati, elenco delle modifiche).
+    """
+    version = schema_version(data)
+    if version > SCHEMA_VERSION:
+        raise ValueError(
+            f"Salvataggio alla versione {version}, più recente di questo programma "
+            f"({SCHEMA_VERSION})."
+        )
+    changes = []
+    while version < SCHEMA_VERSION:
+        MIGRATIONS[version](data, changes)
+        version += 1
+        changes.append(f"schema {version}")
+    data["schema_version"] = version
+    # Ordine delle chiavi di save_state (schema_version e guild_name in testa)
+    ordered = {k: data[k] for k in SAVE_FIELDS if k in data}
+    ordered.update((k, v) for k, v in data.items() if k not in ordered)
+    return ordered, changes
+
+
+# ==========================================
+# MIGRAZIONE DI UNA CARTELLA
+# ==========================================
+
+
+def iter_saves(root):
+    """Salvataggi sotto `root`, in streaming (niente checkpoint né temporanei)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Archivi dello storico (<gilda>.history/): nessun salvataggio dentro
+        dirnames[:] = sorted(d for d in dirnames if not d.endswith(".history"))
+        for name in sorted(filenames):
+            if is_save_name(name):
+                yield os.path.join(dirpath, name)
+
+
+def migrate_file(path, dry_run=False):
+    """
+    Migra un salvataggio. Restituisce un dizionario per il rapporto:
+    {"path", "status", "from", "to", "changes"} con status "aggiornato",
+    "attuale", "ignorato" (non è un salvataggio) o "errore".
+    """
+    report = {
+        "path": str(path),
+        "status": "attuale",
+        "from": None,
+        "to": None,
+        "changes": [],
+    }
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not {"resources", "guild_units"} <= data.keys():
+            report["status"] = "ignorato"
+            return report
+        report["from"] = schema_version(data)
+        data, changes = upgrade(data)
+        report["to"] = data["schema_version"]
+
+        # Storico ancora nel salvataggio (versioni precedenti alla 3): nell'archivio
+        history = data.pop("history", None) or []
+        if history:
+            changes.append(f"{len(history)} voci di storico spostate nell'archivio")
+
+        report["changes"] = changes
+        if not changes:
+            return report
+        report["status"] = "aggiornato"
+        if dry_run:
+            return report
+
+        if history:
+            from guild_downtime.archive import HistoryArchive, backfill
+
+            archive = HistoryArchive.for_save(path)
+            if not archive.exists():
+                backfill(archive, history)
+                archive.close()
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp, path)
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        report["status"] = "errore"
+        report["changes"] = [f"{type(exc).__name__}: {exc}"]
+    return report
+
+
+def _migrate_task(task):
+    return migrate_file(*task)
+
+
+def migrate_tree(root, dry_run=False, processes=None):
+    """
+    Generatore dei rapporti per file, nell'ordine in cui i file finiscono.
+    processes=1 esegue tutto nel processo corrente.
+    """
+    tasks = ((path, dry_run) for path in iter_saves(root))
+    if processes == 1:
+        for task in tasks:
+            yield _migrate_task(task)
+        return
+    from multiprocessing import Pool
+
+    with Pool(processes) as pool:
+        yield from pool.imap_unordered(_migrate_task, tasks, chunksize=4)
+
+
+def main(argv=None):
+    import argparse
+
+    from guild_downtime.game_engine import SAVE_DIR
+
+    parser = argparse.ArgumentParser(
+        prog="python -m guild_downtime.migrate",
+        description="Aggiorna i salvataggi allo schema corrente.",
+    )
+    parser.add_argument("root", nargs="?", default=str(SAVE_DIR))
+    parser.add_argument(
+        "--dry-run", action="store_true", help="solo rapporto, nessun file modificato"
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="elenca le modifiche di ogni file"
+    )
+    args = parser.parse_args(argv)
+
+    totals = {}
+    for report in migrate_tree(args.root, args.dry_run, args.processes):
+        status = report["status"]
+        totals[status] = totals.get(status, 0) + 1
+        if status in ("aggiornato", "errore"):
+            versions = f" (v{report['from']} -> v{report['to']})" if report["to"] else ""
+            print(f"{status.upper()}: {report['path']}{versions}")
+            if args.verbose or status == "errore":
+                for change in report["changes"]:
+                    print(f"   - {change}")
+
+    label = "DA AGGIORNARE" if args.dry_run else "AGGIORNATI"
+    print(
+        f"\n{label}: {totals.get('aggiornato', 0)} | già attuali: {totals.get('attuale', 0)}"
+        f" | ignorati: {totals.get('ignorato', 0)} | errori: {totals.get('errore', 0)}"
+    )
+    return 1 if totals.get("errore") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Monte Carlo adattivo sulle simulazioni multi-giorno.
+
+Le prove partono tutte dallo stesso snapshot (GameEngine.from_snapshot, quindi
+nessuna lettura da disco) e vengono eseguite a blocchi; dopo ogni blocco si
+controllano gli intervalli di confidenza e ci si ferma appena tutti gli
+obiettivi richiesti sono soddisfatti.
+"""
+
+import math
+
+from guild_downtime import dice
+from guild_downtime.state import StateSnapshot
+
+Z_SCORES = {0.90: 1.6449, 0.95: 1.9600, 0.99: 2.5758}
+
+TRIAL_METRICS = (
+    "MO",
+    "Merci",
+    "Influenza",
+    "Magia",
+    "Manodopera",
+    "spent_gp",
+    "events",
+    "control_lost",
+    "control_lost_end",
+    "days_locked",
+)
+
+
+class RunningStat:
+    """Media e varianza in streaming (Welford), unibili tra worker (Chan et al.)."""
+
+    __slots__ = ("n", "mean", "m2", "successes")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        # Conteggio dei valori non nulli, per gli intervalli sulle proporzioni
+        self.successes = 0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if x:
+            self.successes += 1
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.successes += other.successes
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def stderr(self):
+        return math.sqrt(self.variance / self.n) if self.n else float("inf")
+
+    def interval(self, z=1.96):
+        h = z * self.stderr
+        return self.mean - h, self.mean + h
+
+    def wilson_interval(self, z=1.96):
+        """Intervallo di Wilson: non degenera a larghezza 0 con eventi rari."""
+        if self.n == 0:
+            return 0.0, 1.0
+        p = self.successes / self.n
+        denom = 1 + z * z / self.n
+        center = (p + z * z / (2 * self.n)) / denom
+        h = z * math.sqrt(p * (1 - p) / self.n + z * z / (4 * self.n * self.n)) / denom
+        return center - h, center + h
+
+
+class Target:
+    def __init__(self, metric, half_width, proportion=None, relative=False):
+        """
+        metric: una voce di TRIAL_METRICS.
+        half_width: semiampiezza massima dell'intervallo (es. 0.005 per ±0.5%).
+        proportion: usa l'intervallo di Wilson (default: per le metriche control_lost*).
+        relative: half_width è una frazione della media stimata.
+        """
+        if metric not in TRIAL_METRICS:
+            raise ValueError(f"Metrica sconosciuta: {metric}")
+        self.metric = metric
+        self.half_width = half_width
+        if proportion is None:
+            proportion = metric.startswith("control_lost")
+        self.proportion = proportion
+        self.relative = relative
+
+    def interval(self, stat, z, weighted=False):
+        # Con i pesi dell'importance sampling i valori non sono più 0/1
+        if self.proportion and not weighted:
+            return stat.wilson_interval(z)
+        return stat.interval(z)
+
+    def is_met(self, stat, z, weighted=False):
+        low, high = self.interval(stat, z, weighted)
+        limit = self.half_width * abs(stat.mean) if self.relative else self.half_width
+        return (high - low) / 2 <= limit
+
+
+class AdaptiveMonteCarlo:
+    def __init__(
+        self,
+        snapshot,
+        days,
+        targets,
+        strategy="u",
+        target_res=None,
+        sim_mode="2",
+        is_leaving=False,
+        batch_size=200,
+        min_trials=1000,
+        max_trials=1_000_000,
+        confidence=0.95,
+        seed=0,
+        mutiny_bias=None,
+    ):
+        """
+        snapshot: stato di partenza (StateSnapshot o GameEngine).
+        targets: lista di Target.
+        mutiny_bias: se impostato (es. 0.2), la fascia 96-100 della tabella eventi
+        è campionata con questa probabilità invece del 5% fino al primo
+        Ammutinamento della prova, e ogni prova è pesata con il rapporto di
+        verosimiglianza. Utile per obiettivi su control_lost quando è raro;
+        le altre metriche pesate hanno in genere varianza maggiore.
+        """
+        if not isinstance(snapshot, StateSnapshot):
+            snapshot = snapshot.snapshot()
+        self.snapshot = snapshot
+        self.days = days
+        self.targets = list(targets)
+        self.sim_args = (strategy, target_res, sim_mode, is_leaving)
+        self.batch_size = batch_size
+        self.min_trials = min_trials
+        self.max_trials = max_trials
+        self.z = Z_SCORES[confidence]
+        self.confidence = confidence
+        self.seed = seed
+        self.mutiny_bias = mutiny_bias
+        self.stats = {m: RunningStat() for m in TRIAL_METRICS}
+        # Distribuzioni (quantili) delle stesse prove, a memoria costante
+        from guild_downtime.aggregate import EnsembleAggregator
+
+        self.distributions = EnsembleAggregator()
+
+    def run_trial(self, index):
+        """
+        Una prova, riproducibile dal seme e dall'indice.
+        Restituisce (metriche, peso, eventi per tipo).
+        """
+        from guild_downtime.game_engine import GameEngine
+
+        dice.seed(f"{self.seed}:{index}")
+        engine = GameEngine.from_snapshot(self.snapshot)
+        engine.mutiny_bias = self.mutiny_bias
+        summary = engine.simulate(self.days, *self.sim_args)
+        values = trial_metrics(engine, summary)
+        return values, engine.likelihood, summary["event_types"]
+
+    def converged(self):
+        if self.stats["events"].n < self.min_trials:
+            return False
+        weighted = self.mutiny_bias is not None
+        return all(
+            t.is_met(self.stats[t.metric], self.z, weighted) for t in self.targets
+        )
+
+    def worker_spec(self):
+        """Parametri per ricostruire il runner in un worker (solo dati picklabili)."""
+        snapshot = self.snapshot.to_dict()
+        snapshot["history"] = []
+        strategy, target_res, sim_mode, is_leaving = self.sim_args
+        return {
+            "snapshot": snapshot,
+            "days": self.days,
+            "strategy": strategy,
+            "target_res": target_res,
+            "sim_mode": sim_mode,
+            "is_leaving": is_leaving,
+            "seed": self.seed,
+            "mutiny_bias": self.mutiny_bias,
+        }
+
+    def run(self, on_batch=None, cache=None, processes=1):
+        """
+        Esegue blocchi di prove fino agli obiettivi (o a max_trials).
+        on_batch(runner) è chiamato dopo ogni blocco, per mostrare l'avanzamento.
+        cache: ResultCache opzionale; la stessa richiesta torna subito dalla cache.
+        processes: worker paralleli (None = tutti i core). I risultati sono gli
+        stessi dell'esecuzione seriale: ogni prova ha il suo seme.
+        """
+        if cache is not None:
+            from guild_downtime.cache import cache_key
+
+            key = cache_key(
+                self.snapshot,
+                kind="montecarlo",
+                days=self.days,
+                sim_args=list(self.sim_args),
+                targets=[
+                    [t.metric, t.half_width, t.proportion, t.relative]
+                    for t in self.targets
+                ],
+                batch_size=self.batch_size,
+                min_trials=self.min_trials,
+                max_trials=self.max_trials,
+                confidence=self.confidence,
+                seed=self.seed,
+                mutiny_bias=self.mutiny_bias,
+            )
+            return cache.get_or_compute(
+                key, lambda: self.run(on_batch, processes=processes)
+            )
+
+        if processes != 1:
+            return self._run_parallel(on_batch, processes)
+
+        trials = self.stats["events"].n
+        while trials < self.max_trials:
+            for i in range(trials, min(trials + self.batch_size, self.max_trials)):
+                self._add(*self.run_trial(i))
+            trials = self.stats["events"].n
+            if on_batch is not None:
+                on_batch(self)
+            if self.converged():
+                break
+        return self.result()
+
+    def _run_parallel(self, on_batch, processes):
+        """Come run(), con i blocchi simulati dai worker in un buffer condiviso."""
+        from guild_downtime.shared_results import SharedResults, fill, worker_pool
+
+        with SharedResults(self.batch_size) as results:
+            with worker_pool(self, results, processes) as pool:
+                trials = self.stats["events"].n
+                while trials < self.max_trials:
+                    stop = min(trials + self.batch_size, self.max_trials)
+                    fill(pool, trials, stop)
+                    # In ordine di indice: stesse somme dell'esecuzione seriale
+                    for row in range(stop - trials):
+                        self._add(*results.read(row))
+                    trials = self.stats["events"].n
+                    if on_batch is not None:
+                        on_batch(self)
+                    if self.converged():
+                        break
+        return self.result()
+
+    def _add(self, values, weight, event_types):
+        for m, v in values.items():
+            self.stats[m].add(v * weight)
+        self.distributions.add(values, event_types, weight)
+
+    def result(self):
+        weighted = self.mutiny_bias is not None
+        metrics = {}
+        for m, stat in self.stats.items():
+            target = next((t for t in self.targets if t.metric == m), None)
+            if target is not None:
+                low, high = target.interval(stat, self.z, weighted)
+            else:
+                low, high = stat.interval(self.z)
+            metrics[m] = {
+                "mean": stat.mean,
+                "stderr": stat.stderr,
+                "low": low,
+                "high": high,
+            }
+        return {
+            "trials": self.stats["events"].n,
+            "converged": self.converged(),
+            "confidence": self.confidence,
+            "metrics": metrics,
+            "distributions": self.distributions.summary(),
+        }
+
+
+def trial_metrics(engine, summary):
+    """Valori finali di una prova, nell'ordine di TRIAL_METRICS."""
+    values = dict(engine.bank.resources)
+    values["spent_gp"] = summary["spent_gp"]
+    values["events"] = summary["events"]
+    # control_lost: controllo perso almeno una volta nel periodo simulato
+    values["control_lost"] = 1 if summary["control_losses"] else 0
+    values["control_lost_end"] = 1 if summary["control_lost"] else 0
+    values["days_locked"] = summary["days_locked"]
+    return values
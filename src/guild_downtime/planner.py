@@ -0,0 +1,419 @@
+"""
+Pianificatore degli acquisti di unità (squadre e stanze di GAME_DATABASE).
+
+Dato un budget in MO, i prezzi delle unità, le unità già possedute e un
+obiettivo (quota dei giorni dedicata a ogni risorsa), trova l'insieme di
+acquisti che massimizza il valore atteso del guadagno giornaliero: zaino
+limitato per programmazione dinamica sulle quantità.
+
+Valore di un'unità. Con il d20 il guadagno atteso di un giorno è lineare nel
+bonus: per B intero i 20 risultati coprono due volte ogni resto modulo 10, e
+
+    E[floor((d20 + B) / 10)] = 0.6 + B / 10        E[(d20 + B) / 10] = 1.05 + B / 10 (MO)
+
+quindi ogni punto di bonus vale 1/10 di risorsa al giorno, qualunque sia il
+resto della gilda, e i valori delle unità si sommano. Un punto di risorsa vale
+in MO quanto si risparmia guadagnandolo invece di comprarlo (il prezzo
+d'acquisto è il doppio di EARN_COSTS): EARN_COSTS, e 1 per le MO.
+
+Con il prendi 10 (sim_mode "1") il guadagno è a gradini, 1 + floor(B / 10)
+(lineare solo per le MO), e non additivo: conta a che punto della decina è
+il bonus totale di ogni risorsa, unità già possedute comprese. Lo zaino tiene
+allora, per ogni costo, i resti modulo 10 dei bonus totali delle risorse a
+gradini con il valore migliore per ciascuno, e somma il valore esatto dei
+gradini superati da ogni acquisto. Il rapporto riporta il guadagno esatto
+prima e dopo con entrambe le modalità.
+
+I prezzi non sono in GAME_DATABASE: li fornisce chi chiama, in MO con al più
+due decimali (lo zaino lavora in centesimi).
+"""
+
+import math
+import operator
+
+from guild_downtime.game_engine import (
+    EARN_COSTS,
+    RESOURCE_CYCLE,
+    DowntimeUnit,
+    game_database,
+    unit_type_for,
+)
+
+# Strategia uniforme: un giorno su cinque per risorsa
+UNIFORM_WEIGHTS = {r: 1 / len(RESOURCE_CYCLE) for r in RESOURCE_CYCLE}
+
+
+def point_value(resource):
+    """Valore in MO di un punto di risorsa guadagnato."""
+    return 1 if resource == "MO" else EARN_COSTS[resource]
+
+
+def expected_income(resource, bonus, sim_mode="2"):
+    """Risorsa guadagnata in un giorno dedicato a `resource` con bonus totale `bonus`."""
+    if bonus == 0 or sim_mode != "2":
+        total = 10 + bonus
+        return total / 10 if resource == "MO" else math.floor(total / 10)
+    return (1.05 if resource == "MO" else 0.6) + bonus / 10
+
+
+def daily_value(bonuses, weights, sim_mode="2"):
+    """Valore atteso in MO di un giorno, con i giorni divisi tra le risorse secondo `weights`."""
+    return sum(
+        w * point_value(r) * expected_income(r, bonuses.get(r, 0), sim_mode)
+        for r, w in weights.items()
+    )
+
+
+def unit_value(bonuses, weights):
+    """Valore marginale (MO al giorno, col d20) di un'unità con questi bonus."""
+    return sum(w * point_value(r) * bonuses.get(r, 0) / 10 for r, w in weights.items())
+
+
+class Plan:
+    __slots__ = ("purchases", "cost", "value", "report")
+
+    def __init__(self, purchases, cost, value, report):
+        # {nome unità: quantità da comprare}
+        self.purchases = purchases
+        self.cost = cost
+        # Valore aggiunto (MO al giorno) nel modello di sim_mode: lineare col
+        # d20, a gradini col prendi 10
+        self.value = value
+        # {"d20"/"take10": {"before", "after"}}: valore giornaliero esatto
+        self.report = report
+
+    def units(self):
+        """Le unità da aggiungere, pronte per Guild.add_unit / la lista di unità."""
+        return [
+            DowntimeUnit(name, unit_type_for(name), game_database()[name], qty)
+            for name, qty in self.purchases.items()
+        ]
+
+
+def _pieces(qty):
+    """Quantità come somma di potenze di due (più il resto): 1, 2, 4, ..., resto."""
+    k = 1
+    while qty > 0:
+        take = min(k, qty)
+        yield take
+        qty -= take
+        k *= 2
+
+
+def plan_purchases(
+    budget,
+    prices,
+    units=(),
+    weights=None,
+    limits=None,
+    catalog=None,
+    sim_mode="2",
+):
+    """
+    budget: MO disponibili. prices: {nome unità: prezzo in MO} (le unità senza
+    prezzo non si comprano). units: unità già possedute (DowntimeUnit).
+    weights: {risorsa: quota dei giorni}; default strategia uniforme.
+    limits: {nome unità: quantità massima posseduta} (default: nessun limite
+    oltre al budget). catalog: {nome unità: bonus} (default GAME_DATABASE).
+    sim_mode: "2" d20 (valore atteso lineare), "1" prendi 10 (valore a gradini).
+    """
+    weights = UNIFORM_WEIGHTS if weights is None else weights
+    catalog = game_database() if catalog is None else catalog
+    for r in weights:
+        if r not in EARN_COSTS:
+            raise ValueError(f"Risorsa sconosciuta nell'obiettivo: {r}")
+    owned = {}
+    for u in units:
+        owned[u.name] = owned.get(u.name, 0) + u.qty
+
+    funds = int(math.floor(budget * 100 + 1e-6))
+    items = []
+    for name, price in prices.items():
+        if name not in catalog:
+            raise ValueError(f"Unità sconosciuta: {name}")
+        if price <= 0:
+            raise ValueError(f"Prezzo non valido per {name}: {price}")
+        cents = round(price * 100)
+        if abs(price * 100 - cents) > 1e-6:
+            raise ValueError(f"Prezzo di {name} con più di due decimali: {price}")
+        value = unit_value(catalog[name], weights)
+        if value <= 0 or cents > funds:
+            continue
+        qty = funds // cents
+        if limits is not None and name in limits:
+            qty = min(qty, limits[name] - owned.get(name, 0))
+        if qty > 0:
+            items.append((name, cents, value, qty))
+
+    # Budget e prezzi (in centesimi) divisi per il loro MCD: meno celle nella tabella
+    g = math.gcd(funds, *(cents for _, cents, _, _ in items)) if items else 1
+    cap = funds // g
+    items = [
+        (name, c // g, value, min(qty, cap // (c // g))) for name, c, value, qty in items
+    ]
+    before = _bonuses(units, {}, catalog)
+    value, purchases, best = _plan_d20(_prune(items, cap), cap)
+    if sim_mode == "1":
+        # Il piano del d20 dà il minimo da battere, la sua tabella il massimo
+        # lineare per ogni budget residuo
+        floor_value = daily_value(
+            _bonuses(units, purchases, catalog), weights, "1"
+        ) - daily_value(before, weights, "1")
+        found = _plan_take10(items, cap, weights, before, catalog, best, floor_value)
+        if found is not None:
+            value, purchases = found
+        else:
+            value = floor_value
+    spent = sum(prices[n] * q for n, q in purchases.items())
+
+    after = _bonuses(units, purchases, catalog)
+    report = {
+        label: {
+            "before": daily_value(before, weights, mode),
+            "after": daily_value(after, weights, mode),
+        }
+        for label, mode in (("d20", "2"), ("take10", "1"))
+    }
+    return Plan(dict(sorted(purchases.items())), spent, value, report)
+
+
+def _plan_d20(items, cap):
+    """
+    Zaino sul valore lineare del d20: (valore aggiunto, {nome: quantità},
+    best), con best[b] = valore massimo con costo al più b. Unità senza
+    limite effettivo: un passaggio di zaino illimitato; con limite: zaino 0/1
+    sui pezzi binari della quantità. Per ogni passaggio si tiene dove l'unità
+    è presa.
+    """
+    best = [0.0] * (cap + 1)
+    choices = []
+    for name, cost, value, qty, unbounded in items:
+        if unbounded:
+            best, taken = _unbounded_pass(best, cost, value)
+            choices.append((name, None, cost, taken))
+            continue
+        for part in _pieces(qty):
+            best, taken = _bounded_pass(best, cost * part, value * part)
+            choices.append((name, part, cost * part, taken))
+
+    b = max(range(cap + 1), key=best.__getitem__)
+    value = best[b]
+    purchases = {}
+    for name, part, cost, taken in reversed(choices):
+        if part is not None:
+            if taken[b]:
+                purchases[name] = purchases.get(name, 0) + part
+                b -= cost
+            continue
+        while taken[b]:
+            purchases[name] = purchases.get(name, 0) + 1
+            b -= cost
+    return value, purchases, best
+
+
+def _plan_take10(items, cap, weights, start, catalog, linear_best, floor_value):
+    """
+    Zaino sul valore esatto del prendi 10: (valore aggiunto, {nome: quantità}),
+    o None se niente batte `floor_value` (il valore del piano del d20).
+    Lo stato è il vettore dei resti modulo 10 dei bonus totali delle risorse a
+    gradini, scritto come un intero in base 10: ogni cella di costo b tiene
+    {stato: nodo}, con nodo = (valore, nodo precedente, unità, quantità), e la
+    catena dei nodi è l'elenco degli acquisti. Un acquisto sposta lo stato e
+    somma i gradini superati (calcolati per cifra). Rispetto a un
+    altro stato, uno con il resto più alto in certe risorse guadagnerà al
+    massimo un gradino in più in quelle: dopo ogni unità si scartano gli stati
+    che, anche con tutti i gradini, non arrivano al migliore delle celle che
+    costano meno, e quelli con gli stessi resti e non più valore di uno più
+    economico. Infine, floor(B / 10) <= B / 10: da uno stato con costo b e
+    resti q si guadagnano al più sum(c * q / 10) più il massimo lineare con il
+    budget che resta (linear_best[cap - b], dallo zaino del d20); gli stati che
+    così non arrivano a `floor_value` si scartano subito.
+    """
+    steps = sorted(r for r, w in weights.items() if r != "MO" and w > 0)
+    coef = [weights[r] * point_value(r) for r in steps]
+    slack = sum(coef)
+    mo_weight = weights.get("MO", 0)
+    relevant = steps + (["MO"] if mo_weight > 0 else [])
+    items = _prune_dominated(items, cap, catalog, relevant)
+
+    powers = [10**k for k in range(len(steps))]
+
+    def purchase(bonuses, part):
+        """
+        (valore lineare delle MO, per risorsa [(spostamento dello stato,
+        gradini) per ogni resto]) di `part` copie di un'unità.
+        """
+        moves = []
+        for k, r in enumerate(steps):
+            add = bonuses.get(r, 0) * part
+            moves.append(
+                [
+                    (((q + add) % 10 - q) * powers[k], coef[k] * ((q + add) // 10))
+                    for q in range(10)
+                ]
+            )
+        return mo_weight * bonuses.get("MO", 0) * part / 10, moves
+
+    # Parte dei gradini già "maturata" nei resti di ogni stato, per il limite superiore
+    partial = {}
+
+    def potential(code):
+        value = partial.get(code)
+        if value is None:
+            value = partial[code] = sum(
+                c * (code // powers[k] % 10) / 10 for k, c in enumerate(coef)
+            )
+        return value
+
+    def extend(src, dst, move, name, part, budget_left):
+        linear, moves = move
+        target = floor_value - linear_best[budget_left] - 1e-9
+        # Stato -> (stato dopo l'acquisto, valore aggiunto), per gli stati che servono
+        table = {}
+        for code, node in src.items():
+            entry = table.get(code)
+            if entry is None:
+                new, gain = code, linear
+                for k, digit_moves in enumerate(moves):
+                    shift, steps_gain = digit_moves[code // powers[k] % 10]
+                    new += shift
+                    gain += steps_gain
+                entry = table[code] = (new, gain)
+            new, gain = entry
+            value = node[0] + gain
+            old = dst.get(new)
+            if (old is None or value > old[0]) and value + potential(new) >= target:
+                dst[new] = (value, node, name, part)
+
+    def prune():
+        top = -1.0
+        cheapest = {}
+        for cell in cells:
+            if not cell:
+                continue
+            drop = [
+                code
+                for code, node in cell.items()
+                if node[0] + slack <= top or node[0] <= cheapest.get(code, -1.0)
+            ]
+            for code in drop:
+                del cell[code]
+            for code, node in cell.items():
+                cheapest[code] = node[0]
+                if node[0] > top:
+                    top = node[0]
+
+    cells = [{} for _ in range(cap + 1)]
+    start_code = sum(start.get(r, 0) % 10 * 10**k for k, r in enumerate(steps))
+    cells[0][start_code] = (0.0, None, None, 0)
+
+    for name, cost, _, qty in items:
+        bonuses = catalog[name]
+        if qty >= cap // cost:
+            # Senza limite effettivo: b crescente, la cella b - cost ha già l'unità
+            move = purchase(bonuses, 1)
+            for b in range(cost, cap + 1):
+                if cells[b - cost]:
+                    extend(cells[b - cost], cells[b], move, name, 1, cap - b)
+            prune()
+            continue
+        for part in _pieces(qty):
+            move = purchase(bonuses, part)
+            for b in range(cap, cost * part - 1, -1):
+                if cells[b - cost * part]:
+                    extend(cells[b - cost * part], cells[b], move, name, part, cap - b)
+            prune()
+
+    node = max((n for cell in cells for n in cell.values()), key=lambda n: n[0])
+    value = node[0]
+    if value < floor_value:
+        return None
+    purchases = {}
+    while node[2] is not None:
+        purchases[node[2]] = purchases.get(node[2], 0) + node[3]
+        node = node[1]
+    return value, purchases
+
+
+def _prune_dominated(items, cap, catalog, resources):
+    """
+    (nome, costo, valore, quantità) senza le unità che un'unità illimitata
+    batte in tutto: costa non di più e ha bonus non minori su ogni risorsa
+    che conta. Vale anche per il valore a gradini, che cresce con i bonus.
+    """
+    bonus = {
+        name: [catalog[name].get(r, 0) for r in resources] for name, _, _, _ in items
+    }
+    kept = []
+    for i, (name, cost, value, qty) in enumerate(items):
+        for j, (other, other_cost, _, other_qty) in enumerate(items):
+            if j == i or other_cost > cost or other_qty < cap // other_cost:
+                continue
+            if not all(a >= b for a, b in zip(bonus[other], bonus[name])):
+                continue
+            # Unità identiche: resta la prima
+            if (other_cost, bonus[other]) == (cost, bonus[name]) and j > i:
+                continue
+            break
+        else:
+            kept.append((name, cost, value, qty))
+    return kept
+
+
+def _prune(items, cap):
+    """
+    (nome, costo, valore, quantità, illimitata) senza le unità dominate: un'unità
+    è inutile se k copie di un'unità illimitata costano non di più e valgono
+    non di meno.
+    """
+    items = [(n, c, v, q, q >= cap // c) for n, c, v, q in items]
+    kept = []
+    for i, (name, cost, value, qty, unbounded) in enumerate(items):
+        for j, (_, other_cost, other_value, _, other_unbounded) in enumerate(items):
+            if j == i or not other_unbounded or other_cost > cost:
+                continue
+            k = cost // other_cost
+            if k * other_value < value:
+                continue
+            # Unità identiche: resta la prima
+            if (other_cost, other_value) == (cost, value) and j > i:
+                continue
+            break
+        else:
+            kept.append(items[i])
+    return kept
+
+
+def _bounded_pass(best, cost, gain):
+    """Zaino 0/1 con un oggetto: (nuova tabella, 1 dove l'oggetto è preso)."""
+    candidate = [x + gain for x in best[: len(best) - cost]]
+    kept = best[cost:]
+    taken = bytes(cost) + bytes(map(operator.lt, kept, candidate))
+    return best[:cost] + list(map(max, kept, candidate)), taken
+
+
+def _unbounded_pass(best, cost, gain):
+    """
+    Zaino illimitato con un oggetto. new[b] dipende da new[b - cost]: la
+    tabella si costruisce a blocchi di `cost` celle, ognuno dal blocco prima.
+    """
+    new = best[:cost]
+    taken = bytearray(cost)
+    for start in range(cost, len(best), cost):
+        old = best[start : start + cost]
+        candidate = [x + gain for x in new[start - cost : start - cost + len(old)]]
+        new += map(max, old, candidate)
+        taken += bytes(map(operator.lt, old, candidate))
+    return new, taken
+
+
+def _bonuses(units, purchases, catalog):
+    """Bonus totale per risorsa delle unità possedute più gli acquisti."""
+    total = {}
+    for u in units:
+        for r in RESOURCE_CYCLE:
+            total[r] = total.get(r, 0) + u.get_bonus_for_resource(r)
+    for name, qty in purchases.items():
+        for r, b in catalog[name].items():
+            total[r] = total.get(r, 0) + b * qty
+    return total
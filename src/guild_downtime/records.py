@@ -0,0 +1,113 @@
+"""
+Consumatori dei record giornalieri prodotti da GameEngine.iter_simulation().
+
+Ogni writer espone write(record) e close(); quelli su file scrivono riga per
+riga, quindi la memoria resta costante qualunque sia la durata della corsa.
+"""
+
+import csv
+import json
+from array import array
+from pathlib import Path
+
+RECORD_FIELDS = (
+    "day",
+    "span",
+    "resource",
+    "roll",
+    "earned",
+    "cost_gp",
+    "event",
+    "effects",
+    "control",
+)
+
+
+class _FileWriter:
+    def __init__(self, path, append=False):
+        """append=True per continuare un file dopo la ripresa da checkpoint."""
+        self.path = Path(path)
+        self._new_file = not (append and self.path.exists())
+        self._f = self.path.open(
+            "a" if append else "w", encoding="utf-8", newline=""
+        )
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvRecordWriter(_FileWriter):
+    def __init__(self, path, append=False):
+        super().__init__(path, append)
+        self._writer = csv.DictWriter(self._f, fieldnames=RECORD_FIELDS)
+        if self._new_file:
+            self._writer.writeheader()
+
+    def write(self, record):
+        self._writer.writerow(record)
+
+
+class JsonlRecordWriter(_FileWriter):
+    def write(self, record):
+        self._f.write(json.dumps(record, ensure_ascii=False))
+        self._f.write("\n")
+
+
+class ColumnarRecorder:
+    """
+    Raccoglie i record in colonne compatte (array tipizzati); i campi testuali
+    sono codificati come indici in una tabella di valori distinti.
+    """
+
+    def __init__(self):
+        self.day = array("l")
+        # Giorni coperti dal record (>1 per i periodi senza controllo)
+        self.span = array("l")
+        self.roll = array("b")
+        self.earned = array("d")
+        self.cost_gp = array("d")
+        self.control = array("b")
+        # Campi categoriali: codice -> valore in self.labels[campo]
+        self.resource = array("h")
+        self.event = array("h")
+        self.effects = array("h")
+        self.labels = {"resource": [], "event": [], "effects": []}
+        self._codes = {"resource": {}, "event": {}, "effects": {}}
+
+    def _code(self, field, value):
+        codes = self._codes[field]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.labels[field])
+            self.labels[field].append(value)
+        return code
+
+    def write(self, record):
+        self.day.append(record["day"])
+        self.span.append(record["span"])
+        self.roll.append(record["roll"] if record["roll"] is not None else -1)
+        self.earned.append(record["earned"])
+        self.cost_gp.append(record["cost_gp"])
+        self.control.append(record["control"])
+        self.resource.append(self._code("resource", record["resource"]))
+        self.event.append(self._code("event", record["event"]))
+        self.effects.append(self._code("effects", record["effects"]))
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self.day)
+
+    def column(self, field):
+        """Colonna decodificata come lista (per i campi categoriali)."""
+        if field in self.labels:
+            table = self.labels[field]
+            return [table[c] for c in getattr(self, field)]
+        return getattr(self, field)
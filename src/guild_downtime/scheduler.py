@@ -0,0 +1,412 @@
+"""
+Orologio a eventi discreti per il mondo della campagna.
+
+Invece di far avanzare day_counter un giorno alla volta, i sottosistemi
+registrano callback a un giorno preciso (scadenza di un effetto, prossima
+mossa di una fazione, rendita ricorrente...) e lo Scheduler salta direttamente
+da un evento al successivo: far passare mesi costa O(eventi), non
+O(giorni × entità).
+
+Lo Scheduler possiede il contatore dei giorni: i sottosistemi lo seguono con
+un listener. Un timer al giorno T scatta arrivando a T, cioè a chiusura del
+giorno T - 1 (come day_counter, che indica il giorno non ancora giocato). A
+parità di giorno i timer scattano per fase (EVENTS, EXPIRY, INCOME, LATE),
+poi nell'ordine di registrazione.
+
+    clock = Scheduler(day=engine.bank.day_counter)
+    GuildTimers(clock, engine)        # effetti, assenza, day_counter della gilda
+    CityPlots(clock, city)            # gilde PNG: eventi, effetti, rendite
+    clock.schedule_every(7, paga_settimanale)
+    clock.advance(90)
+"""
+
+import heapq
+import math
+import random
+from itertools import count
+
+# Fasi di un giorno
+EVENTS = 0
+EXPIRY = 1
+INCOME = 2
+LATE = 3
+
+
+class Timer:
+    """Callback programmata; restituita da Scheduler.schedule*, serve per cancel()."""
+
+    __slots__ = ("day", "phase", "callback", "args", "interval", "cancelled")
+
+    def __init__(self, day, phase, callback, args, interval=None):
+        self.day = day
+        self.phase = phase
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+
+class Scheduler:
+    def __init__(self, day=1):
+        self.day = day
+        # Coda di (giorno, fase, progressivo, timer): a parità di giorno per
+        # fase, poi nell'ordine di registrazione
+        self._queue = []
+        self._seq = count()
+        self._live = 0
+        self._listeners = []
+
+    def __len__(self):
+        return self._live
+
+    def _push(self, timer):
+        heapq.heappush(self._queue, (timer.day, timer.phase, next(self._seq), timer))
+
+    def schedule(self, day, callback, *args, phase=EVENTS):
+        """callback(*args) al giorno `day` (non prima del giorno corrente)."""
+        timer = Timer(max(day, self.day), phase, callback, args)
+        self._push(timer)
+        self._live += 1
+        return timer
+
+    def schedule_in(self, delay, callback, *args, phase=EVENTS):
+        return self.schedule(self.day + delay, callback, *args, phase=phase)
+
+    def schedule_every(self, interval, callback, *args, start=None, phase=EVENTS):
+        """callback(*args) ogni `interval` giorni, dal giorno `start` (default: tra un intervallo)."""
+        if interval <= 0:
+            raise ValueError("L'intervallo deve essere di almeno un giorno.")
+        day = self.day + interval if start is None else start
+        timer = Timer(max(day, self.day), phase, callback, args, interval)
+        self._push(timer)
+        self._live += 1
+        return timer
+
+    def cancel(self, timer):
+        # Cancellazione pigra: il timer resta nella coda e viene scartato all'uscita
+        if not timer.cancelled:
+            timer.cancelled = True
+            self._live -= 1
+
+    def add_listener(self, listener):
+        """listener(vecchio_giorno, nuovo_giorno) a ogni avanzamento dell'orologio."""
+        self._listeners.append(listener)
+
+    def next_day(self):
+        """Giorno del prossimo evento in coda (None se la coda è vuota)."""
+        while self._queue and self._queue[0][3].cancelled:
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def _set_day(self, day):
+        if day == self.day:
+            return
+        old, self.day = self.day, day
+        for listener in self._listeners:
+            listener(old, day)
+
+    def advance_to(self, day):
+        """Esegue in ordine gli eventi fino al giorno `day` compreso; restituisce quanti."""
+        fired = 0
+        queue = self._queue
+        while queue and queue[0][0] <= day:
+            timer = heapq.heappop(queue)[3]
+            if timer.cancelled:
+                continue
+            self._set_day(timer.day)
+            if timer.cancelled:
+                # Cancellato da un listener del cambio di giorno
+                continue
+            if timer.interval is not None:
+                # Riarmato prima della chiamata: la callback può cancellarlo
+                timer.day += timer.interval
+                self._push(timer)
+            else:
+                self._live -= 1
+            timer.callback(*timer.args)
+            fired += 1
+        self._set_day(max(day, self.day))
+        return fired
+
+    def advance(self, days):
+        return self.advance_to(self.day + days)
+
+
+# ==========================================
+# SOTTOSISTEMI
+# ==========================================
+
+
+class GuildTimers:
+    """
+    Collega la gilda del gruppo all'orologio:
+    - day_counter e contatore di assenza (se il GM è via) seguono l'orologio;
+    - ogni effetto temporaneo scade con un proprio timer, e i giorni residui
+      degli altri sono riallineati solo quando l'orologio avanza;
+    - finché la gilda è senza controllo gli effetti non scalano, come in
+      process_daily_effects: i timer si fermano con i giorni residui in
+      days_left e ripartono quando il controllo torna.
+    Gli effetti aggiunti dall'engine nel frattempo, e la perdita o la ripresa
+    del controllo, si vedono al successivo avanzamento.
+    """
+
+    def __init__(self, scheduler, engine):
+        self.scheduler = scheduler
+        self.engine = engine
+        # id(effetto) -> (effetto, timer di scadenza): l'effetto è confrontato
+        # per identità, perché due effetti uguali restano distinti e un id()
+        # può essere riusato da un effetto nuovo
+        self._expiry = {}
+        self._frozen = engine.bank.guild_control_lost
+        scheduler.add_listener(self._on_advance)
+        if not self._frozen:
+            self._track_new_effects(scheduler.day)
+        if engine.days_absent > 0:
+            self._schedule_absence_warning()
+
+    def _timer(self, eff):
+        entry = self._expiry.get(id(eff))
+        return entry[1] if entry is not None and entry[0] is eff else None
+
+    def _track_new_effects(self, day):
+        """Timer di scadenza, da `day`, per gli effetti che non ne hanno uno."""
+        for eff in self.engine.guild.active_effects:
+            if self._timer(eff) is None:
+                timer = self.scheduler.schedule(
+                    day + eff["days_left"], self._expire, eff, phase=EXPIRY
+                )
+                self._expiry[id(eff)] = (eff, timer)
+
+    def _freeze_effects(self, day):
+        """Riporta in days_left i giorni residui al giorno `day` e ferma i timer."""
+        for eff, timer in self._expiry.values():
+            self.scheduler.cancel(timer)
+            eff["days_left"] = max(0, timer.day - day)
+        self._expiry.clear()
+        self._frozen = True
+
+    def _expire(self, eff):
+        if self.engine.bank.guild_control_lost:
+            # Controllo perso oggi da un'altra callback: l'effetto resta fermo
+            self._freeze_effects(self.scheduler.day)
+            return
+        if self._timer(eff) is not None:
+            del self._expiry[id(eff)]
+        effects = self.engine.guild.active_effects
+        for k, other in enumerate(effects):
+            if other is eff:
+                del effects[k]
+                self.engine.bank.add_log(f"EFFETTO SCADUTO: {eff['name']}")
+                break
+
+    def _on_advance(self, old, new):
+        engine = self.engine
+        delta = new - old
+        engine.bank.day_counter += delta
+        if engine.days_absent > 0:
+            engine.days_absent += delta
+        if engine.bank.guild_control_lost:
+            # Perso prima di `old`: da lì in poi gli effetti restano fermi
+            if not self._frozen:
+                self._freeze_effects(old)
+            return
+        if self._frozen:
+            # Controllo ripreso prima di `old`: gli effetti fermi ripartono da lì
+            self._frozen = False
+            self._track_new_effects(old)
+        else:
+            self._track_new_effects(new)
+        for eff in engine.guild.active_effects:
+            timer = self._timer(eff)
+            if timer is not None:
+                eff["days_left"] = max(0, timer.day - new)
+
+    def _schedule_absence_warning(self):
+        """Timer al giorno in cui, con il GM assente, la ripresa del controllo diventa impossibile."""
+        bonus = self.engine.bank.character_stats.get("Autorità", 4)
+        # CD = assenza - 10 > bonus + 20
+        limit = bonus + 31
+        if self.engine.days_absent < limit:
+            self.scheduler.schedule_in(
+                limit - self.engine.days_absent, self._absence_warning
+            )
+
+    def _absence_warning(self):
+        if self.engine.days_absent > 0 and self.engine.bank.guild_control_lost:
+            self.engine.bank.add_log(
+                f"ASSENZA: {self.engine.days_absent} giorni, ripresa del controllo impossibile"
+            )
+
+
+def sample_event_gap(chance, rng=random):
+    """
+    Giorni fino al prossimo evento (da 1) per una gilda con probabilità d'evento
+    `chance` oggi: +5% al giorno fino al 95%, come process_event. Un solo
+    numero casuale, inversione della funzione di sopravvivenza.
+    """
+    u = rng.random()
+    survive = 1.0
+    day = 0
+    while chance < 95:
+        day += 1
+        survive *= 1.0 - chance / 100
+        if u >= survive:
+            return day
+        chance += 5
+    # Dal 95% in poi la coda è geometrica
+    tail = u / survive
+    if tail <= 0.0:
+        return day + 1
+    return day + 1 + int(math.log(tail) / math.log(0.05))
+
+
+class CityPlots:
+    """
+    Le gilde PNG di una City guidate dall'orologio, al posto di City.step():
+    - per ogni gilda il giorno del prossimo evento è campionato in un colpo
+      solo, l'evento è risolto con la tabella di City e la gilda si riprogramma;
+    - ogni effetto temporaneo scade con un proprio timer (per id), fermo
+      finché la gilda è senza controllo, come in City.step();
+    - il blocco dopo un Ammutinamento riuscito si risolve il giorno dopo;
+    - la rendita giornaliera non ha timer: i bonus di una gilda cambiano solo
+      con i suoi eventi e le sue scadenze, quindi la rendita maturata da
+      allora si paga in blocco (settle) al suo evento o scadenza successivi, o
+      quando si leggono le risorse (City.settle). Con il prendi 10 il conto è
+      chiuso; con il d20 i tiri del blocco sono estratti tutti insieme.
+    City.day segue l'orologio, e City.step() rifiuta di girare finché la città
+    è collegata. I giorni residui degli effetti stanno nei timer (in
+    City.effects solo mentre sono fermi). La gilda del gruppo non gioca qui i
+    suoi giorni (vedi GuildTimers), ma riceve o cede l'Influenza delle
+    rivalità.
+    """
+
+    def __init__(self, scheduler, city):
+        from guild_downtime.game_engine import RESOURCE_CYCLE
+
+        if city.clock is not None:
+            raise ValueError("La città è già collegata a uno Scheduler.")
+        self.cycle = RESOURCE_CYCLE
+        self.scheduler = scheduler
+        self.city = city
+        city.clock = scheduler
+        city.plots = self
+        city.day = scheduler.day
+        scheduler.add_listener(self._on_advance)
+        # id effetto -> timer di scadenza
+        self._expiry = {}
+        # Per gilda, primo giorno con la rendita ancora da pagare
+        self._paid = [scheduler.day] * len(city)
+        for i in range(len(city)):
+            if city.control_lost[i]:
+                scheduler.schedule_in(1, self._regain, i, phase=LATE)
+            else:
+                self._resume_effects(i)
+                self._schedule_plot(i)
+
+    def _on_advance(self, old, new):
+        self.city.day = new
+
+    def _schedule_plot(self, i):
+        city = self.city
+        gap = sample_event_gap(city.event_chance[i], city.rng)
+        self.scheduler.schedule_in(gap, self._plot, i)
+
+    def _plot(self, i):
+        city = self.city
+        # Il timer del giorno T risolve l'evento del giorno T - 1, prima della
+        # sua rendita: si pagano i giorni fino a T - 2 (alla rivale che riceve
+        # Influenza ci pensa City._transfer_influence)
+        self.settle_guild(i, self.scheduler.day - 1)
+        effects = city.effects.get(i)
+        known = len(effects) if effects else 0
+        city.event_chance[i] = 20
+        city._npc_event(i)
+        if city.control_lost[i]:
+            # Niente rendita né scadenze finché il controllo non torna
+            self._freeze_effects(i)
+            self.scheduler.schedule_in(1, self._regain, i, phase=LATE)
+            return
+        for eff in city.effects.get(i, [])[known:]:
+            # Contato già oggi, come in City.step()
+            self._schedule_expiry(i, eff, eff[0] - 1)
+        self._schedule_plot(i)
+
+    def _schedule_expiry(self, i, eff, delay):
+        self._expiry[eff[2]] = self.scheduler.schedule_in(
+            delay, self._expire, i, eff[2], phase=EXPIRY
+        )
+
+    def _resume_effects(self, i):
+        for eff in self.city.effects.get(i, ()):
+            self._schedule_expiry(i, eff, eff[0])
+
+    def _freeze_effects(self, i):
+        """Riporta in City.effects i giorni residui e ferma i timer."""
+        day = self.scheduler.day
+        for eff in self.city.effects.get(i, ()):
+            timer = self._expiry.pop(eff[2], None)
+            if timer is not None:
+                self.scheduler.cancel(timer)
+                # Giorni ancora da scalare, oggi compreso (giorno day - 1)
+                eff[0] = timer.day - day + 1
+
+    def _expire(self, i, effect_id):
+        city = self.city
+        self._expiry.pop(effect_id, None)
+        # L'effetto vale ancora per la rendita dei giorni fino a T - 2
+        self.settle_guild(i, self.scheduler.day - 1)
+        effects = city.effects.get(i)
+        if not effects:
+            return
+        for k, eff in enumerate(effects):
+            if eff[2] == effect_id:
+                del effects[k]
+                city.effect_bonus[i] -= eff[1]
+                break
+        if not effects:
+            del city.effects[i]
+
+    def settle(self):
+        """Paga a tutte le gilde la rendita maturata fino al giorno corrente."""
+        day = self.scheduler.day
+        for i in range(len(self.city)):
+            self.settle_guild(i, day)
+
+    def settle_guild(self, i, day):
+        """Paga alla gilda i la rendita dei giorni prima di `day` non ancora pagati."""
+        start = self._paid[i]
+        if day > start:
+            self._paid[i] = day
+            # Senza controllo non c'è rendita (il ritorno riparte da _regain)
+            if not self.city.control_lost[i]:
+                self._pay(i, start, day)
+
+    def _pay(self, i, start, end):
+        """
+        Rendita della gilda i per i giorni da `start` a `end` - 1, con i bonus
+        di adesso. Con una sola risorsa: in forma chiusa con il prendi 10, con
+        i d20 estratti in blocco altrimenti; con la rotazione giorno per giorno.
+        """
+        city = self.city
+        focus = city.focus[i]
+        d20 = city.sim_mode == "2"
+        if focus is None:
+            city._earn_days(i, start, end, city.rng.random if d20 else None)
+            return
+        bonus = city.unit_bonus[focus][i] + city.effect_bonus[i]
+        if d20 and bonus != 0:
+            city._earn_rolls(i, focus, end - start, city.rng.random)
+        else:
+            city._earn_fixed(i, focus, end - start, 10 + bonus)
+
+    def _regain(self, i):
+        city = self.city
+        if city.rng.random() < city.p_regain[i]:
+            city.control_lost[i] = False
+            city.event_chance[i] = 20
+            # Ieri si è chiuso senza controllo: la rendita riparte da oggi
+            self._paid[i] = self.scheduler.day
+            self._resume_effects(i)
+            self._schedule_plot(i)
+        else:
+            self.scheduler.schedule_in(1, self._regain, i, phase=LATE)
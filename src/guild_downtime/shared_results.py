@@ -0,0 +1,168 @@
+"""
+Risultati delle prove in memoria condivisa, per i worker paralleli.
+
+Invece di restituire al processo principale un dizionario per prova (pickle +
+pipe a ogni prova), i worker scrivono una riga di double a layout fisso in un
+buffer multiprocessing.shared_memory preallocato; il processo principale legge
+righe e colonne come memoryview, senza copie. Ai worker arriva solo l'intervallo
+di indici da simulare, e al processo principale solo quante prove sono state
+scritte.
+
+    with run_shared_trials(runner, 100_000, processes=8) as results:
+        mo = results.column("MO")          # memoryview, nessuna copia
+        media = sum(mo) / len(mo)
+        del mo                             # rilasciare le viste prima di chiudere
+"""
+
+import os
+from multiprocessing import Pool, shared_memory
+
+from guild_downtime.game_engine import EVENT_TYPES
+from guild_downtime.montecarlo import TRIAL_METRICS
+
+# Layout di una riga: metriche della prova, peso (importance sampling), eventi per tipo.
+# Eventi di tipi fuori da EVENT_TYPES (altre tabelle) non hanno colonna.
+ROW_FIELDS = TRIAL_METRICS + ("weight",) + tuple(f"event:{t}" for t in EVENT_TYPES)
+ROW_SIZE = len(ROW_FIELDS)
+_ITEM = 8  # double
+
+_FIELD_INDEX = {f: i for i, f in enumerate(ROW_FIELDS)}
+
+
+class SharedResults:
+    def __init__(self, trials, name=None):
+        """
+        trials: numero di righe. Senza name crea il segmento (e ne è proprietario:
+        close() lo rimuove); con name si aggancia a un segmento esistente.
+        """
+        self.trials = trials
+        self.owner = name is None
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=max(1, trials * ROW_SIZE * _ITEM)
+            )
+        else:
+            # I worker del pool condividono il resource tracker del processo
+            # principale: la registrazione del segmento resta una sola
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._view = self._shm.buf[: trials * ROW_SIZE * _ITEM].cast("d")
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __len__(self):
+        return self.trials
+
+    def write(self, index, values, weight, event_types):
+        base = index * ROW_SIZE
+        view = self._view
+        for j, m in enumerate(TRIAL_METRICS):
+            view[base + j] = values[m]
+        base += len(TRIAL_METRICS)
+        view[base] = weight
+        for j, t in enumerate(EVENT_TYPES, 1):
+            view[base + j] = event_types.get(t, 0)
+
+    def row(self, index):
+        """Riga della prova `index` (memoryview di double, nell'ordine di ROW_FIELDS)."""
+        return self._view[index * ROW_SIZE : (index + 1) * ROW_SIZE]
+
+    def read(self, index):
+        """Riga come (metriche, peso, eventi per tipo), la forma di AdaptiveMonteCarlo.run_trial."""
+        row = self.row(index).tolist()
+        n = len(TRIAL_METRICS)
+        values = dict(zip(TRIAL_METRICS, row[:n]))
+        event_types = dict(zip(EVENT_TYPES, (int(x) for x in row[n + 1 :])))
+        return values, row[n], event_types
+
+    def column(self, field, stop=None):
+        """Colonna di un campo (memoryview con passo, nessuna copia)."""
+        start = _FIELD_INDEX[field]
+        end = (stop if stop is not None else self.trials) * ROW_SIZE
+        return self._view[start:end:ROW_SIZE]
+
+    def close(self):
+        # Le memoryview esportate (row/column) vanno rilasciate prima
+        self._view.release()
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ==========================================
+# WORKER
+# ==========================================
+
+_worker = None
+
+
+def _init_worker(name, trials, spec):
+    """Una volta per processo: runner ricostruito dai parametri e nome del buffer."""
+    global _worker
+    from guild_downtime.montecarlo import AdaptiveMonteCarlo
+    from guild_downtime.state import StateSnapshot
+
+    spec = dict(spec)
+    spec["snapshot"] = StateSnapshot.from_dict(spec["snapshot"])
+    _worker = (name, trials, AdaptiveMonteCarlo(targets=(), **spec))
+
+
+def _run_range(task):
+    """
+    Simula le prove start..stop-1 e le scrive alle righe (indice - offset).
+    Il segmento si aggancia e si chiude a ogni blocco: i worker del pool sono
+    terminati senza passare dai finalizzatori, e non restano mappature aperte.
+    """
+    start, stop, offset = task
+    name, trials, runner = _worker
+    results = SharedResults(trials, name)
+    try:
+        for i in range(start, stop):
+            values, weight, event_types = runner.run_trial(i)
+            results.write(i - offset, values, weight, event_types)
+    finally:
+        results.close()
+    return stop - start
+
+
+def worker_pool(runner, results, processes=None):
+    """Pool di worker agganciati a `results` che simulano con i parametri di `runner`."""
+    return Pool(
+        processes,
+        initializer=_init_worker,
+        initargs=(results.name, results.trials, runner.worker_spec()),
+    )
+
+
+def fill(pool, start, stop, chunk=None):
+    """
+    Prove start..stop-1 nelle righe 0..stop-start-1 del buffer del pool.
+    Blocchi piccoli e imap_unordered: i worker liberi prendono il blocco successivo.
+    """
+    count = stop - start
+    if chunk is None:
+        chunk = max(1, min(500, count // (8 * (os.cpu_count() or 1))))
+    tasks = [(a, min(a + chunk, stop), start) for a in range(start, stop, chunk)]
+    return sum(pool.imap_unordered(_run_range, tasks))
+
+
+def run_shared_trials(runner, trials, processes=None, chunk=None):
+    """
+    Esegue `trials` prove di `runner` (AdaptiveMonteCarlo) su un pool di processi.
+    Restituisce SharedResults: chi chiama lo chiude (anche con `with`).
+    """
+    results = SharedResults(trials)
+    try:
+        with worker_pool(runner, results, processes) as pool:
+            fill(pool, 0, trials, chunk)
+    except BaseException:
+        results.close()
+        raise
+    return results
@@ -0,0 +1,203 @@
+"""
+Snapshot, annullamento e rami dello stato di gioco (ResourceBank + Guild).
+
+Uno snapshot è immutabile: le parti annidate sono tuple e i dizionari bonus
+delle unità sono condivisi (le regole non li modificano mai). Per questo un
+ramo o una voce di annullamento sono solo un riferimento allo stesso oggetto:
+la copia vera avviene una sola volta, quando lo snapshot viene ripristinato
+nello stato "vivo" dell'engine (copy-on-write).
+"""
+
+from collections import deque
+
+
+class StateSnapshot:
+    __slots__ = (
+        "label",
+        "guild_name",
+        "resources",
+        "character_stats",
+        "day_counter",
+        "event_chance",
+        "guild_control_lost",
+        "days_absent",
+        "units",
+        "active_effects",
+        "history",
+        "event_table",
+        "history_records",
+    )
+
+    def __init__(
+        self,
+        guild_name,
+        resources,
+        character_stats,
+        day_counter,
+        event_chance,
+        guild_control_lost,
+        days_absent,
+        units,
+        active_effects,
+        history,
+        label="",
+        event_table="mercenari",
+        history_records=None,
+    ):
+        self.label = label
+        self.guild_name = guild_name
+        # Tuple di coppie: immutabili e confrontabili
+        self.resources = resources
+        self.character_stats = character_stats
+        self.day_counter = day_counter
+        self.event_chance = event_chance
+        self.guild_control_lost = guild_control_lost
+        self.days_absent = days_absent
+        # (name, unit_type, bonuses, qty) - bonuses condiviso, mai modificato
+        self.units = units
+        # (name, bonus, days_left)
+        self.active_effects = active_effects
+        self.history = history
+        self.event_table = event_table
+        # Voci dell'archivio al momento dello snapshot (None senza archivio):
+        # annullare riporta l'archivio a questa lunghezza
+        self.history_records = history_records
+
+    @classmethod
+    def capture(cls, bank, guild, days_absent=0, label=""):
+        # Solo lettura: uno snapshot non apre né crea l'archivio su disco
+        return cls(
+            guild.name,
+            tuple(bank.resources.items()),
+            tuple(bank.character_stats.items()),
+            bank.day_counter,
+            bank.event_chance,
+            bank.guild_control_lost,
+            days_absent,
+            tuple((u.name, u.unit_type, u.bonuses, u.qty) for u in guild.units),
+            tuple((e["name"], e["bonus"], e["days_left"]) for e in guild.active_effects),
+            tuple(bank.history),
+            label,
+            guild.event_table,
+            bank.archive_records(),
+        )
+
+    def to_dict(self):
+        """Forma JSON dello snapshot (checkpoint, cache, trasferimento ai worker)."""
+        return {
+            "label": self.label,
+            "guild_name": self.guild_name,
+            "resources": dict(self.resources),
+            "character_stats": dict(self.character_stats),
+            "day_counter": self.day_counter,
+            "event_chance": self.event_chance,
+            "guild_control_lost": self.guild_control_lost,
+            "days_absent": self.days_absent,
+            "units": [list(u) for u in self.units],
+            "active_effects": [list(e) for e in self.active_effects],
+            "history": list(self.history),
+            "event_table": self.event_table,
+            "history_records": self.history_records,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["guild_name"],
+            tuple(data["resources"].items()),
+            tuple(data["character_stats"].items()),
+            data["day_counter"],
+            data["event_chance"],
+            data["guild_control_lost"],
+            data.get("days_absent", 0),
+            tuple(tuple(u) for u in data["units"]),
+            tuple(tuple(e) for e in data["active_effects"]),
+            tuple(data.get("history", ())),
+            data.get("label", ""),
+            data.get("event_table", "mercenari"),
+            data.get("history_records"),
+        )
+
+    def restore_into(self, bank, guild):
+        """Materializza lo snapshot in oggetti mutabili nuovi (la "copia" del COW)."""
+        from guild_downtime.game_engine import DowntimeUnit
+
+        bank.resources = dict(self.resources)
+        bank.character_stats = dict(self.character_stats)
+        bank.day_counter = self.day_counter
+        bank.event_chance = self.event_chance
+        bank.guild_control_lost = self.guild_control_lost
+        bank.history = list(self.history)
+        guild.name = self.guild_name
+        guild.event_table = self.event_table
+        guild.units = [DowntimeUnit(n, t, b, q) for n, t, b, q in self.units]
+        guild.active_effects = [
+            {"name": n, "bonus": b, "days_left": d} for n, b, d in self.active_effects
+        ]
+
+    def diff(self, other):
+        """
+        Differenze tra due snapshot, come {campo: (valore_self, valore_other)}.
+        Risorse, statistiche e unità sono confrontate chiave per chiave.
+        """
+        changes = {}
+
+        for prefix, mine, theirs in (
+            ("", dict(self.resources), dict(other.resources)),
+            ("stat:", dict(self.character_stats), dict(other.character_stats)),
+            (
+                "unità:",
+                {u[0]: u[3] for u in self.units},
+                {u[0]: u[3] for u in other.units},
+            ),
+        ):
+            for k in sorted(set(mine) | set(theirs)):
+                a, b = mine.get(k, 0), theirs.get(k, 0)
+                if a != b:
+                    changes[f"{prefix}{k}"] = (a, b)
+
+        for field in (
+            "guild_name",
+            "event_table",
+            "day_counter",
+            "event_chance",
+            "guild_control_lost",
+            "days_absent",
+        ):
+            a, b = getattr(self, field), getattr(other, field)
+            if a != b:
+                changes[field] = (a, b)
+
+        if self.active_effects != other.active_effects:
+            changes["active_effects"] = (
+                [e[0] for e in self.active_effects],
+                [e[0] for e in other.active_effects],
+            )
+        return changes
+
+
+class StateTimeline:
+    """Pila di annullamento limitata + rami con nome (solo riferimenti a snapshot)."""
+
+    def __init__(self, max_undo=20):
+        self.undo_stack = deque(maxlen=max_undo)
+        self.branches = {}
+
+    def push(self, snapshot):
+        self.undo_stack.append(snapshot)
+
+    def pop(self, n=1):
+        """Toglie n voci e restituisce lo snapshot più vecchio (None se la pila è vuota)."""
+        snap = None
+        for _ in range(min(n, len(self.undo_stack))):
+            snap = self.undo_stack.pop()
+        return snap
+
+    def fork(self, name, snapshot):
+        self.branches[name] = snapshot
+
+    def get(self, name):
+        return self.branches.get(name)
+
+    def delete(self, name):
+        return self.branches.pop(name, None) is not None
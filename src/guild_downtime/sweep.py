@@ -0,0 +1,238 @@
+"""
+Griglie di parametri sulle simulazioni, eseguite su un pool di processi.
+
+Una griglia è un dizionario asse -> valori:
+
+    SweepGrid(
+        base,                                   # GameEngine o StateSnapshot
+        {
+            "stat:Diplomazia": range(4, 13),
+            "unit:Sacerdote": [1, 2, 3],
+            "strategy": ["u", "f:Influenza"],
+            "dice": ["take10", "d20"],
+        },
+        days=60,
+    )
+
+Assi supportati:
+    stat:<nome>   valore di character_stats
+    unit:<nome>   quantità di un'unità di GAME_DATABASE (0 = assente)
+    strategy      "u" (uniforme) o "f:<risorsa>" (focalizzata)
+    dice          "take10" / "d20"
+    leaving       True/False (partenza dalla città all'inizio)
+
+Le celle sono distribuite una alla volta ai worker (chunk da 1): chi finisce
+prima prende la cella successiva, quindi celle lente e veloci si bilanciano
+da sole. I risultati arrivano in streaming come righe di una tabella "tidy".
+
+Con `cache` (una ResultCache) le celle già calcolate con lo stesso stato,
+parametri e regole non vengono ricalcolate: il seme di ogni replica dipende
+dal contenuto della cella, non dalla sua posizione nella griglia.
+"""
+
+import csv
+import itertools
+import json
+
+from guild_downtime import dice
+from guild_downtime.state import StateSnapshot
+
+DICE_MODES = {"take10": "1", "d20": "2"}
+
+
+class SweepGrid:
+    def __init__(self, base, axes, days, replicates=20, seed=0, cache=None):
+        if not isinstance(base, StateSnapshot):
+            base = base.snapshot()
+        self.base = base
+        self.axes = {name: list(values) for name, values in axes.items()}
+        self.days = days
+        self.replicates = replicates
+        self.seed = seed
+        self.cache = cache
+        for name in self.axes:
+            _check_axis(name)
+        # Una cella sbagliata fallisce qui, non a metà del lavoro in un worker
+        for cell in self.cells():
+            _check_cell(cell)
+
+    def __len__(self):
+        n = 1
+        for values in self.axes.values():
+            n *= len(values)
+        return n
+
+    def cells(self):
+        """Combinazioni della griglia, come dizionari asse -> valore."""
+        names = list(self.axes)
+        for combo in itertools.product(*(self.axes[n] for n in names)):
+            yield dict(zip(names, combo))
+
+    def tasks(self):
+        base = self.base.to_dict()
+        # Lo storico non serve alle prove: meno dati da passare ai worker
+        base["history"] = []
+        cache_dir = str(self.cache.directory) if self.cache is not None else None
+        max_bytes = self.cache.max_bytes if self.cache is not None else None
+        for index, cell in enumerate(self.cells()):
+            yield (
+                index,
+                cell,
+                base,
+                self.days,
+                self.replicates,
+                self.seed,
+                cache_dir,
+                max_bytes,
+            )
+
+
+def _check_axis(name):
+    if name in ("strategy", "dice", "leaving"):
+        return
+    kind, _, key = name.partition(":")
+    if kind == "unit":
+        from guild_downtime.game_engine import game_database
+
+        if key not in game_database():
+            raise ValueError(f"Unità sconosciuta in GAME_DATABASE: {key}")
+        return
+    if kind == "stat" and key:
+        return
+    raise ValueError(f"Asse della griglia non valido: {name}")
+
+
+def _check_cell(cell):
+    """ValueError, con la cella, se una combinazione di valori non si può simulare."""
+    from guild_downtime.game_engine import RESOURCE_CYCLE
+
+    def fail(msg):
+        raise ValueError(f"Cella della griglia non valida {cell}: {msg}")
+
+    strategy = cell.get("strategy", "u")
+    if strategy != "u":
+        kind, _, resource = str(strategy).partition(":")
+        if kind != "f":
+            fail(f"strategia {strategy!r}, attesa \"u\" o \"f:<risorsa>\"")
+        if resource not in RESOURCE_CYCLE:
+            fail(
+                f"strategia {strategy!r} senza una risorsa valida "
+                f"(f:<risorsa>, con risorsa tra {', '.join(RESOURCE_CYCLE)})"
+            )
+    if cell.get("dice", "take10") not in DICE_MODES:
+        fail(f"dadi {cell['dice']!r}, attesi {' / '.join(DICE_MODES)}")
+    if not isinstance(cell.get("leaving", False), bool):
+        fail(f"leaving {cell['leaving']!r}, atteso True/False")
+    for name, value in cell.items():
+        if name.startswith("unit:") and (not isinstance(value, int) or value < 0):
+            fail(f"quantità {value!r} per {name}, attesa un intero >= 0")
+
+
+def apply_cell(snapshot_dict, cell):
+    """Snapshot di partenza della cella: copia del base con gli assi applicati."""
+    from guild_downtime.game_engine import game_database, unit_type_for
+
+    data = dict(snapshot_dict)
+    stats = dict(data["character_stats"])
+    units = {u[0]: list(u) for u in data["units"]}
+    for name, value in cell.items():
+        kind, _, key = name.partition(":")
+        if kind == "stat":
+            stats[key] = value
+        elif kind == "unit":
+            if value <= 0:
+                units.pop(key, None)
+            elif key in units:
+                units[key][3] = value
+            else:
+                units[key] = [key, unit_type_for(key), game_database()[key], value]
+    data["character_stats"] = stats
+    data["units"] = list(units.values())
+    return StateSnapshot.from_dict(data)
+
+
+def _sim_args(cell):
+    strategy = cell.get("strategy", "u")
+    target_res = None
+    if strategy.startswith("f:"):
+        strategy, target_res = "f", strategy[2:]
+    sim_mode = DICE_MODES[cell.get("dice", "take10")]
+    return strategy, target_res, sim_mode, bool(cell.get("leaving", False))
+
+
+def run_cell(task):
+    """Esegue le repliche di una cella. Gira nei worker: solo argomenti picklabili."""
+    from guild_downtime.game_engine import GameEngine
+    from guild_downtime.montecarlo import TRIAL_METRICS, RunningStat, trial_metrics
+
+    index, cell, base, days, replicates, seed, cache_dir, max_bytes = task
+    snapshot = apply_cell(base, cell)
+    args = _sim_args(cell)
+    cell_id = json.dumps(cell, sort_keys=True, ensure_ascii=False)
+
+    def compute():
+        stats = {m: RunningStat() for m in TRIAL_METRICS}
+        for r in range(replicates):
+            dice.seed(f"{seed}:{cell_id}:{r}")
+            engine = GameEngine.from_snapshot(snapshot)
+            summary = engine.simulate(days, *args)
+            for m, v in trial_metrics(engine, summary).items():
+                stats[m].add(v)
+        values = {}
+        for m, stat in stats.items():
+            values[f"{m}_mean"] = round(stat.mean, 4)
+            values[f"{m}_sd"] = round(stat.variance**0.5, 4)
+        return values
+
+    if cache_dir is None:
+        values = compute()
+    else:
+        from guild_downtime.cache import ResultCache, cache_key
+
+        cache = ResultCache(cache_dir, max_bytes)
+        key = cache_key(
+            snapshot,
+            kind="sweep_cell",
+            days=days,
+            sim_args=list(args),
+            replicates=replicates,
+            seed=seed,
+            cell=cell_id,
+        )
+        values = cache.get_or_compute(key, compute)
+
+    row = {"cell": index}
+    row.update(cell)
+    row["replicates"] = replicates
+    row.update(values)
+    return row
+
+
+def run_sweep(grid, processes=None):
+    """
+    Generatore delle righe risultato, nell'ordine in cui le celle finiscono.
+    processes=1 esegue tutto nel processo corrente (utile per il debug).
+    """
+    if processes == 1:
+        for task in grid.tasks():
+            yield run_cell(task)
+        return
+    from multiprocessing import Pool
+
+    with Pool(processes) as pool:
+        for row in pool.imap_unordered(run_cell, grid.tasks(), chunksize=1):
+            yield row
+
+
+def write_sweep_csv(rows, path):
+    """Scrive le righe man mano che arrivano; restituisce il numero di righe."""
+    n = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+            n += 1
+    return n
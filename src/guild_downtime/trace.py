@@ -0,0 +1,540 @@
+"""
+Tracce dei dadi: registrazione compatta di una simulazione e replay.
+
+Durante record_simulation() ogni dado estratto dal pool (vedi dice.py) finisce
+nella traccia come record di 3 byte, e così i valori "derivati" che non sono
+dadi (giorno di ripresa del controllo campionato in un colpo solo, fascia
+Ammutinamento con l'importance sampling):
+
+    facce, valore, scopo        un dado (facce 1..255)
+    0, scopo, n  + n byte       un valore derivato: intero senza segno
+                                little-endian, n = 0 per None
+
+Lo scopo di un dado è quello dichiarato dal tiro dell'engine (PURPOSES); il
+prendi 10 non tira niente, e il suo 10 sta nel record del giorno. A fine
+giorno un valore GIORNO porta 16 bit di un CRC32 concatenato dei record
+giornalieri, in coda FINE porta 8 byte dello SHA-256 dello stato finale.
+
+Dopo i dadi vengono gli stati: per ogni giorno registrato i campi dello stato
+(storico escluso) cambiati rispetto al giorno prima, una riga JSON per giorno,
+in blocchi di STATE_BLOCK giorni compressi con zlib; ogni blocco comincia con
+lo stato intero. Chiude il file un indice JSON dei blocchi (giorno di
+partenza, lunghezza) seguito dalla sua lunghezza su 4 byte:
+
+    riga JSON di intestazione (formato, ENGINE_VERSION, parametri, stato)
+    record dei dadi             pochi byte per dado, 5 per giorno
+    blocchi degli stati         zlib, stato intero + una differenza per giorno
+    indice JSON + 4 byte        {"dice": byte dei dadi, "blocks": [[giorno, byte]]}
+
+state_at() non fa girare le regole: prende il blocco che parte prima del
+giorno chiesto e applica le differenze fino a quel giorno. Solo il replay
+completo (verify) riparte dallo stato di partenza e fa girare le regole
+dell'engine con i dadi della traccia, letti nell'ordine registrato: ogni tiro
+deve chiedere lo stesso dado con lo stesso scopo, e a fine giorno lo stato
+deve essere quello registrato. Nessun generatore casuale, nessun
+campionamento della ripresa. Un engine di un'altra versione che chiede dadi
+diversi, o arriva a un giorno diverso, è segnalato con il giorno in cui
+diverge:
+
+    python -m guild_downtime.trace verify data/saves/gilda-giorno120.trace
+    python -m guild_downtime.trace show data/saves/gilda-giorno120.trace --day 150
+"""
+
+import hashlib
+import json
+import os
+import sys
+import zlib
+from bisect import bisect_right
+from pathlib import Path
+
+from guild_downtime import dice
+from guild_downtime.records import RECORD_FIELDS
+
+TRACE_FORMAT = 2
+
+# Giorni registrati per blocco di stati: state_at() applica al massimo tante differenze
+STATE_BLOCK = 64
+
+# Codici stabili: i nuovi scopi vanno in fondo
+PURPOSES = (
+    "ALTRO",
+    "PROBABILITÀ EVENTO",
+    "TABELLA EVENTI",
+    "EFFETTO EVENTO",
+    "PROVA",
+    "CONTROLLO",
+    "GENERAZIONE",
+    "RIPRESA",
+    "AMMUTINAMENTO",
+    "GIORNO",
+    "FINE",
+)
+_CODES = {name: code for code, name in enumerate(PURPOSES)}
+
+_FLUSH_BYTES = 1 << 16
+
+
+class TraceMismatch(ValueError):
+    """L'engine ha chiesto qualcosa di diverso da quello che c'è nella traccia."""
+
+    def __init__(self, message, day=None):
+        super().__init__(message)
+        self.day = day
+
+
+def day_crc(record, crc=0):
+    """CRC32 del record giornaliero, concatenato con quello dei giorni prima."""
+    data = repr(tuple(record[field] for field in RECORD_FIELDS)).encode()
+    return zlib.crc32(data, crc)
+
+
+def trace_state(engine):
+    """Stato dell'engine in forma JSON, storico escluso (quello che la traccia registra)."""
+    state = engine.snapshot().to_dict()
+    state.pop("history")
+    state.pop("label")
+    state.pop("history_records")
+    return state
+
+
+def state_digest(engine):
+    """Primi 8 byte dello SHA-256 dello stato (storico escluso), come intero."""
+    data = json.dumps(trace_state(engine), sort_keys=True, ensure_ascii=False).encode()
+    return int.from_bytes(hashlib.sha256(data).digest()[:8], "little")
+
+
+def _json_line(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _encode_value(value):
+    if value is None:
+        return b""
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"Valore derivato negativo non registrabile: {value}")
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "little")
+
+
+class TraceWriter:
+    """
+    Registratore collegato al pool dei dadi e, come i writer di records.py,
+    consumatore dei record giornalieri (write): a ogni record annota anche lo
+    stato di `engine`. Scrive i dadi su un file temporaneo che diventa la
+    traccia solo con finish(); gli stati, compressi, restano in memoria fino ad
+    allora.
+    """
+
+    def __init__(self, path, header, engine):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._f = open(self._tmp, "wb")
+        self._f.write(json.dumps(header, ensure_ascii=False).encode() + b"\n")
+        self._buf = bytearray()
+        self._dice_bytes = 0
+        self._crc = 0
+        self._engine = engine
+        self._state = trace_state(engine)
+        self._lines = []
+        self._blocks = []
+        self.rolls = 0
+        self.days = 0
+
+    # Lato pool (vedi DicePool.attach)
+    def roll(self, pool, sides, purpose):
+        value = pool.draw(sides)
+        self._buf += bytes((sides, value, _CODES[purpose]))
+        self.rolls += 1
+        if len(self._buf) >= _FLUSH_BYTES:
+            self._flush()
+        return value
+
+    def derive(self, purpose, compute):
+        value = compute()
+        self._value(purpose, value)
+        return value
+
+    def _value(self, purpose, value):
+        data = _encode_value(value)
+        self._buf += bytes((0, _CODES[purpose], len(data)))
+        self._buf += data
+
+    # Lato record giornalieri
+    def write(self, record):
+        self._crc = day_crc(record, self._crc)
+        self._value("GIORNO", self._crc & 0xFFFF)
+        self.days += 1
+
+        previous, state = self._state, trace_state(self._engine)
+        if not self._lines:
+            self._lines.append(_json_line(previous))
+        self._lines.append(
+            _json_line({k: v for k, v in state.items() if previous.get(k) != v})
+        )
+        self._state = state
+        if len(self._lines) > STATE_BLOCK:
+            self._close_block()
+
+    def _close_block(self):
+        day = json.loads(self._lines[0])["day_counter"]
+        self._blocks.append((day, zlib.compress(b"\n".join(self._lines))))
+        self._lines = []
+
+    def _flush(self):
+        self._f.write(self._buf)
+        self._dice_bytes += len(self._buf)
+        self._buf.clear()
+
+    def finish(self, engine):
+        self._value("FINE", state_digest(engine))
+        self._flush()
+        if self._lines:
+            self._close_block()
+        for _, block in self._blocks:
+            self._f.write(block)
+        index = _json_line(
+            {
+                "dice": self._dice_bytes,
+                "blocks": [[day, len(block)] for day, block in self._blocks],
+            }
+        )
+        self._f.write(index + len(index).to_bytes(4, "little"))
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        self._f.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class TraceReader:
+    """
+    Lettore collegato al pool dei dadi durante il replay: tiri e valori si
+    leggono nell'ordine della traccia, e ognuno deve avere i dati e lo scopo
+    che l'engine chiede. Il replay rifà le regole di ogni giorno, quindi dura
+    quanto la simulazione registrata: per leggere uno stato basta state_at().
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+        self._crc = 0
+        self.days = 0
+
+    # Lato pool (vedi DicePool.attach)
+    def roll(self, pool, sides, purpose):
+        data, pos = self._data, self._pos
+        try:
+            if data[pos] == sides and data[pos + 2] == _CODES[purpose]:
+                self._pos = pos + 3
+                return data[pos + 1]
+        except IndexError:
+            pass
+        raise TraceMismatch(
+            f"l'engine tira un d{sides} ({purpose}), la traccia ha {self._describe(pos)}"
+        )
+
+    def derive(self, purpose, compute):
+        return self._value(purpose)
+
+    def _value(self, purpose):
+        data, pos = self._data, self._pos
+        if data[pos : pos + 2] != bytes((0, _CODES[purpose])) or pos + 3 > len(data):
+            raise TraceMismatch(
+                f"l'engine chiede {purpose}, la traccia ha {self._describe(pos)}"
+            )
+        end = pos + 3 + data[pos + 2]
+        if end > len(data):
+            raise ValueError("Traccia troncata")
+        self._pos = end
+        return int.from_bytes(data[pos + 3 : end], "little") if end > pos + 3 else None
+
+    def _describe(self, pos):
+        data = self._data
+        if pos + 3 > len(data):
+            return "finito i record"
+        if data[pos]:
+            return f"un d{data[pos]} ({PURPOSES[data[pos + 2]]})"
+        return f"il valore {PURPOSES[data[pos + 1]]}"
+
+    def write(self, record):
+        self._crc = day_crc(record, self._crc)
+        if self._value("GIORNO") != self._crc & 0xFFFF:
+            raise TraceMismatch("record del giorno diverso da quello registrato")
+        self.days += 1
+
+    def finish(self, engine):
+        if self._value("FINE") != state_digest(engine):
+            raise TraceMismatch("stato finale diverso da quello registrato")
+        if self._pos != len(self._data):
+            raise TraceMismatch(
+                f"l'engine ha finito, la traccia ha ancora {self._describe(self._pos)}"
+            )
+
+
+def read_trace(path):
+    """
+    (intestazione, record dei dadi, blocchi degli stati) di un file di
+    traccia; i blocchi sono coppie (giorno di partenza, byte compressi).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    end = data.find(b"\n")
+    if end < 0:
+        raise ValueError(f"Traccia senza intestazione: {path}")
+    header = json.loads(data[:end])
+    if header.get("format") != TRACE_FORMAT:
+        raise ValueError(f"Formato di traccia non supportato: {header.get('format')}")
+
+    body = memoryview(data)[end + 1 :]
+    try:
+        size = int.from_bytes(body[-4:], "little")
+        index = json.loads(bytes(body[-4 - size : -4]))
+        dice_end = index["dice"]
+        blocks = []
+        pos = dice_end
+        for day, length in index["blocks"]:
+            blocks.append((day, body[pos : pos + length]))
+            pos += length
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"Traccia troncata: {path}") from None
+    if len(body) < 4 or pos != len(body) - 4 - size:
+        raise ValueError(f"Traccia troncata: {path}")
+    return header, bytes(body[:dice_end]), blocks
+
+
+def _block_states(block):
+    """Stato di partenza del blocco, poi lo stato dopo ogni giorno registrato."""
+    try:
+        lines = zlib.decompress(block).split(b"\n")
+    except zlib.error:
+        raise ValueError("Blocco di stati danneggiato nella traccia") from None
+    state = json.loads(lines[0])
+    yield state
+    for line in lines[1:]:
+        state = {**state, **json.loads(line)}
+        yield state
+
+
+def _params(days, strategy, target_res, sim_mode, is_leaving):
+    return {
+        "days": days,
+        "strategy": strategy,
+        "target_res": target_res,
+        "sim_mode": sim_mode,
+        "is_leaving": is_leaving,
+    }
+
+
+def record_simulation(
+    engine,
+    path,
+    days,
+    strategy="u",
+    target_res=None,
+    sim_mode="1",
+    is_leaving=False,
+    writers=(),
+):
+    """
+    Come engine.simulate() (stessi dadi, stesso risultato), registrando la
+    traccia in `path`. Niente checkpoint: una corsa interrotta non lascia tracce.
+    """
+    from guild_downtime.cache import ENGINE_VERSION
+
+    header = {
+        "format": TRACE_FORMAT,
+        "engine_version": ENGINE_VERSION,
+        "params": _params(days, strategy, target_res, sim_mode, is_leaving),
+        "state": engine.snapshot().to_dict(),
+        # Stato non salvato che cambia i tiri (importance sampling del Monte Carlo)
+        "mutiny_bias": engine.mutiny_bias,
+    }
+    writer = TraceWriter(path, header, engine)
+    saved = dice.attach(writer)
+    try:
+        summary = engine.simulate(
+            days, strategy, target_res, sim_mode, is_leaving, writers=(writer, *writers)
+        )
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        dice.detach(saved)
+    writer.finish(engine)
+    return summary
+
+
+class Replay:
+    """
+    Una traccia pronta per il replay: ogni corsa riparte dallo stato registrato,
+    state_at() legge gli stati registrati senza far girare le regole.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.header, self.data, self.blocks = read_trace(self.path)
+        self.params = self.header["params"]
+
+    def new_engine(self, state=None):
+        """Engine nello stato di partenza, o in `state` (forma di trace_state)."""
+        from guild_downtime.game_engine import GameEngine
+        from guild_downtime.state import StateSnapshot
+
+        data = self.header["state"] if state is None else {**self.header["state"], **state}
+        engine = GameEngine.from_snapshot(StateSnapshot.from_dict(data))
+        engine.mutiny_bias = self.header.get("mutiny_bias")
+        return engine
+
+    def _recorded_states(self):
+        for _, block in self.blocks:
+            states = _block_states(block)
+            next(states)
+            yield from states
+
+    def iter_days(self, engine=None):
+        """
+        Record giornalieri ricostruiti dalla traccia, ognuno verificato; lo stato
+        del giorno è in `engine` dopo ogni record. Restituisce il riepilogo
+        (valore del generatore); TraceMismatch al primo punto diverso.
+        """
+        engine = self.new_engine() if engine is None else engine
+        reader = TraceReader(self.data)
+        recorded = self._recorded_states()
+        saved = dice.attach(reader)
+        try:
+            records = engine.iter_simulation(**self.params)
+            while True:
+                try:
+                    record = next(records)
+                except StopIteration as stop:
+                    summary = stop.value
+                    break
+                reader.write(record)
+                if next(recorded, None) != trace_state(engine):
+                    raise TraceMismatch("stato del giorno diverso da quello registrato")
+                yield record
+            if next(recorded, None) is not None:
+                raise TraceMismatch("l'engine ha finito, la traccia ha ancora degli stati")
+            reader.finish(engine)
+        except TraceMismatch as exc:
+            day = engine.bank.day_counter
+            raise TraceMismatch(f"Giorno {day}: {exc}", day) from None
+        finally:
+            dice.detach(saved)
+        return summary
+
+    def state_at(self, day):
+        """
+        Engine con lo stato registrato all'inizio del giorno `day` (o a fine
+        corsa, se prima). Parte dal blocco che comincia prima di `day` e ne
+        applica le differenze: niente regole, niente verifica.
+        """
+        if not self.blocks:
+            return self.new_engine()
+        i = max(bisect_right([start for start, _ in self.blocks], day) - 1, 0)
+        for state in _block_states(self.blocks[i][1]):
+            if state["day_counter"] >= day:
+                break
+        return self.new_engine(state)
+
+    def run(self):
+        """(engine a fine corsa, riepilogo), con verifica completa."""
+        engine = self.new_engine()
+        days = self.iter_days(engine)
+        while True:
+            try:
+                next(days)
+            except StopIteration as stop:
+                return engine, stop.value
+
+
+def verify(path):
+    """Rapporto del replay di una traccia con l'engine corrente."""
+    from guild_downtime.cache import ENGINE_VERSION
+
+    report = {"path": str(path), "status": "identico", "day": None, "detail": ""}
+    try:
+        replay = Replay(path)
+    except (OSError, ValueError) as exc:
+        report.update(status="errore", detail=str(exc))
+        return report
+    report["recorded_version"] = replay.header["engine_version"]
+    report["engine_version"] = ENGINE_VERSION
+    report["days"] = replay.params["days"]
+    try:
+        replay.run()
+    except TraceMismatch as exc:
+        report.update(status="diverso", day=exc.day, detail=str(exc))
+    except ValueError as exc:
+        report.update(status="errore", detail=str(exc))
+    return report
+
+
+def purpose_counts(data):
+    """{scopo: quanti} per i dadi e i valori derivati di una traccia."""
+    counts = {}
+    pos = 0
+    while pos + 3 <= len(data):
+        if data[pos]:
+            name = PURPOSES[data[pos + 2]]
+            pos += 3
+        else:
+            name = PURPOSES[data[pos + 1]]
+            pos += 3 + data[pos + 2]
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m guild_downtime.trace",
+        description="Verifica e replay delle tracce dei dadi.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_verify = sub.add_parser("verify", help="replay con l'engine corrente e confronto")
+    p_verify.add_argument("paths", nargs="+")
+    p_show = sub.add_parser("show", help="contenuto di una traccia")
+    p_show.add_argument("path")
+    p_show.add_argument(
+        "--day", type=int, default=None, help="risorse ricostruite all'inizio del giorno"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "verify":
+        failed = False
+        for path in args.paths:
+            report = verify(path)
+            failed |= report["status"] != "identico"
+            versions = ""
+            if report["status"] != "errore":
+                versions = f" (v{report['recorded_version']} -> v{report['engine_version']})"
+            print(f"{report['status'].upper()}: {path}{versions}")
+            if report["detail"]:
+                print(f"   - {report['detail']}")
+        return 1 if failed else 0
+
+    header, data, _ = read_trace(args.path)
+    params = header["params"]
+    print(
+        f"Giorni: {params['days']} dal giorno {header['state']['day_counter']}"
+        f" | strategia {params['strategy']} | dadi {params['sim_mode']}"
+        f" | engine v{header['engine_version']} | {len(data)} byte"
+    )
+    for name, count in purpose_counts(data).items():
+        print(f"  - {name}: {count}")
+    if args.day is not None:
+        engine = Replay(args.path).state_at(args.day)
+        print(f"\nGiorno {engine.bank.day_counter}:")
+        for k, v in engine.bank.resources.items():
+            print(f"  - {k}: {v}")
+        print(f"  - Controllo perso: {engine.bank.guild_control_lost}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
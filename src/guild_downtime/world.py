@@ -0,0 +1,529 @@
+"""
+Modalità città: migliaia di gilde PNG sullo stesso calendario della gilda del gruppo.
+
+Le gilde PNG nascono da modelli nello stile di DEFAULT_GUILD_CONFIG e seguono le
+stesse regole di _simulate_day (tabella eventi, prove, effetti temporanei,
+costi di conseguimento), con due differenze:
+- i capi delle gilde PNG sono sempre presenti: la CD per riprendere il controllo
+  è 0 e il blocco dura in pratica un giorno;
+- Rivalità e Scandalo hanno una controparte: l'Influenza persa passa alla gilda
+  rivale (scelta la prima volta e poi fissa, reciproca se l'altra non ne ha già
+  una), che può essere la gilda del gruppo.
+
+Lo stato è tenuto per colonne (una lista per campo, indicizzata per gilda)
+invece che come migliaia di oggetti GameEngine: un giorno della città è un solo
+ciclo sugli indici, con le probabilità delle prove calcolate una volta sola.
+"""
+
+import random
+from itertools import count
+
+from guild_downtime.analytics import skill_check_probability
+from guild_downtime.control import regain_probability
+from guild_downtime.game_engine import (
+    DEFAULT_GUILD_CONFIG,
+    EARN_COSTS,
+    RESOURCE_CYCLE,
+    GameEngine,
+    game_database,
+)
+
+# Rivale "gilda del gruppo" nella colonna dei rivali
+PARTY = -1
+
+NPC_TEMPLATES = [
+    dict(
+        DEFAULT_GUILD_CONFIG,
+        weight=2,
+        focus=None,
+        stats={"Professione (soldato)": 6, "Intimidire": 4, "Combattimento": 6},
+        resources={"MO": 30.0},
+    ),
+    {
+        "name": "Gilda dei Mercanti",
+        "weight": 3,
+        "focus": "Merci",
+        "rooms": [{"name": "Forgia"}, {"name": "Deposito"}],
+        "teams": [{"name": "Artigiani", "qty": 2}, {"name": "Guidatori"}],
+        "stats": {"Diplomazia": 8, "Raggirare": 6},
+        "resources": {"MO": 60.0},
+    },
+    {
+        "name": "Circolo Arcano",
+        "weight": 1,
+        "focus": "Magia",
+        "rooms": [{"name": "Biblioteca Magica"}],
+        "teams": [{"name": "Apprendista"}, {"name": "Malioso"}],
+        "stats": {"Diplomazia": 4, "Autorità": 6},
+        "resources": {"MO": 100.0},
+    },
+    {
+        "name": "Banda dei Tagliaborse",
+        "weight": 2,
+        "focus": "MO",
+        "rooms": [{"name": "Falsa Facciata"}],
+        "teams": [{"name": "Tagliaborse", "qty": 2}, {"name": "Rapinatori"}],
+        "stats": {"Intimidire": 6, "Raggirare": 8, "Combattimento": 4},
+        "resources": {"MO": 10.0},
+    },
+    {
+        "name": "Casata Nobiliare",
+        "weight": 1,
+        "focus": "Influenza",
+        "rooms": [{"name": "Auditorium"}, {"name": "Bar"}],
+        "teams": [{"name": "Burocrati"}, {"name": "Lacchè", "qty": 2}],
+        "stats": {"Diplomazia": 10, "Autorità": 6},
+        "resources": {"MO": 80.0, "Influenza": 5},
+    },
+]
+
+BASE_STATS = {
+    "Diplomazia": 6,
+    "Raggirare": 4,
+    "Professione (soldato)": 0,
+    "Intimidire": 0,
+    "Combattimento": 0,
+    "Autorità": 4,
+}
+
+
+def _template_bonuses(template, jitter_qty):
+    """Bonus totali per risorsa dei reparti e delle stanze di un modello."""
+    totals = dict.fromkeys(RESOURCE_CYCLE, 0)
+    for unit in template.get("teams", []) + template.get("rooms", []):
+        bonuses = unit.get("bonuses") or game_database()[unit["name"]]
+        qty = unit.get("qty", 1) + jitter_qty()
+        for r, b in bonuses.items():
+            totals[r] += b * qty
+    return totals
+
+
+class City:
+    def __init__(self, size, templates=None, party=None, sim_mode="1", seed=0):
+        """
+        size: numero di gilde PNG.
+        templates: modelli delle gilde (default NPC_TEMPLATES); "weight" ne regola
+        la frequenza, "focus" la risorsa prodotta (None = rotazione uniforme).
+        party: GameEngine o StateSnapshot della gilda del gruppo (opzionale).
+        sim_mode: "1" prendi 10, "2" d20, per le gilde PNG.
+        Le gilde PNG usano un generatore proprio (seed); la gilda del gruppo
+        usa il generatore globale, come GameEngine.simulate().
+        """
+        if templates is None:
+            templates = NPC_TEMPLATES
+        if party is not None and not isinstance(party, GameEngine):
+            party = GameEngine.from_snapshot(party)
+        self.party = party
+        self.size = size
+        self.sim_mode = sim_mode
+        self.rng = random.Random(seed)
+        self.day = party.bank.day_counter if party is not None else 1
+
+        rng = self.rng
+        weights = [t.get("weight", 1) for t in templates]
+        picks = rng.choices(range(len(templates)), weights, k=size)
+        counts = {}
+
+        # Colonne: una lista per campo, indice = gilda
+        self.names = []
+        self.template = picks
+        self.focus = []
+        self.resources = {r: [] for r in RESOURCE_CYCLE}
+        self.unit_bonus = {r: [] for r in RESOURCE_CYCLE}
+        self.effect_bonus = [0] * size
+        # Effetti temporanei attivi solo per le gilde che ne hanno: i -> [[giorni, bonus, id]]
+        self.effects = {}
+        self._effect_ids = count()
+        self.event_chance = [20] * size
+        self.control_lost = [False] * size
+        self.rival = [None] * size
+        self.party_rival = None
+        # Probabilità di successo delle prove, per gilda
+        self.p_brawl = []
+        self.p_duel = []
+        self.p_schism = []
+        self.p_mutiny = []
+        self.p_mutiny_inf = []
+        self.p_regain = []
+
+        for t_index in picks:
+            t = templates[t_index]
+            counts[t_index] = counts.get(t_index, 0) + 1
+            self.names.append(f"{t['name']} {counts[t_index]}")
+            self.focus.append(t.get("focus"))
+
+            bonuses = _template_bonuses(t, lambda: rng.randint(0, 1))
+            start = t.get("resources", {})
+            for r in RESOURCE_CYCLE:
+                self.unit_bonus[r].append(bonuses[r])
+                default = 0.0 if r == "MO" else 0
+                self.resources[r].append(start.get(r, default))
+
+            stats = dict(BASE_STATS)
+            stats.update(t.get("stats", {}))
+            for k in stats:
+                stats[k] = max(0, stats[k] + rng.randint(-2, 2))
+            self.p_brawl.append(
+                skill_check_probability(stats, ["Intimidire", "Professione (soldato)"], 20)
+            )
+            self.p_duel.append(
+                skill_check_probability(stats, "Professione (soldato)", 25)
+            )
+            self.p_schism.append(
+                skill_check_probability(
+                    stats, ["Diplomazia", "Intimidire", "Professione (soldato)"], 20
+                )
+            )
+            mutiny_skills = ["Combattimento", "Intimidire", "Professione (soldato)"]
+            self.p_mutiny.append(skill_check_probability(stats, mutiny_skills, 25))
+            self.p_mutiny_inf.append(
+                skill_check_probability(stats, mutiny_skills, 25, extra_bonus=5)
+            )
+            # Capo presente: CD 0
+            self.p_regain.append(regain_probability(stats["Autorità"], 0))
+
+        self.event_counts = {}
+        self.influence_moved = 0
+        # Scheduler che guida la città al posto di step(), e i suoi CityPlots
+        # (con rendite ancora da pagare, vedi settle())
+        self.clock = None
+        self.plots = None
+
+    def __len__(self):
+        return self.size
+
+    # ------------------------------------------
+    # RIVALITÀ
+    # ------------------------------------------
+
+    def _pick_rival(self, i):
+        n = self.size + (1 if self.party is not None else 0)
+        if n < 2:
+            return None
+        j = int(self.rng.random() * (n - 1))
+        if j >= i:
+            j += 1
+        return PARTY if j == self.size else j
+
+    def _rival_of(self, i):
+        """Rivale della gilda i (i = PARTY per la gilda del gruppo)."""
+        if i == PARTY:
+            if self.size == 0:
+                return None
+            rival = self.party_rival
+            if rival is None:
+                rival = self.party_rival = int(self.rng.random() * self.size)
+                if self.rival[rival] is None:
+                    self.rival[rival] = PARTY
+            return rival
+        rival = self.rival[i]
+        if rival is None:
+            rival = self._pick_rival(i)
+            self.rival[i] = rival
+            if rival is not None and rival != PARTY and self.rival[rival] is None:
+                self.rival[rival] = i
+        return rival
+
+    def _transfer_influence(self, source, amount, event):
+        """L'Influenza persa da `source` in una Rivalità/Scandalo va alla rivale."""
+        if amount <= 0:
+            return
+        rival = self._rival_of(source)
+        if rival is None:
+            return
+        self.influence_moved += amount
+        if rival == PARTY:
+            bank = self.party.bank
+            bank.resources["Influenza"] += amount
+            bank.add_log(f"CITTÀ: +{amount} Inf da {self.names[source]} ({event})")
+        else:
+            if self.plots is not None:
+                # Prima le rendite della rivale maturate fino a ieri
+                self.plots.settle_guild(rival, self.day - 1)
+            self.resources["Influenza"][rival] += amount
+            if source == PARTY:
+                self.party.bank.add_log(
+                    f"CITTÀ: {amount} Inf passano a {self.names[rival]} ({event})"
+                )
+
+    # ------------------------------------------
+    # GIORNATA
+    # ------------------------------------------
+
+    def _add_effect(self, i, bonus, days):
+        self.effects.setdefault(i, []).append([days, bonus, next(self._effect_ids)])
+        self.effect_bonus[i] += bonus
+
+    def _npc_event(self, i):
+        """Tabella eventi mercenari (handle_mercenary_event) per la gilda PNG i."""
+        rand = self.rng.random
+        res = self.resources
+        inf = res["Influenza"]
+        man = res["Manodopera"]
+
+        def die(sides):
+            return int(rand() * sides) + 1
+
+        d100 = die(100)
+        if d100 <= 15:
+            name = "Risultati Impressionanti"
+            inf[i] += die(4)
+            man[i] += die(2)
+            self._add_effect(i, 10, die(6))
+        elif d100 <= 25:
+            name = "Guadagno Inaspettato"
+            res["MO"][i] += die(10) * 10
+            res["Magia"][i] += 1
+            res["Merci"][i] += die(6)
+        elif d100 <= 50:
+            name = "Rissa"
+            if rand() >= self.p_brawl[i]:
+                inf[i] = max(0, inf[i] - die(4))
+                man[i] = max(0, man[i] - die(2))
+        elif d100 <= 70:
+            name = "Rivalità"
+            self._add_effect(i, -5, die(10))
+            if die(100) > 50:
+                loss = min(inf[i], die(4))
+                inf[i] -= loss
+                self._transfer_influence(i, loss, name)
+        elif d100 <= 80:
+            name = "Scandalo"
+            self._add_effect(i, -5, die(4) + die(4))
+            loss = min(inf[i], die(2))
+            inf[i] -= loss
+            self._transfer_influence(i, loss, name)
+        elif d100 <= 85:
+            name = "Duello"
+            if rand() < self.p_duel[i]:
+                self._add_effect(i, 2, 7)
+            else:
+                man[i] = max(0, man[i] - die(2))
+        elif d100 <= 95:
+            name = "Scisma"
+            if rand() < self.p_schism[i]:
+                man[i] = max(0, man[i] - 1)
+            else:
+                man[i] = max(0, man[i] - die(2))
+                inf[i] = max(0, inf[i] - die(2))
+        else:
+            name = "Ammutinamento"
+            p = self.p_mutiny[i]
+            if inf[i] >= 5:
+                inf[i] -= 5
+                p = self.p_mutiny_inf[i]
+            if rand() < p:
+                man[i] = max(0, man[i] - 1)
+            else:
+                self.control_lost[i] = True
+        self.event_counts[name] = self.event_counts.get(name, 0) + 1
+
+    def _party_day(self, strategy, target_res, is_leaving):
+        engine = self.party
+        bank = engine.bank
+        if bank.guild_control_lost:
+            engine._simulate_locked_span(1, is_leaving)
+            return
+        before = bank.resources["Influenza"]
+        record = engine._simulate_day(strategy, target_res, self.sim_mode, is_leaving)
+        if record["event"] in ("Rivalità", "Scandalo"):
+            # Influenza dopo l'evento, prima della rendita del giorno
+            after = bank.resources["Influenza"]
+            if record["resource"] == "Influenza":
+                after -= record["earned"]
+            self._transfer_influence(PARTY, before - after, record["event"])
+
+    def step(self, strategy="u", target_res=None, is_leaving=False):
+        """
+        Un giorno per tutta la città. strategy/target_res/is_leaving valgono per la
+        gilda del gruppo, come in GameEngine.simulate(); le PNG seguono il loro focus.
+        """
+        if self.clock is not None:
+            raise ValueError(
+                "La città è guidata da uno Scheduler (CityPlots): "
+                "si avanza con scheduler.advance(), non con step()"
+            )
+        if self.party is not None:
+            self._party_day(strategy, target_res, is_leaving)
+
+        rand = self.rng.random
+        earn = self._earn
+        cycle_res = RESOURCE_CYCLE[self.day % 5]
+        chance = self.event_chance
+        lost = self.control_lost
+        effects = self.effects
+        effect_bonus = self.effect_bonus
+        focus = self.focus
+
+        for i in range(self.size):
+            if lost[i]:
+                if rand() < self.p_regain[i]:
+                    lost[i] = False
+                    chance[i] = 20
+                continue
+
+            if rand() * 100 < chance[i]:
+                chance[i] = 20
+                self._npc_event(i)
+                if lost[i]:
+                    continue
+            elif chance[i] < 95:
+                chance[i] += 5
+
+            active = effects.get(i)
+            if active:
+                kept = []
+                for eff in active:
+                    eff[0] -= 1
+                    if eff[0] > 0:
+                        kept.append(eff)
+                    else:
+                        effect_bonus[i] -= eff[1]
+                if kept:
+                    effects[i] = kept
+                else:
+                    del effects[i]
+
+            earn(i, focus[i] or cycle_res, rand)
+
+        self.day += 1
+
+    def _earn(self, i, daily_res, rand):
+        """Rendita del giorno della gilda PNG i, come in _simulate_day."""
+        bonus = self.unit_bonus[daily_res][i] + self.effect_bonus[i]
+        roll = int(rand() * 20) + 1 if self.sim_mode == "2" and bonus != 0 else 10
+        self._earn_total(i, daily_res, roll + bonus)
+
+    def _earn_total(self, i, daily_res, total):
+        """Rendita della gilda PNG i per un giorno con prova `total` (tiro + bonus)."""
+        mo = self.resources["MO"]
+        if daily_res == "MO":
+            mo[i] = round(max(0.0, mo[i] + total / 10), 2)
+            return
+        earned = total // 10
+        if earned > 0:
+            unit_cost = EARN_COSTS[daily_res]
+            if mo[i] < earned * unit_cost:
+                earned = int(mo[i] // unit_cost)
+            mo[i] = round(mo[i] - earned * unit_cost, 2)
+        column = self.resources[daily_res]
+        column[i] = max(0, column[i] + earned)
+
+    def _earn_days(self, i, start, end, rand=None):
+        """
+        Rendite della gilda PNG i per i giorni da `start` a `end` - 1, uno alla
+        volta nell'ordine della rotazione, come _earn (d20 se c'è `rand`).
+        """
+        res = self.resources
+        mo = res["MO"]
+        unit_bonus = self.unit_bonus
+        effect = self.effect_bonus[i]
+        for day in range(start, end):
+            daily_res = RESOURCE_CYCLE[day % 5]
+            total = unit_bonus[daily_res][i] + effect
+            total += int(rand() * 20) + 1 if rand is not None and total != 0 else 10
+            if daily_res == "MO":
+                mo[i] = round(max(0.0, mo[i] + total / 10), 2)
+                continue
+            earned = total // 10
+            if earned > 0:
+                unit_cost = EARN_COSTS[daily_res]
+                if mo[i] < earned * unit_cost:
+                    earned = int(mo[i] // unit_cost)
+                mo[i] = round(mo[i] - earned * unit_cost, 2)
+            column = res[daily_res]
+            column[i] = max(0, column[i] + earned)
+
+    def _earn_rolls(self, i, daily_res, days, rand):
+        """
+        `days` rendite con il d20 della risorsa daily_res: i tiri sono estratti
+        in blocco, e sommati se nessun giorno tocca lo zero o il limite dell'MO.
+        """
+        res = self.resources
+        mo = res["MO"]
+        bonus = self.unit_bonus[daily_res][i] + self.effect_bonus[i]
+        if daily_res != "MO" and mo[i] < EARN_COSTS[daily_res] and bonus >= -1:
+            # Niente da comprare e nessuna prova negativa: i tiri non contano
+            return
+        totals = [int(rand() * 20) + 1 + bonus for _ in range(days)]
+        if bonus >= -1:
+            if daily_res == "MO":
+                mo[i] = round(mo[i] + sum(totals) / 10, 2)
+                return
+            unit_cost = EARN_COSTS[daily_res]
+            earned = sum(total // 10 for total in totals)
+            if mo[i] >= earned * unit_cost:
+                mo[i] = round(mo[i] - earned * unit_cost, 2)
+                res[daily_res][i] += earned
+                return
+        for total in totals:
+            self._earn_total(i, daily_res, total)
+
+    def _earn_fixed(self, i, daily_res, days, total):
+        """`days` rendite della risorsa daily_res con la stessa prova `total`, in forma chiusa."""
+        res = self.resources
+        mo = res["MO"]
+        if daily_res == "MO":
+            # Sempre nella stessa direzione: lo zero si tocca al massimo alla fine
+            mo[i] = round(max(0.0, mo[i] + days * total / 10), 2)
+            return
+        column = res[daily_res]
+        earned = total // 10
+        if earned <= 0:
+            column[i] = max(0, column[i] + days * earned)
+            return
+        # Giorni pagati per intero finché l'MO basta, poi un acquisto parziale
+        unit_cost = EARN_COSTS[daily_res]
+        money = mo[i]
+        full = min(days, int(money // (earned * unit_cost)))
+        got = full * earned
+        money -= got * unit_cost
+        if full < days:
+            part = int(money // unit_cost)
+            got += part
+            money -= part * unit_cost
+        mo[i] = round(money, 2)
+        column[i] += got
+
+    def run(self, days, strategy="u", target_res=None, is_leaving=False):
+        """Simula `days` giorni e restituisce un riepilogo della città."""
+        for _ in range(days):
+            self.step(strategy, target_res, is_leaving)
+        return {
+            "days": days,
+            "guilds": self.size,
+            # Eventi delle sole gilde PNG
+            "events": dict(self.event_counts),
+            "influence_moved": self.influence_moved,
+            "control_lost": sum(self.control_lost),
+        }
+
+    # ------------------------------------------
+    # RESOCONTI
+    # ------------------------------------------
+
+    def settle(self):
+        """
+        Con la città guidata da CityPlots, paga le rendite maturate fino al
+        giorno corrente: da chiamare prima di leggere le colonne delle risorse.
+        """
+        if self.plots is not None:
+            self.plots.settle()
+
+    def standings(self, resource="Influenza", top=10):
+        """Classifica per risorsa, gilda del gruppo compresa: [(nome, valore)]."""
+        self.settle()
+        column = self.resources[resource]
+        rows = list(zip(self.names, column))
+        if self.party is not None:
+            rows.append((self.party.guild.name, self.party.bank.resources[resource]))
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows[:top]
+
+    def party_rank(self, resource="Influenza"):
+        """Posizione (da 1) della gilda del gruppo nella classifica della risorsa."""
+        if self.party is None:
+            return None
+        self.settle()
+        value = self.party.bank.resources[resource]
+        return 1 + sum(1 for v in self.resources[resource] if v > value)
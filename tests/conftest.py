@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# I test girano sul codice di src/ senza installare il pacchetto
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
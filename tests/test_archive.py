@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from guild_downtime.archive import HistoryArchive, InMemoryHistory
+
+
+def _lines(rng, n):
+    """(giorno, testo) con eventi completi e giorni che a volte tornano indietro."""
+    out = []
+    day = 1
+    while len(out) < n:
+        roll = rng.random()
+        if roll < 0.1:
+            day = max(1, day - rng.randint(1, 5))  # annullamento: nuovo segmento
+        if roll < 0.4:
+            event = rng.choice(["Rissa", "Scandalo", "Ammutinamento"])
+            out += [
+                (day, f"EVENTO (50 -> {event})"),
+                (day, "CHECK: d20[12]+5 vs CD 15"),
+                (day, "RISULTATO: ok"),
+            ]
+        else:
+            out.append((day, f"ATTIVITÀ: giorno {day}"))
+        day += 1
+    return out
+
+
+def _files(directory):
+    """Contenuto dei file dell'archivio; un file vuoto vale come assente."""
+    return {
+        p.name: p.read_bytes()
+        for p in sorted(directory.iterdir())
+        if p.stat().st_size
+    }
+
+
+def _build(directory, lines):
+    archive = HistoryArchive(directory)
+    for day, text in lines:
+        archive.append(day, text)
+    archive.flush()
+    return archive
+
+
+def _reference(lines):
+    return InMemoryHistory([f"Giorno {d}: {t}" for d, t in lines])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_truncate_then_append_matches_fresh_archive(tmp_path, seed):
+    rng = random.Random(seed)
+    lines = _lines(rng, 120)
+    more = _lines(rng, 30)
+    for keep in sorted({0, len(lines), *rng.sample(range(len(lines) + 1), 6)}):
+        truncated = _build(tmp_path / f"t{keep}", lines)
+        truncated.truncate(keep)
+        assert len(truncated) == keep
+        for day, text in more:
+            truncated.append(day, text)
+        truncated.close()
+
+        fresh = _build(tmp_path / f"f{keep}", lines[:keep] + more)
+        fresh.close()
+        # Voci, indice, segmenti e liste per evento identici a un archivio scritto da zero
+        assert _files(truncated.directory) == _files(fresh.directory)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_queries_after_truncate(tmp_path, seed):
+    rng = random.Random(100 + seed)
+    lines = _lines(rng, 200)
+    keep = rng.randrange(1, len(lines))
+    archive = _build(tmp_path / "h", lines)
+    archive.truncate(keep)
+
+    reference = _reference(lines[:keep])
+    assert [e["text"] for e in archive.tail(10)] == [t for _, t in lines[:keep][-10:]]
+    for filters in (
+        {},
+        {"day_from": 10, "day_to": 40},
+        {"kind": "EVENTO"},
+        {"event": "Rissa"},
+        {"event": "Ammutinamento", "day_to": 60},
+        {"text": "giorno 1"},
+    ):
+        assert list(archive.match(**filters)) == reference.match(**filters), filters
+
+
+def test_truncate_beyond_length_is_a_no_op(tmp_path):
+    lines = _lines(random.Random(1), 20)
+    archive = _build(tmp_path / "h", lines)
+    archive.close()
+    before = _files(archive.directory)
+    archive.truncate(len(lines))
+    archive.truncate(len(lines) + 10)
+    assert _files(archive.directory) == before
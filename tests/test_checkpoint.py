@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from guild_downtime import dice
+from guild_downtime.checkpoint import SimulationCheckpoint
+from guild_downtime.game_engine import GameEngine
+
+DAYS = 400
+SEED = 11
+
+
+class _Collect:
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(dict(record))
+
+
+def _engine(directory):
+    return GameEngine(save_file=directory / "gilda.json", guild_name="Prova")
+
+
+def _state(engine):
+    state = engine.snapshot().to_dict()
+    state.pop("label")
+    return state
+
+
+def _archive_texts(engine):
+    archive = engine.bank.archive
+    return [e["text"] for e in archive.read(range(len(archive)))]
+
+
+@pytest.mark.parametrize(
+    "strategy, target_res, sim_mode, is_leaving",
+    [
+        ("u", None, "2", False),
+        ("f", "Influenza", "1", True),  # assenza che cresce: controllo perso più spesso
+    ],
+)
+def test_resume_matches_uninterrupted_run(tmp_path, strategy, target_res, sim_mode, is_leaving):
+    args = (DAYS, strategy, target_res, sim_mode, is_leaving)
+
+    dice.seed(SEED)
+    straight = _engine(tmp_path / "a")
+    collect = _Collect()
+    expected = straight.simulate(*args, writers=[collect])
+
+    # Corsa interrotta a metà, dopo qualche checkpoint
+    dice.seed(SEED)
+    checkpoint = SimulationCheckpoint(tmp_path / "sim.ckpt", every_days=37, every_seconds=None)
+    records = _engine(tmp_path / "b").iter_simulation(*args, checkpoint=checkpoint)
+    done = 0
+    for record in records:
+        done += record["span"]
+        if done >= DAYS * 2 // 3:
+            break
+    records.close()
+    assert checkpoint.exists()
+    saved_done = checkpoint.load()["progress"]["done"]
+    assert 0 < saved_done < DAYS
+
+    # Un altro processo: stato casuale diverso, motore nuovo sullo stesso salvataggio
+    random.seed(12345)
+    dice.seed(12345)
+    resumed = _engine(tmp_path / "b")
+    tail = _Collect()
+    summary = resumed.resume_simulation(checkpoint, writers=[tail])
+
+    assert summary == expected
+    assert _state(resumed) == _state(straight)
+    assert _archive_texts(resumed) == _archive_texts(straight)
+    # I record dopo il checkpoint sono quelli della corsa intera
+    done, head = 0, 0
+    while done < saved_done:
+        done += collect.records[head]["span"]
+        head += 1
+    assert tail.records == collect.records[head:]
+    assert not checkpoint.exists()
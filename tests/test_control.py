@@ -0,0 +1,45 @@
+import math
+import random
+
+import pytest
+
+from guild_downtime.control import attempt_dc, recovery_distribution
+
+
+def _simulate(bonus, days_absent, growing, max_days, trials, rng):
+    """Frequenze del tentativo di ripresa tirando d20 giorno per giorno, come il motore."""
+    counts = [0] * max_days
+    never = 0
+    for _ in range(trials):
+        for attempt in range(1, max_days + 1):
+            dc = attempt_dc(days_absent, growing, attempt)
+            if rng.randint(1, 20) + bonus >= dc:
+                counts[attempt - 1] += 1
+                break
+        else:
+            never += 1
+    return [c / trials for c in counts], never / trials
+
+
+@pytest.mark.parametrize(
+    "bonus, days_absent, growing, max_days",
+    [
+        (3, 20, False, 30),  # CD costante: coda geometrica in forma chiusa
+        (5, 18, True, 25),  # CD che cresce fino a rendere la ripresa impossibile
+        (0, 25, True, 40),
+        (12, 15, False, 10),  # ripresa certa al primo tentativo
+    ],
+)
+def test_recovery_distribution_matches_brute_force(bonus, days_absent, growing, max_days):
+    trials = 20_000
+    pmf, p_never = recovery_distribution(bonus, days_absent, growing, max_days)
+    freq, never = _simulate(bonus, days_absent, growing, max_days, trials, random.Random(7))
+
+    assert len(pmf) <= max_days
+    assert sum(pmf) + p_never == pytest.approx(1.0)
+    pmf = pmf + [0.0] * (max_days - len(pmf))
+    for k, (p, f) in enumerate(zip(pmf, freq)):
+        # 5 deviazioni standard della frequenza empirica
+        tol = 5 * math.sqrt(p * (1 - p) / trials) + 1e-3
+        assert f == pytest.approx(p, abs=tol), f"tentativo {k + 1}"
+    assert never == pytest.approx(p_never, abs=5 * math.sqrt(p_never * (1 - p_never) / trials) + 1e-3)
@@ -0,0 +1,119 @@
+import copy
+import json
+
+from guild_downtime.archive import HistoryArchive
+from guild_downtime.game_engine import SCHEMA_VERSION
+from guild_downtime.migrate import _v1_to_v2, migrate_file, upgrade
+
+
+def _unit(name, bonuses, qty=1, unit_type="Squadra"):
+    return {"name": name, "type": unit_type, "bonuses": bonuses, "qty": qty}
+
+
+def baseline_save():
+    """Salvataggio come lo scriveva save_state prima delle versioni dello schema."""
+    return {
+        "resources": {"MO": 125.5, "Merci": 3, "Influenza": 12, "Magia": 1, "Manodopera": 7},
+        "character_stats": {
+            "Diplomazia": 8,
+            "Raggirare": 4,
+            "Professione (soldato)": 2,
+            "Intimidire": 1,
+            "Combattimento": 3,
+            "Autorità": 5,
+        },
+        "day_counter": 42,
+        "event_chance": 25,
+        "history": ["Giorno 40: ATTIVITÀ: MO +5", "Giorno 41: EVENTO (12 -> Rissa)"],
+        "guild_control_lost": False,
+        "guild_name": "Cacciatori di Taglie",
+        "guild_units": [
+            _unit("Arcieri Scelti", {"MO": 7, "Influenza": 7, "Manodopera": 7}),
+            _unit("Sacerdote", {"MO": 7, "Magia": 7, "Influenza": 7}, qty=2),
+            _unit("Armeria", {"Manodopera": 2}, unit_type="Stanza"),
+        ],
+        "active_effects": [{"name": "Risultati Impressionanti", "bonus": 2, "days_left": 3}],
+    }
+
+
+def test_baseline_save_gets_only_the_missing_keys():
+    data = baseline_save()
+    original = copy.deepcopy(data)
+    changes = []
+    _v1_to_v2(data, changes)
+
+    assert changes == ["aggiunto event_table"]
+    assert data["event_table"] == "mercenari"
+    for key, value in original.items():
+        assert data[key] == value, key
+
+
+def test_duplicate_units_are_merged_like_add_unit():
+    data = baseline_save()
+    units = data["guild_units"]
+    # Salvataggi scritti prima che add_unit accorpasse i duplicati, e senza qty
+    units.append(_unit("Sacerdote", {"MO": 7, "Magia": 7, "Influenza": 7}, qty=5))
+    units.append(_unit("Arcieri Scelti", {"MO": 7, "Influenza": 7, "Manodopera": 7}))
+    units.append(_unit("Arcieri Scelti", {"MO": 7, "Influenza": 7, "Manodopera": 7}))
+    del units[2]["qty"]
+    changes = []
+    _v1_to_v2(data, changes)
+
+    # Ordine della prima apparizione; ogni duplicato vale +1, come Guild.add_unit
+    assert [(u["name"], u["qty"]) for u in data["guild_units"]] == [
+        ("Arcieri Scelti", 3),
+        ("Sacerdote", 3),
+        ("Armeria", 1),
+    ]
+    assert changes.count("unità duplicata Arcieri Scelti accorpata") == 2
+    assert "unità duplicata Sacerdote accorpata" in changes
+    assert "quantità di Armeria impostata a 1" in changes
+
+
+def test_missing_keys_resources_and_stats_get_defaults():
+    data = {
+        "resources": {"MO": 10.0, "Influenza": 2},
+        "character_stats": {"Diplomazia": 9},
+        "day_counter": 3,
+        "event_chance": 20,
+        "guild_units": [],
+    }
+    changes = []
+    _v1_to_v2(data, changes)
+
+    assert data["guild_control_lost"] is False
+    assert data["active_effects"] == []
+    assert data["resources"] == {
+        "MO": 10.0,
+        "Influenza": 2,
+        "Merci": 0,
+        "Magia": 0,
+        "Manodopera": 0,
+    }
+    assert data["character_stats"]["Diplomazia"] == 9
+    assert data["character_stats"]["Autorità"] == 4
+    assert "aggiunto guild_name" in changes
+    assert "aggiunta risorsa Merci" in changes
+
+
+def test_upgrade_reaches_current_schema_with_save_key_order():
+    data, changes = upgrade(baseline_save())
+    assert data["schema_version"] == SCHEMA_VERSION
+    assert list(data)[:2] == ["schema_version", "guild_name"]
+    assert changes[-1] == f"schema {SCHEMA_VERSION}"
+
+
+def test_migrate_file_moves_history_to_archive(tmp_path):
+    path = tmp_path / "cacciatori.json"
+    path.write_text(json.dumps(baseline_save()), encoding="utf-8")
+
+    report = migrate_file(path)
+    assert report["status"] == "aggiornato"
+    assert (report["from"], report["to"]) == (1, SCHEMA_VERSION)
+    saved = json.loads(path.read_text(encoding="utf-8"))
+    assert "history" not in saved
+    archive = HistoryArchive.for_save(path)
+    assert [e["text"] for e in archive.tail(10)] == ["ATTIVITÀ: MO +5", "EVENTO (12 -> Rissa)"]
+
+    # Una seconda passata non ha niente da fare
+    assert migrate_file(path)["status"] == "attuale"
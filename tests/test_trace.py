@@ -0,0 +1,70 @@
+import pytest
+
+from guild_downtime import dice
+from guild_downtime.game_engine import GameEngine
+from guild_downtime.trace import (
+    PURPOSES,
+    STATE_BLOCK,
+    Replay,
+    record_simulation,
+    trace_state,
+    verify,
+)
+
+DAYS = 3 * STATE_BLOCK + 17
+
+
+@pytest.fixture(params=[("u", None, "2", False), ("f", "Magia", "1", True)])
+def recorded(request, tmp_path):
+    """(percorso della traccia, riepilogo, stato finale) di una corsa registrata."""
+    strategy, target_res, sim_mode, is_leaving = request.param
+    dice.seed(5)
+    engine = GameEngine(save_file=tmp_path / "gilda.json", guild_name="Prova")
+    path = tmp_path / "gilda.trace"
+    summary = record_simulation(engine, path, DAYS, strategy, target_res, sim_mode, is_leaving)
+    return path, summary, trace_state(engine)
+
+
+def test_replay_reproduces_the_recorded_run(recorded):
+    path, summary, final = recorded
+    dice.seed(999)  # il replay non usa il generatore
+    engine, replayed = Replay(path).run()
+    assert replayed == summary
+    assert trace_state(engine) == final
+
+
+def test_verify_reports_identical(recorded):
+    path, _, _ = recorded
+    report = verify(path)
+    assert report["status"] == "identico", report
+    assert report["days"] == DAYS
+
+
+def test_state_at_matches_the_replayed_days(recorded):
+    path, _, final = recorded
+    replay = Replay(path)
+    start = replay.header["state"]
+    assert trace_state(replay.state_at(start["day_counter"])) == trace_state(replay.new_engine())
+
+    engine = replay.new_engine()
+    for _ in replay.iter_days(engine):
+        state = trace_state(engine)
+        # Stato all'inizio del giorno raggiunto = stato dopo il giorno appena simulato
+        assert trace_state(replay.state_at(state["day_counter"])) == state
+    assert trace_state(replay.state_at(10**6)) == final
+
+
+def test_tampered_trace_is_reported(recorded):
+    path, _, _ = recorded
+    data = bytearray(path.read_bytes())
+    header_end = data.index(b"\n") + 1
+    # Primo dado con un altro scopo: il replay chiede un tiro diverso
+    assert data[header_end]
+    data[header_end + 2] = (data[header_end + 2] + 1) % len(PURPOSES)
+    path.write_bytes(bytes(data))
+    report = verify(path)
+    assert report["status"] == "diverso"
+    assert report["day"] is not None
+
+    path.write_bytes(bytes(data[:-10]))
+    assert verify(path)["status"] == "errore"